@@ -0,0 +1,256 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+import numpy as np
+from telemetry import METRICS
+from logs import get_logger
+
+log = get_logger("alarms")
+
+# --- CLINICAL ALARM ENGINE ---
+# Ingest only appends each sample to a pending list (one tuple, no NumPy
+# call). A tick task folds everything pending into a (machines x metrics)
+# matrix - latest value plus the min/max since the last tick, so a one-sample
+# spike is not lost between ticks - and evaluates every rule for every
+# machine at once as (machines x rules) boolean arrays.
+#
+# Rule kinds:
+#   threshold - value outside [min, max]
+#   rate      - change per second above max_rate (direction: rise|fall|both)
+# Any rule can be made sustained with for_seconds (condition must hold that
+# long before raising) and is debounced with clear_seconds (must stay clear
+# that long before clearing).
+
+DEFAULT_RULES = [
+    {"name": "temperature_range", "metric": "temperature", "kind": "threshold",
+     "min": 35.0, "max": 38.0, "for_seconds": 5, "severity": "warning"},
+    {"name": "ph_range", "metric": "ph", "kind": "threshold",
+     "min": 6.7, "max": 7.6, "for_seconds": 5, "severity": "warning"},
+    {"name": "pressure_range", "metric": "pressure_Pa", "kind": "threshold",
+     "min": 800, "max": 1150, "for_seconds": 3, "severity": "critical"},
+    {"name": "pressure_rising", "metric": "pressure_Pa", "kind": "rate",
+     "max_rate": 50, "direction": "rise", "for_seconds": 10, "severity": "warning"},
+    {"name": "flow_range", "metric": "flow_rate", "kind": "threshold",
+     "min": 300, "max": 600, "for_seconds": 5, "severity": "critical"},
+    {"name": "blood_leak", "metric": "turbidity", "kind": "threshold",
+     "max": 30, "for_seconds": 3, "severity": "critical"},
+    {"name": "pump_overcurrent", "metric": "current_mA", "kind": "threshold",
+     "max": 400, "for_seconds": 2, "severity": "critical"},
+]
+
+
+class AlarmEngine:
+    def __init__(self, rules=None, tick=0.5, clear_seconds=3.0, stale_seconds=10.0):
+        self.rules = [dict(r) for r in (rules or DEFAULT_RULES)]
+        self.tick = tick
+        self.stale_seconds = stale_seconds
+        self._compile(clear_seconds)
+
+        self.index = {}                 # machine_id -> row
+        self.machine_ids = []
+        cap = 64
+        self.values = np.full((cap, len(METRICS)), np.nan)
+        self.ts = np.zeros(cap)
+        R = len(self.rules)
+        self.prev_values = np.full((cap, len(METRICS)), np.nan)
+        self.prev_ts = np.zeros(cap)
+        self.rates = np.full((cap, len(METRICS)), np.nan)
+        self.cond_since = np.full((cap, R), np.nan)    # Condition continuously true since
+        self.clear_since = np.full((cap, R), np.nan)   # Condition continuously false since
+        self.active = np.zeros((cap, R), dtype=bool)
+
+        self.active_alarms = {}         # (machine_id, rule name) -> event
+        self.recent = deque(maxlen=1000)
+        self.listeners = []             # fn(event), e.g. session summaries
+        self._queues = set()            # SSE subscribers
+        self._task = None
+        self._pending = []              # (row, ts, *values) since the last tick
+        self.last_tick_ms = 0.0
+
+    @classmethod
+    def from_env(cls):
+        """ALARM_RULES is inline JSON or a path to a JSON list of rules."""
+        raw = os.getenv("ALARM_RULES", "")
+        tick = float(os.getenv("ALARM_TICK", 0.5))
+        if not raw:
+            return cls(tick=tick)
+        if os.path.exists(raw):
+            with open(raw) as f:
+                return cls(json.load(f), tick=tick)
+        return cls(json.loads(raw), tick=tick)
+
+    def _compile(self, clear_seconds):
+        """Rules -> parallel arrays, one column per rule."""
+        for r in self.rules:
+            if r.get("metric") not in METRICS:
+                raise ValueError(f"Alarm rule {r.get('name')}: unknown metric {r.get('metric')}")
+            if r.get("kind", "threshold") not in ("threshold", "rate"):
+                raise ValueError(f"Alarm rule {r.get('name')}: unknown kind {r.get('kind')}")
+        self.rule_metric = np.array([METRICS.index(r["metric"]) for r in self.rules], dtype=int)
+        self.rule_is_rate = np.array([r.get("kind", "threshold") == "rate" for r in self.rules])
+        self.rule_min = np.array([r.get("min", -np.inf) for r in self.rules], dtype=float)
+        self.rule_max = np.array([r.get("max", np.inf) for r in self.rules], dtype=float)
+        self.rule_rate = np.array([r.get("max_rate", np.inf) for r in self.rules], dtype=float)
+        self.rule_dir = np.array([{"rise": 1, "fall": -1}.get(r.get("direction"), 0)
+                                  for r in self.rules])
+        self.rule_for = np.array([r.get("for_seconds", 0) for r in self.rules], dtype=float)
+        self.rule_clear = np.array([r.get("clear_seconds", clear_seconds) for r in self.rules],
+                                   dtype=float)
+
+    # --- INGEST SIDE (per sample, O(metrics)) ---
+    def update(self, machine_id, ts, data):
+        row = self.index.get(machine_id)
+        if row is None:
+            row = self._add_machine(machine_id)
+        try:
+            self._pending.append((row, ts, *[float(data.get(m, np.nan)) for m in METRICS]))
+        except (TypeError, ValueError):
+            pass  # Non-numeric sample: nothing to check
+
+    def _add_machine(self, machine_id):
+        row = len(self.machine_ids)
+        if row == len(self.ts):
+            self._grow()
+        self.index[machine_id] = row
+        self.machine_ids.append(machine_id)
+        return row
+
+    def _grow(self):
+        def grow(a, fill):
+            extra = np.full((a.shape[0],) + a.shape[1:], fill, dtype=a.dtype)
+            return np.concatenate([a, extra])
+        self.values, self.prev_values, self.rates = (grow(a, np.nan) for a in
+                                                     (self.values, self.prev_values, self.rates))
+        self.ts, self.prev_ts = grow(self.ts, 0), grow(self.prev_ts, 0)
+        self.cond_since, self.clear_since = grow(self.cond_since, np.nan), grow(self.clear_since, np.nan)
+        self.active = grow(self.active, False)
+
+    # --- TICK (all machines x all rules) ---
+    def evaluate(self, now=None):
+        now = time.time() if now is None else now
+        n = len(self.machine_ids)
+        if not n:
+            return []
+        start = time.perf_counter()
+        lo, hi = self._fold_pending(n)
+        values, ts = self.values[:n], self.ts[:n]
+
+        # Rates from the previous tick's snapshot, held when no new sample arrived
+        fresh = ts > self.prev_ts[:n]
+        dt = np.where(fresh, ts - self.prev_ts[:n], np.nan)[:, None]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            new_rates = (values - self.prev_values[:n]) / dt
+        self.rates[:n] = np.where(fresh[:, None] & (self.prev_ts[:n] > 0)[:, None],
+                                  new_rates, self.rates[:n])
+        self.prev_values[:n] = values
+        self.prev_ts[:n] = np.where(fresh, ts, self.prev_ts[:n])
+
+        # Extremes since the last tick (latest value when nothing new arrived)
+        lo = np.where(np.isnan(lo), values, lo)[:, self.rule_metric]
+        hi = np.where(np.isnan(hi), values, hi)[:, self.rule_metric]
+
+        rate = self.rates[:n][:, self.rule_metric] * np.where(self.rule_dir == 0, 1, self.rule_dir)
+        rate = np.where(self.rule_dir == 0, np.abs(rate), rate)
+        with np.errstate(invalid="ignore"):
+            low, high = lo < self.rule_min, hi > self.rule_max
+            cond = np.where(self.rule_is_rate, rate > self.rule_rate, low | high)
+        # Value reported with the event: the breaching extreme, or the rate
+        v = np.where(self.rule_is_rate, self.rates[:n][:, self.rule_metric],
+                     np.where(low, lo, np.where(high, hi, values[:, self.rule_metric])))
+        cond &= ~np.isnan(v)
+        cond &= (now - ts <= self.stale_seconds)[:, None]   # No data is not an alarm
+
+        cond_since, clear_since, active = self.cond_since[:n], self.clear_since[:n], self.active[:n]
+        cond_since[:] = np.where(cond, np.where(np.isnan(cond_since), now, cond_since), np.nan)
+        clear_since[:] = np.where(cond, np.nan, np.where(np.isnan(clear_since), now, clear_since))
+        raise_mask = ~active & cond & (now - cond_since >= self.rule_for)
+        clear_mask = active & ~cond & (now - clear_since >= self.rule_clear)
+        active |= raise_mask
+        active &= ~clear_mask
+
+        events = [self._event(r, c, "raised", now, v[r, c]) for r, c in zip(*np.nonzero(raise_mask))]
+        events += [self._event(r, c, "cleared", now, v[r, c]) for r, c in zip(*np.nonzero(clear_mask))]
+        for e in events:
+            self._emit(e)
+        self.last_tick_ms = (time.perf_counter() - start) * 1000
+        return events
+
+    def _fold_pending(self, n):
+        """Pending samples -> latest values/ts, plus per-machine min/max since the last tick."""
+        lo = np.full((n, len(METRICS)), np.nan)
+        hi = np.full((n, len(METRICS)), np.nan)
+        if not self._pending:
+            return lo, hi
+        batch, self._pending = np.array(self._pending), []
+        rows, ts, samples = batch[:, 0].astype(int), batch[:, 1], batch[:, 2:]
+        np.fmin.at(lo, rows, samples)
+        np.fmax.at(hi, rows, samples)
+        self.values[rows] = samples     # Repeated rows: the last (newest) sample wins
+        np.maximum.at(self.ts, rows, ts)
+        return lo, hi
+
+    def _event(self, row, col, state, now, value):
+        rule = self.rules[col]
+        return {
+            "machine_id": self.machine_ids[row],
+            "rule": rule["name"],
+            "metric": rule["metric"],
+            "severity": rule.get("severity", "warning"),
+            "state": state,
+            "value": None if np.isnan(value) else round(float(value), 3),
+            "at": now,
+        }
+
+    def _emit(self, event):
+        key = (event["machine_id"], event["rule"])
+        if event["state"] == "raised":
+            self.active_alarms[key] = event
+        else:
+            self.active_alarms.pop(key, None)
+        self.recent.append(event)
+        for fn in self.listeners:
+            fn(event)
+        for q in self._queues:
+            if q.full():
+                q.get_nowait()  # Slow viewer: lose the oldest event, not the newest
+            q.put_nowait(event)
+
+    # --- LIFECYCLE / READERS ---
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                self.evaluate()
+            except Exception as e:
+                log.exception("⚠️ Alarm tick error")
+
+    def subscribe(self, maxsize=256):
+        q = asyncio.Queue(maxsize)
+        self._queues.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        self._queues.discard(q)
+
+    def snapshot(self, machine_id=None):
+        active = [e for (m, _), e in self.active_alarms.items() if machine_id in (None, m)]
+        recent = [e for e in self.recent if machine_id in (None, e["machine_id"])]
+        return {"active": active, "recent": recent[-100:]}
+
+    def stats(self):
+        return {
+            "machines": len(self.machine_ids),
+            "rules": len(self.rules),
+            "active": len(self.active_alarms),
+            "last_tick_ms": round(self.last_tick_ms, 3),
+        }
@@ -0,0 +1,164 @@
+import asyncio
+import random
+import ssl
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+import aiomysql
+from logs import get_logger
+from metrics import REGISTRY
+
+log = get_logger("db")
+POOL_WAIT = REGISTRY.histogram("db_pool_wait_seconds", "Time spent waiting for a pooled DB connection")
+
+# --- ASYNC DB POOL ---
+# aiomysql pool for reads and batch writes, so DB work never occupies a
+# threadpool thread. Acquisition waits up to acquire_timeout and then raises
+# PoolTimeout (surfaced as 503), instead of quietly handing back None.
+# Connections idle longer than health_check_interval are pinged before use.
+# A pool that can't be created is retried with exponential backoff; until the
+# next attempt is due, callers fail fast with PoolUnavailable instead of each
+# sitting through a connect timeout.
+# config["ssl"] may be True: the TLS context (CA bundle load) is then built on
+# first open, keeping it off the import path.
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PoolUnavailable(Exception):
+    pass
+
+
+class AsyncPool:
+    def __init__(self, config, size=10, min_size=1, acquire_timeout=5.0,
+                 health_check_interval=30.0, reconnect_min=1.0, reconnect_max=60.0):
+        self.config = config
+        self.size = size
+        self.min_size = min(min_size, size)
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self.pool = None
+        self._open_lock = asyncio.Lock()
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self._last_used = {}        # id(conn) -> monotonic time returned to pool
+        self.waiting = 0
+        self.wait_ms = deque(maxlen=2048)
+        self.counters = {
+            "acquired": 0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "open_failures": 0,
+            "opens": 0,
+        }
+
+    async def open(self):
+        async with self._open_lock:
+            if self.pool is not None:
+                return
+            wait = self._retry_at - time.monotonic()
+            if wait > 0:
+                raise PoolUnavailable(f"Database unavailable, next connect attempt in {wait:.1f}s")
+            config = dict(self.config)
+            if config.get("ssl") is True:
+                config["ssl"] = self.config["ssl"] = tls_context()
+            try:
+                self.pool = await aiomysql.create_pool(
+                    minsize=self.min_size, maxsize=self.size, autocommit=False,
+                    pool_recycle=3600, **config
+                )
+                self.counters["opens"] += 1
+                self._backoff = 0.0
+                log.info("✅ Database connection pool created", extra={"size": self.size})
+            except Exception as e:
+                self.counters["open_failures"] += 1
+                self._backoff = min(max(self._backoff * 2, self.reconnect_min), self.reconnect_max)
+                self._retry_at = time.monotonic() + self._backoff * random.uniform(0.5, 1.0)
+                raise PoolUnavailable(f"Failed to create pool: {e}") from e
+
+    @property
+    def retry_in(self):
+        """Seconds until the next open attempt is allowed (0: now)"""
+        return max(0.0, self._retry_at - time.monotonic())
+
+    async def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+    @asynccontextmanager
+    async def connection(self):
+        if self.pool is None:
+            await self.open()   # Retry a pool that failed at startup
+
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            conn = await asyncio.wait_for(self.pool.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            raise PoolTimeout(f"No DB connection within {self.acquire_timeout}s "
+                              f"({self.size} in use)") from None
+        finally:
+            self.waiting -= 1
+        waited = time.perf_counter() - start
+        self.wait_ms.append(waited * 1000)
+        POOL_WAIT.observe(waited)
+        self.counters["acquired"] += 1
+
+        try:
+            idle_since = self._last_used.get(id(conn))
+            if idle_since is None or time.monotonic() - idle_since > self.health_check_interval:
+                try:
+                    await conn.ping(reconnect=True)
+                except Exception:
+                    self.counters["health_check_failures"] += 1
+                    raise
+            yield conn
+        except BaseException:
+            # Don't hand a half-finished transaction to the next borrower
+            self._last_used.pop(id(conn), None)
+            if not conn.closed:
+                try:
+                    await conn.rollback()
+                except Exception:
+                    conn.close()
+            raise
+        else:
+            # Reads never commit, and aiomysql closes a connection released
+            # mid-transaction: end the implicit one so the connection is reused
+            if not conn.closed and conn.get_transaction_status():
+                try:
+                    await conn.rollback()
+                except Exception:
+                    conn.close()
+            self._last_used[id(conn)] = time.monotonic()
+        finally:
+            self.pool.release(conn)
+
+    def stats(self):
+        waits = sorted(self.wait_ms)
+        pool = self.pool
+        return {
+            **self.counters,
+            "open": pool is not None,
+            "reconnect_backoff_s": round(self._backoff, 1),
+            "size": self.size,
+            "connections": pool.size if pool else 0,
+            "idle": pool.freesize if pool else 0,
+            "in_use": (pool.size - pool.freesize) if pool else 0,
+            "waiting": self.waiting,
+            "wait_ms_p50": round(waits[len(waits) // 2], 2) if waits else None,
+            "wait_ms_p99": round(waits[int(len(waits) * 0.99)], 2) if waits else None,
+            "wait_ms_max": round(waits[-1], 2) if waits else None,
+        }
+
+
+def tls_context(enabled=True):
+    """TiDB Cloud requires TLS; mirrors ssl_disabled=False of the old connector config."""
+    return ssl.create_default_context() if enabled else None
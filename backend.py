@@ -1,171 +1,1015 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+import time
+_import_started = time.perf_counter()  # Import cost is part of cold start (see /readyz)
+from fastapi import APIRouter, FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.concurrency import run_in_threadpool
-import mysql.connector
-from mysql.connector import pooling # <--- NEW: Pooling Library
-import json
+from contextlib import asynccontextmanager, AsyncExitStack
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Literal
 import os
-import time
 from dotenv import load_dotenv
+from write_queue import WriteBehindQueue, IngestIds
+from wal import SegmentWAL
+from downsampling import DownsamplerRegistry
+from rollups import (RollupAggregator, TIERS, TIER_SECONDS, table_name, insert_sql as rollup_insert_sql,
+                     legacy_upsert_sql as rollup_legacy_sql, select_columns as rollup_columns, pick_tier)
+from telemetry import (METRICS, DEFAULTS, BINARY_SUBPROTOCOLS, SEQ_FIELD, TS_FIELD,
+                       SensorReading, InvalidReading, decode_frame)
+from live_hub import LiveHub
+from state_store import store_from_env
+from commands import CommandChannel, CommandRouter
+from async_db import AsyncPool, PoolTimeout, PoolUnavailable
+import aiomysql
+from ring_buffer import RingBuffers
+from export import COLUMNS as EXPORT_COLUMNS, ENCODERS, FORMATS, check_format
+from alarms import AlarmEngine
+from stream_stats import StreamStats
+from sequencing import SequenceTracker, DUPLICATE, REORDERED
+from frame_queue import FrameQueue, OVERFLOW_POLICIES as FRAME_OVERFLOW_POLICIES
+from response_cache import ResponseCache
+from sessions import SessionRegistry, SessionSummary, session_report, upsert_sql as session_upsert_sql
+from serialization import FastJSONResponse, dumps, dumps_str, loads, to_columnar, dict_rows
+from logs import configure as configure_logging, get_logger
+from metrics import REGISTRY, CONTENT_TYPE
+import anyio
 
 load_dotenv()
+configure_logging()  # LOG_LEVEL / LOG_FORMAT
+log = get_logger("backend")
+
+# --- APPLICATION FACTORY ---
+# Import only builds cheap objects; disk, DB and background tasks start in
+# lifespan. The pool is opened by a background warm-up, so the app accepts
+# machines (rows go to the write-ahead log) before the DB answers.
+# /livez: the process serves requests. /readyz: 503 until started and, unless
+# READY_REQUIRES_DB=false, until the pool is open.
+boot = {"import_ms": None, "startup_ms": None, "db_ready_ms": None, "started": False}
+
+async def warm_up_pool():
+    """Opens the pool (min_size connections), retrying on the pool's own backoff"""
+    started = time.perf_counter()
+    while db_pool.pool is None:
+        try:
+            await db_pool.open()
+        except PoolUnavailable as e:
+            log.warning("⏳ DB not reachable yet, retrying", extra={"error": str(e)})
+            await asyncio.sleep(max(db_pool.retry_in, 0.1))
+    boot["db_ready_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    log.info("✅ DB pool warm", extra={"ms": boot["db_ready_ms"]})
+    await resume_sessions()
 
-app = FastAPI()
+async def resume_sessions():
+    """Running sessions from before a restart continue from their last checkpoint"""
+    try:
+        columns, rows = await query_history(
+            "SELECT * FROM treatment_sessions WHERE status = 'running'", ())
+    except HTTPException as e:
+        log.error("❌ Could not resume treatment sessions", extra={"error": e.detail})
+        return
+    for row in rows:
+        sessions.resume(SessionSummary.from_row(dict(zip(columns, row))))
+    if rows:
+        log.info("▶️ Treatment sessions resumed", extra={"sessions": len(rows)})
+
+@asynccontextmanager
+async def lifespan(app):
+    started = time.perf_counter()
+    warmup = asyncio.create_task(warm_up_pool())
+    ingest_ids.assign(state.lease_worker_id())
+    wal.open()
+    imported = wal.import_jsonl(LEGACY_SPILL_PATH, upgrade=legacy_spill_record)
+    if imported:
+        log.warning("📦 Legacy spill file moved into the write-ahead log",
+                    extra={"rows": imported, "path": LEGACY_SPILL_PATH})
+    write_queue.start()
+    state.start()
+    command_router.start()
+    alarm_engine.start()
+    sessions.start()
+    boot["startup_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    boot["started"] = True
+    log.info("🚀 Backend started", extra={k: v for k, v in boot.items() if k.endswith("_ms")})
+    yield
+    boot["started"] = False
+    warmup.cancel()
+    await alarm_engine.stop()
+    await sessions.stop()  # Last checkpoint goes out with the write queue
+    await command_router.stop()
+    await write_queue.stop()
+    await state.stop()
+    await db_pool.close()
+
+def create_app():
+    """The ASGI app (uvicorn backend:app, or backend:create_app --factory)"""
+    app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.include_router(router)
+    return app
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+router = APIRouter()
 
 # --- CONFIGURATION ---
 DB_CONFIG = {
     "host": os.getenv("DB_HOST"),
-    "port": os.getenv("DB_PORT"),
+    "port": int(os.getenv("DB_PORT", 3306)),
     "user": os.getenv("DB_USER"),
     "password": os.getenv("DB_PASSWORD"),
-    "database": os.getenv("DB_NAME"),
-    "ssl_disabled": False,
-    "connection_timeout": 10
+    "db": os.getenv("DB_NAME"),
+    "ssl": os.getenv("DB_SSL", "true").lower() != "false" or None,  # TLS context built on open
+    "connect_timeout": 10
 }
 
+DB_POOL_CONFIG = {
+    "size": int(os.getenv("DB_POOL_SIZE", 10)),
+    "min_size": int(os.getenv("DB_POOL_MIN", 1)),
+    "acquire_timeout": float(os.getenv("DB_ACQUIRE_TIMEOUT", 5.0)),
+    "health_check_interval": float(os.getenv("DB_HEALTH_CHECK_INTERVAL", 30.0)),
+    "reconnect_max": float(os.getenv("DB_RECONNECT_MAX", 60.0)),
+}
+
+WRITE_QUEUE_CONFIG = {
+    "max_size": int(os.getenv("WRITE_QUEUE_MAX", 10000)),
+    "batch_size": int(os.getenv("WRITE_BATCH_SIZE", 500)),
+    "flush_interval": float(os.getenv("WRITE_FLUSH_INTERVAL", 1.0)),
+    "overflow": os.getenv("WRITE_OVERFLOW", "spill"),  # spill | drop_oldest | drop_newest
+    "wal_sync_interval": float(os.getenv("WAL_SYNC_INTERVAL", 1.0)),
+}
+WAL_DIR = os.getenv("WAL_DIR", "wal")
+WAL_SEGMENT_MB = int(os.getenv("WAL_SEGMENT_MB", 16))
+LEGACY_SPILL_PATH = os.getenv("WRITE_SPILL_PATH", "sensor_spill.jsonl")
+READY_REQUIRES_DB = os.getenv("READY_REQUIRES_DB", "true").lower() != "false"
+
 # --- 1. CONNECTION POOL (The "Bank" of Connections) ---
-# We create 5 permanent connections to reuse safely.
-try:
-    connection_pool = pooling.MySQLConnectionPool(
-        pool_name="dialysis_pool",
-        pool_size=5,  # Allow 5 parallel operations
-        pool_reset_session=True,
-        **DB_CONFIG
-    )
-    print("✅ Database Connection Pool Created")
-except Exception as e:
-    print(f"❌ Failed to create Pool: {e}")
-    connection_pool = None
+# Async pool, opened in lifespan. Callers wait up to DB_ACQUIRE_TIMEOUT for a
+# free connection and get PoolTimeout instead of a silent None.
+db_pool = AsyncPool(DB_CONFIG, **DB_POOL_CONFIG)
 
 # --- GLOBAL STATE ---
-motor_controls = {"M1": 0, "M2": 0}
-realtime_cache = {}       
-last_db_save_time = {}    
+state = store_from_env()  # Latest status + motor targets (memory | shared | redis)
+command_router = CommandRouter(state)  # Motor commands to machines connected here
+downsamplers = DownsamplerRegistry.from_env()  # Per-machine storage resolution
+ingest_ids = IngestIds()                        # Row ids: idempotent WAL replay (worker bits leased at startup)
+rollup_aggregator = RollupAggregator(ingest_ids)  # Open 1s/1m/15m buckets
+live_hub = LiveHub()                            # Push fan-out to dashboards
+state.follow(lambda: list(live_hub.subscribers), live_hub.publish)  # Viewers of other workers' machines
+SSE_KEEPALIVE = 15.0
+ring_buffers = RingBuffers(float(os.getenv("RING_MINUTES", 10)),
+                           float(os.getenv("RING_RATE", 2.0)))  # Recent full-res history
+alarm_engine = AlarmEngine.from_env()          # Clinical rules, evaluated per tick
+stream_stats = StreamStats(int(os.getenv("STATS_SPAN", 600)),
+                           int(os.getenv("STATS_FAST_SPAN", 60)),
+                           float(os.getenv("STATS_Z_LIMIT", 3.0)),
+                           float(os.getenv("STATS_DRIFT_LIMIT", 1.0)))  # Running mean/var, EWMA, z
+sequences = SequenceTracker(int(os.getenv("SEQ_REORDER_WINDOW", 256)))  # Gaps / duplicates per device
+MACHINES_TTL = float(os.getenv("MACHINES_TTL", 60))   # machines table cache
+response_cache = ResponseCache.from_env()       # ETag'd bodies, invalidated by ingest
+STATUS_CACHE_TTL = float(os.getenv("STATUS_CACHE_TTL", 0.25))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", 2.0))
+machines_cache = {"rows": None, "ids": frozenset(), "expires": 0.0, "lock": asyncio.Lock()}
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", 5000))
+# A download holds a pool connection until the client has read everything:
+# cap them below the pool size so slow clients can't starve the flusher
+export_slots = asyncio.Semaphore(max(1, min(int(os.getenv("EXPORT_CONCURRENCY", 2)),
+                                            DB_POOL_CONFIG["size"] - 1)))
+ingest_counters = {"frames": 0, "samples": 0, "bad_frames": 0, "rejected_samples": 0,
+                   "queue_dropped": 0, "late_frames": 0, "connected": 0}
+# Per machine socket: frames between the receive task and the processing task
+CONN_QUEUE_SIZE = int(os.getenv("INGEST_CONN_QUEUE", 64))
+CONN_QUEUE_OVERFLOW = os.getenv("INGEST_CONN_OVERFLOW", "drop_oldest")  # drop_oldest | drop_newest
+LATENCY_BUDGET = float(os.getenv("INGEST_LATENCY_BUDGET_MS", 250)) / 1000  # Queue wait before catch-up
+if CONN_QUEUE_OVERFLOW not in FRAME_OVERFLOW_POLICIES:
+    raise ValueError(f"Unknown INGEST_CONN_OVERFLOW: {CONN_QUEUE_OVERFLOW}")
 
-def get_db_connection():
-    """Borrows a connection from the pool"""
-    if not connection_pool:
-        return None
-    try:
-        return connection_pool.get_connection()
-    except Exception as e:
-        print(f"⚠️ Pool Exhausted: {e}")
+# --- METRICS (GET /metrics, Prometheus text format) ---
+WS_HANDLE = REGISTRY.histogram("ws_message_handle_seconds",
+                               "Time to process one machine WebSocket message", ["format"])
+WS_MESSAGES = REGISTRY.counter("ws_messages_total", "Frames received per machine", ["machine_id"])
+WS_SAMPLES = REGISTRY.counter("ws_samples_total", "Samples received per machine", ["machine_id"])
+QUEUE_WAIT = REGISTRY.histogram("ws_queue_wait_seconds",
+                                "Time a machine frame waited between receive and processing")
+REGISTRY.counter("ws_frames_dropped_total", "Frames shed by full per-connection queues",
+                 fn=lambda: ingest_counters["queue_dropped"])
+REGISTRY.counter("ws_late_frames_total", "Frames processed in catch-up (over the latency budget)",
+                 fn=lambda: ingest_counters["late_frames"])
+WS_REJECTED = REGISTRY.counter("ws_rejected_samples_total",
+                               "Samples failing type/range validation per machine", ["machine_id"])
+
+# machine_id comes from the socket URL: any client can make one up. Only
+# machines in the catalog get their own series, the rest share "other", so
+# /metrics stays bounded however many ids are tried.
+OTHER_MACHINES = "other"
+
+def machine_label(machine_id):
+    return machine_id if machine_id in machines_cache["ids"] else OTHER_MACHINES
+
+def per_machine(values):
+    """{machine_id: n} -> {label: n}, unknown machines summed under "other" """
+    labelled = {}
+    for machine_id, n in values.items():
+        label = machine_label(machine_id)
+        labelled[label] = labelled.get(label, 0) + n
+    return labelled
+
+DB_WRITE = REGISTRY.histogram("db_write_seconds", "Batch write time by stage", ["stage"])
+DB_QUERY = REGISTRY.histogram("db_query_seconds", "History query time")
+INGEST_LATENCY = REGISTRY.histogram("ingest_latency_seconds",
+                                    "Device capture (ts) to backend receive, newest sample per frame")
+REGISTRY.gauge("ingest_samples_lost", "Samples skipped by device seq and not yet arrived", ["machine_id"],
+               fn=lambda: per_machine({m: s.lost for m, s in sequences.machines.items()}))
+REGISTRY.counter("ingest_duplicates_total", "Samples dropped as already seen", ["machine_id"],
+                 fn=lambda: per_machine({m: s.duplicates for m, s in sequences.machines.items()}))
+REGISTRY.gauge("ws_connected", "Machine sockets connected to this worker",
+               fn=lambda: ingest_counters["connected"])
+REGISTRY.counter("ws_bad_frames_total", "Frames that failed to decode",
+                 fn=lambda: ingest_counters["bad_frames"])
+REGISTRY.gauge("live_subscribers", "Dashboard streams attached to this worker",
+               fn=lambda: sum(len(s) for s in live_hub.subscribers.values()))
+REGISTRY.gauge("db_pool_connections", "Pooled DB connections by state", ["state"],
+               fn=lambda: {k: db_pool.stats()[k] for k in ("in_use", "idle", "waiting")})
+REGISTRY.gauge("write_queue_depth", "Rows waiting in the write-behind queue",
+               fn=lambda: write_queue.depth)
+REGISTRY.counter("write_queue_rows_total", "Write-behind queue rows by outcome", ["outcome"],
+                 fn=lambda: {k: write_queue.counters[k] for k in
+                             ("enqueued", "written", "dropped", "spilled", "replayed", "dead_lettered")})
+REGISTRY.gauge("wal_backlog_bytes", "Write-ahead log bytes not yet replayed",
+               fn=lambda: wal.stats()["backlog_bytes"])
+REGISTRY.gauge("alarms_active", "Active clinical alarms", fn=lambda: len(alarm_engine.active_alarms))
+
+def threadpool_stats(field):
+    # anyio: run_in_threadpool / sync endpoints. asyncio: asyncio.to_thread (state
+    # store, WAL); its executor has no public stats, hence the private fields.
+    limiter = anyio.to_thread.current_default_thread_limiter().statistics()
+    executor = asyncio.get_running_loop()._default_executor
+    if field == "queued":
+        return {"anyio": limiter.tasks_waiting,
+                "asyncio": executor._work_queue.qsize() if executor else 0}
+    return {"anyio": limiter.borrowed_tokens,
+            "asyncio": len(executor._threads) - executor._idle_semaphore._value if executor else 0}
+
+REGISTRY.gauge("threadpool_queued", "Calls waiting for a worker thread", ["pool"],
+               fn=lambda: threadpool_stats("queued"))
+REGISTRY.gauge("threadpool_in_use", "Worker threads busy", ["pool"],
+               fn=lambda: threadpool_stats("in_use"))
+
+# --- BATCHED DB WRITES (Write-Behind) ---
+# Replays may resend rows that did commit: the ingest_id / write_id keys turn those into no-ops.
+# "sensor_logs" (pre-seq) and "rollup_<tier>" (pre-write_id) are older row shapes,
+# kept so older write-ahead log records still replay.
+INSERT_STATEMENTS = {
+    "sensor_logs": """
+        INSERT INTO sensor_logs 
+        (machine_id, timestamp, current_mA, ph, turbidity, pressure_Pa, 
+         flow_rate, temperature, humidity, ingest_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE ingest_id = ingest_id
+    """,
+    "sensor_logs_v2": """
+        INSERT INTO sensor_logs 
+        (machine_id, timestamp, current_mA, ph, turbidity, pressure_Pa, 
+         flow_rate, temperature, humidity, seq, device_ts, ingest_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE ingest_id = ingest_id
+    """,
+    **{f"rollup_{tier}_v2": rollup_insert_sql(tier) for tier, _ in TIERS},
+    **{f"rollup_{tier}": rollup_legacy_sql(tier) for tier, _ in TIERS},
+    "treatment_sessions": session_upsert_sql(),
+}
+
+def device_time(ts):
+    """Device capture time as a naive UTC datetime, None if absent or nonsense"""
+    if type(ts) not in (float, int) or not 0 < ts < 4102444800:  # Before 2100
         return None
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
 
-# --- BACKGROUND DB SAVE (Thread-Safe) ---
-def save_data_sync(machine_id, data):
-    conn = None
-    try:
-        # Borrow connection
-        conn = get_db_connection()
-        if not conn: return
-
-        cursor = conn.cursor()
-        query = """
-            INSERT INTO sensor_logs 
-            (machine_id, current_mA, ph, turbidity, pressure_Pa, 
-             flow_rate, temperature, humidity)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        cursor.execute(query, (
-            machine_id,
-            data.get("current_mA", 0),
-            data.get("ph", 7.0),
-            data.get("turbidity", 0),
-            data.get("pressure_Pa", 0),
-            data.get("flow_rate", 0),
-            data.get("temperature", 0),
-            data.get("humidity", 0)
-        ))
-        conn.commit()
-        cursor.close()
-        # Connection is automatically returned to pool when closed
-        conn.close() 
-        print(f"💾 Saved {machine_id}") 
-
-    except Exception as e:
-        print(f"⚠️ Save Error: {e}")
-        if conn:
-            try: conn.close() # Ensure we return it even on error
-            except: pass
+def sensor_row(machine_id, data, received_at):
+    """Builds the sensor_logs params; timestamp is taken at receive time, not flush time"""
+    seq = data.get(SEQ_FIELD)
+    return (
+        machine_id,
+        datetime.fromtimestamp(received_at, timezone.utc).replace(tzinfo=None),
+        *(data.get(m, DEFAULTS[m]) for m in METRICS),
+        seq if type(seq) is int else None,
+        device_time(data.get(TS_FIELD)),
+        ingest_ids.next(),
+    )
+
+def legacy_spill_record(record):
+    # Pre-WAL spill files have sensor_logs rows without an ingest_id
+    kind, params = record
+    if kind == "sensor_logs" and len(params) == 2 + len(METRICS):
+        params = [*params, ingest_ids.next()]
+    return [kind, params]
+
+async def write_batch(items):
+    """One executemany per statement kind, one commit per batch"""
+    grouped = {}
+    for kind, params in items:
+        grouped.setdefault(kind, []).append(params)
+
+    async with db_pool.connection() as conn:
+        start = time.perf_counter()
+        async with conn.cursor() as cursor:
+            for kind, rows in grouped.items():
+                await cursor.executemany(INSERT_STATEMENTS[kind], rows)
+        DB_WRITE.labels("insert").observe(time.perf_counter() - start)
+        start = time.perf_counter()
+        await conn.commit()
+        DB_WRITE.labels("commit").observe(time.perf_counter() - start)
+
+wal = SegmentWAL(WAL_DIR, WAL_SEGMENT_MB << 20)  # Rows the DB couldn't take (yet)
+# Errors about the rows themselves: retrying won't help, so those rows are dead-lettered.
+# Connection / pool errors (OperationalError, PoolTimeout, ...) mean "DB down": spill and retry.
+PERMANENT_WRITE_ERRORS = (aiomysql.IntegrityError, aiomysql.DataError, aiomysql.ProgrammingError,
+                          aiomysql.NotSupportedError, KeyError, TypeError, ValueError)
+write_queue = WriteBehindQueue(write_batch, wal=wal, permanent=PERMANENT_WRITE_ERRORS,
+                               **WRITE_QUEUE_CONFIG)
+sessions = SessionRegistry(ingest_ids, write_queue.enqueue,
+                           float(os.getenv("SESSION_CHECKPOINT", 30)),
+                           float(os.getenv("SESSION_MAX_GAP", 60)))  # Treatment summaries
+alarm_engine.listeners.append(sessions.on_alarm)
+
+def enqueue_rows(machine_id, rows):
+    for ts, row in rows:
+        write_queue.enqueue("sensor_logs_v2", sensor_row(machine_id, row, ts))
+
+def enqueue_rollups(items):
+    for kind, params in items:
+        write_queue.enqueue(kind, params)
 
 # --- ENDPOINTS ---
 
-@app.post("/login")
+@router.get("/livez")
+async def livez():
+    # async: answers even when every worker thread is busy
+    return {"status": "ok"}
+
+@router.get("/readyz")
+async def readyz(response: Response):
+    checks = {"started": boot["started"], "db": db_pool.pool is not None}
+    ready = checks["started"] and (checks["db"] or not READY_REQUIRES_DB)
+    if not ready:
+        response.status_code = 503
+    return {"ready": ready, "checks": checks, "boot": boot}
+
+@router.post("/login")
 def login(data: dict):
     if data["username"] == "abhishek" and data["password"] == "123456":
         return {"status": "success", "user": "abhishek"}
     raise HTTPException(status_code=401, detail="Invalid Credentials")
 
-@app.post("/set-motor/{machine_id}")
-def set_motor(machine_id: str, data: dict):
-    motor_controls[machine_id] = data.get("speed", 0)
-    return {"message": "Speed set"}
+@router.post("/set-motor/{machine_id}")
+async def set_motor(machine_id: str, data: dict):
+    speed = data.get("speed", 0)
+    await run_in_threadpool(state.set_motor, machine_id, speed)
+    # Pushed right away if the machine is connected to this worker,
+    # otherwise the owning worker's router picks it up from the state store
+    seq = await command_router.push(machine_id, speed)
+    return {"message": "Speed set", "seq": seq}
 
-@app.get("/machine-status/{machine_id}")
-def get_status(machine_id: str):
-    # RAM ONLY - Fast
-    if machine_id in realtime_cache:
-        return realtime_cache[machine_id]
-    return {"timestamp": "Waiting for Data..."}
+@router.get("/motor/{machine_id}")
+def get_motor(machine_id: str):
+    channel = command_router.channels.get(machine_id)
+    return {
+        "target": state.get_motor(machine_id, 0),
+        "connected": channel is not None,
+        **(channel.stats() if channel else {}),
+    }
 
-@app.get("/history/{machine_id}")
-def get_history(machine_id: str):
-    conn = None
+async def conditional_json(request, machine_id, ttl, produce):
+    """Serves await produce(response) as JSON via response_cache; 304 if the client's ETag matches"""
+    key = f"{request.url.path}?{request.url.query}"
+    entry = response_cache.get(machine_id, key)
+    if entry is None:
+        version = response_cache.version(machine_id)
+        scratch = Response()    # Collects X-Source / X-Resolution
+        result = await produce(scratch)
+        body = dumps(result)
+        headers = {k: v for k, v in scratch.headers.items() if k.startswith("x-")}
+        entry = response_cache.put(machine_id, key, body, headers, ttl, version)
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache", **entry.headers}
+    if entry.etag in (t.strip() for t in request.headers.get("if-none-match", "").split(",")):
+        response_cache.counters["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+@router.get("/machine-status/{machine_id}")
+async def get_status(machine_id: str, request: Request):
+    # RAM ONLY - Fast (shared backends read through a short TTL cache).
+    # Pollers holding the current ETag get an empty 304.
+    async def produce(response):
+        status = await run_in_threadpool(state.get_status, machine_id)
+        if status is not None:
+            return status
+        return {"timestamp": "Waiting for Data..."}
+    return await conditional_json(request, machine_id, STATUS_CACHE_TTL, produce)
+
+@router.get("/stream/{machine_id}")
+async def stream_status(machine_id: str, request: Request):
+    # Server-Sent Events: one long-lived response instead of polling /machine-status
+    async def events():
+        sub = live_hub.subscribe(machine_id)
+        try:
+            status = await run_in_threadpool(state.get_status, machine_id)  # Shared backends block
+            if status is not None:
+                yield f"data: {dumps_str(status)}\n\n"
+            while not await request.is_disconnected():
+                frame = await sub.next(timeout=SSE_KEEPALIVE)
+                yield f"data: {frame}\n\n" if frame else ": keepalive\n\n"
+        finally:
+            live_hub.unsubscribe(machine_id, sub)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+async def machine_catalog():
+    """machines table, cached for MACHINES_TTL; a stale copy beats an error if the DB is down"""
+    async with machines_cache["lock"]:
+        if time.monotonic() < machines_cache["expires"]:
+            if machines_cache["rows"] is None:
+                raise HTTPException(status_code=503, detail="Machine list unavailable")
+            return machines_cache["rows"]
+        try:
+            rows = table_result(*await query_history(
+                "SELECT machine_id, location, is_active FROM machines ORDER BY machine_id", ()), "rows")
+            machines_cache["rows"] = [{**r, "is_active": bool(r["is_active"])} for r in rows]
+            machines_cache["ids"] = frozenset(r["machine_id"] for r in rows)
+            machines_cache["expires"] = time.monotonic() + MACHINES_TTL
+        except HTTPException:
+            # Don't let every request wait on a dead DB; retry in a few seconds
+            machines_cache["expires"] = time.monotonic() + min(MACHINES_TTL, 5.0)
+            if machines_cache["rows"] is None:
+                raise
+        return machines_cache["rows"]
+
+@router.post("/sessions/{machine_id}/start")
+async def start_session(machine_id: str, data: dict | None = None):
+    # async: session state is only touched from the event loop
+    try:
+        session = sessions.begin(machine_id, (data or {}).get("patient_id"))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return session.report()
+
+@router.post("/sessions/{machine_id}/stop")
+async def stop_session(machine_id: str):
+    try:
+        session = sessions.end(machine_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No running session on {machine_id}")
+    return session.report()
+
+@router.get("/sessions")
+async def list_active_sessions():
+    return [s.report() for s in sessions.active.values()]
+
+@router.get("/sessions/{session_id}")
+async def get_session(session_id: int):
+    # Running or just finished: from RAM. Older: one row, no sensor_logs scan.
+    session = sessions.get(session_id)
+    if session is not None:
+        return session.report()
+    columns, rows = await query_history(
+        "SELECT * FROM treatment_sessions WHERE session_id = %s", (session_id,))
+    if not rows:
+        raise HTTPException(status_code=404, detail=f"Unknown session {session_id}")
+    return session_report(dict(zip(columns, rows[0])))
+
+@router.get("/machines/{machine_id}/sessions")
+async def list_machine_sessions(machine_id: str, limit: int = Query(20, ge=1, le=500)):
+    columns, rows = await query_history("""
+        SELECT * FROM treatment_sessions WHERE machine_id = %s
+        ORDER BY started_at DESC LIMIT %s
+    """, (machine_id, limit))
+    return [session_report(dict(zip(columns, r))) for r in rows]
+
+@router.get("/machines")
+async def list_machines():
+    return await machine_catalog()
+
+@router.get("/machines/status")
+async def machines_status(ids: str | None = None):
+    # One response for the whole ward: catalog + latest sample + motor + active alarms.
+    # ?ids=M1,M2 narrows it down; unregistered ids are still answered from RAM.
+    try:
+        catalog = {m["machine_id"]: m for m in await machine_catalog()}
+    except HTTPException:
+        catalog = {}    # DB down and nothing cached: live data is still worth showing
+    statuses = await run_in_threadpool(state.all_status)
+    wanted = [i for i in ids.split(",") if i] if ids else sorted(catalog or statuses)
+    alarms = {}
+    for (machine_id, _), event in alarm_engine.active_alarms.items():
+        alarms.setdefault(machine_id, []).append(event)
+
+    # Returned as a response: statuses are SensorReadings, which FastAPI's encoder doesn't know
+    return FastJSONResponse([{
+        "machine_id": machine_id,
+        "location": catalog.get(machine_id, {}).get("location"),
+        "is_active": catalog.get(machine_id, {}).get("is_active", False),
+        "status": statuses.get(machine_id),
+        "motor_speed": state.get_motor(machine_id, 0),
+        "alarms": alarms.get(machine_id, []),
+    } for machine_id in wanted])
+
+@router.get("/alarms")
+async def get_alarms():
+    # Active alarms across the ward + the most recent raise/clear events.
+    # async: the alarm tick mutates these on the event loop
+    return alarm_engine.snapshot()
+
+@router.get("/alarms/stream")
+async def stream_alarms(request: Request):
+    # SSE: every raise/clear event as it happens (declared before /alarms/{machine_id})
+    async def events():
+        queue = alarm_engine.subscribe()
+        try:
+            for event in alarm_engine.snapshot()["active"]:
+                yield f"data: {dumps_str(event)}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE)
+                    yield f"data: {dumps_str(event)}\n\n"
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            alarm_engine.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@router.get("/alarms/{machine_id}")
+async def get_machine_alarms(machine_id: str):
+    return alarm_engine.snapshot(machine_id)
+
+@router.get("/stats/{machine_id}")
+async def get_stream_stats(machine_id: str):
+    # Maintained on ingest, so no sensor_logs scan per view.
+    # async: read on the loop that updates them, never half-way through a sample
+    metrics = stream_stats.snapshot(machine_id)
+    if metrics is None:
+        raise HTTPException(status_code=404, detail=f"No samples from {machine_id} yet")
+    return {"machine_id": machine_id, "metrics": metrics}
+
+@router.get("/sequence-stats")
+async def get_sequence_stats():
+    # Per device: received, lost (gaps not filled yet), duplicates, reordered, restarts
+    # async: the trackers are updated by ingest on the event loop, never read from a thread
+    return sequences.stats()
+
+@router.get("/sequence-stats/{machine_id}")
+async def get_machine_sequence_stats(machine_id: str):
+    stats = sequences.stats(machine_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"No numbered samples from {machine_id} yet")
+    return {"machine_id": machine_id, **stats}
+
+@router.get("/downsampling/{machine_id}")
+def get_downsampling(machine_id: str):
+    return downsamplers.spec_for(machine_id)
+
+@router.put("/downsampling/{machine_id}")
+async def set_downsampling(machine_id: str, spec: dict):
+    # async: the live policies are only touched from the event loop (ingest calls add there)
+    # e.g. {"mode": "keep_all"} for a critical bed, {"mode": "deadband", "max_interval": 10}
     try:
-        conn = get_db_connection()
-        if not conn: return []
-        
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
+        pending = downsamplers.set_spec(machine_id, spec)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    enqueue_rows(machine_id, pending)
+    return {"message": "Policy updated", "policy": downsamplers.spec_for(machine_id)}
+
+@router.get("/ingest-stats")
+async def get_ingest_stats():
+    # Queue depth, drops and spills of the write-behind queue
+    # async: every counter here is updated on the event loop; a thread could catch one mid-update
+    return {**write_queue.stats(), "ingest": ingest_counters, "live": live_hub.stats(),
+            "ring_buffers": ring_buffers.stats(), "alarms": alarm_engine.stats(),
+            "stream_stats": stream_stats.stats(), "response_cache": response_cache.stats(),
+            "sessions": sessions.stats()}
+
+def to_utc_naive(dt):
+    # DB timestamps are naive UTC
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+@router.get("/metrics")
+async def get_metrics():
+    # async: the threadpool gauges must be read on the event loop
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@router.get("/db-stats")
+async def get_db_stats():
+    # Pool in-use / idle / waiting, acquisition wait times and timeouts.
+    # async: the wait-time deque is appended to on the event loop
+    return db_pool.stats()
+
+@router.get("/history/{machine_id}")
+async def get_history(machine_id: str, request: Request,
+                      start: datetime | None = Query(None, alias="from"),
+                      end: datetime | None = Query(None, alias="to"),
+                      since: datetime | None = None,
+                      resolution: str | None = None,
+                      points: int = Query(500, ge=1, le=5000),
+                      format: Literal["rows", "columnar"] = "rows"):
+    # Same query within HISTORY_CACHE_TTL and no ingest since: no SQL, maybe a 304.
+    # format=columnar: {"timestamp": [...], "ph": [...]}, no object per row
+    async def produce(response):
+        return await history_rows(machine_id, response, start, end, since, resolution, points, format)
+    return await conditional_json(request, machine_id, HISTORY_CACHE_TTL, produce)
+
+def table_result(columns, rows, format):
+    if format == "columnar":
+        return to_columnar(columns, rows)
+    return [dict(zip(columns, r)) for r in rows]
+
+def rows_result(rows, format):
+    # Ring buffer answers are row dicts already
+    return to_columnar(*dict_rows(rows)) if format == "columnar" else rows
+
+async def history_rows(machine_id, response, start, end, since, resolution, points, format):
+    ring = ring_buffers.get(machine_id)
+
+    # Incremental: raw rows strictly after the client's newest timestamp, oldest first
+    if since is not None:
+        since = to_utc_naive(since)
+        since_ts = since.replace(tzinfo=timezone.utc).timestamp()
+        if ring and ring.covers(since_ts):
+            response.headers["X-Source"] = "memory"
+            return rows_result(ring.raw_rows(since_ts, float("inf"), points, inclusive=False,
+                                             policy=downsamplers.replay_policy(machine_id)), format)
+        return table_result(*await query_history("""
+            SELECT timestamp, current_mA, ph, turbidity, pressure_Pa, 
+                   flow_rate, temperature, humidity
+            FROM sensor_logs 
+            WHERE machine_id = %s AND timestamp > %s
+            ORDER BY timestamp LIMIT %s
+        """, (machine_id, since, points)), format)
+
+    # No range: the classic "latest 50 raw rows" for the logs table
+    if start is None and end is None and resolution in (None, "raw"):
+        rows = ring.latest_rows(50, downsamplers.replay_policy(machine_id)) if ring else []
+        if len(rows) == 50:
+            response.headers["X-Source"] = "memory"
+            return rows_result(rows, format)
+        return table_result(*await query_history("""
             SELECT timestamp, current_mA, ph, turbidity, pressure_Pa, 
                    flow_rate, temperature, humidity
             FROM sensor_logs 
             WHERE machine_id = %s 
             ORDER BY timestamp DESC LIMIT 50
-        """, (machine_id,))
-        data = cursor.fetchall()
-        cursor.close()
-        conn.close() # Return to pool
-        return data
-    except Exception as e:
-        print(f"Read Error: {e}")
-        if conn: conn.close()
-        return []
+        """, (machine_id,)), format)
+
+    end = to_utc_naive(end) if end else datetime.now(timezone.utc).replace(tzinfo=None)
+    start = to_utc_naive(start) if start else end - timedelta(hours=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+
+    resolution = resolution or "auto"
+    if resolution == "auto":
+        resolution = pick_tier((end - start).total_seconds(), points)
+    response.headers["X-Resolution"] = resolution
+    if resolution != "raw" and resolution not in TIER_SECONDS:
+        raise HTTPException(status_code=400, detail=f"Unknown resolution: {resolution}")
+
+    # Recent window: answer from the ring buffer, the DB only holds older ranges.
+    # A range holding more than `points` rows/buckets gets its newest `points`
+    # (one extra is fetched to tell) and X-Truncated: true.
+    start_ts = start.replace(tzinfo=timezone.utc).timestamp()
+    if ring and ring.covers(start_ts):
+        response.headers["X-Source"] = "memory"
+        end_ts = end.replace(tzinfo=timezone.utc).timestamp()
+        if resolution == "raw":
+            rows = ring.raw_rows(start_ts, end_ts, points + 1, newest=True,
+                                 policy=downsamplers.replay_policy(machine_id))
+        else:
+            rows = ring.bucket_rows(start_ts, end_ts, TIER_SECONDS[resolution], points + 1, newest=True)
+        return rows_result(newest_window(rows, points, response), format)
+
+    if resolution == "raw":
+        columns, rows = await query_history("""
+            SELECT timestamp, current_mA, ph, turbidity, pressure_Pa, 
+                   flow_rate, temperature, humidity
+            FROM sensor_logs 
+            WHERE machine_id = %s AND timestamp BETWEEN %s AND %s
+            ORDER BY timestamp DESC LIMIT %s
+        """, (machine_id, start, end, points + 1))
+    else:
+        # A bucket may be stored in parts (see rollups.py): merged here
+        columns, rows = await query_history(f"""
+            SELECT bucket_start AS timestamp, {rollup_columns()}
+            FROM {table_name(resolution)}
+            WHERE machine_id = %s AND bucket_start BETWEEN %s AND %s
+            GROUP BY bucket_start
+            ORDER BY bucket_start DESC LIMIT %s
+        """, (machine_id, start, end, points + 1))
+    return table_result(columns, newest_window(rows[::-1], points, response), format)
+
+def newest_window(rows, points, response):
+    """rows oldest first, at most points + 1: the newest points, flagged if the range held more"""
+    if len(rows) > points:
+        response.headers["X-Truncated"] = "true"
+        return rows[-points:]
+    return rows
+
+async def query_history(sql, params):
+    """(column names, row tuples): no dict per row unless the caller wants one"""
+    start = time.perf_counter()
+    try:
+        async with db_pool.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(sql, params)
+                rows = await cursor.fetchall()
+                columns = [d[0] for d in cursor.description]
+        DB_QUERY.observe(time.perf_counter() - start)
+        return columns, rows
+    except (PoolTimeout, PoolUnavailable) as e:
+        # Tell the client, instead of an empty list that looks like "no data"
+        raise HTTPException(status_code=503, detail=str(e))
+    except aiomysql.Error as e:
+        log.error("History query failed", extra={"error": str(e)})
+        raise HTTPException(status_code=503, detail="History query failed")
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """Runs release() when the response is done, failed or abandoned - also when
+    the body generator never started (its finally would never run)."""
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.release()
+
+@router.get("/export/{machine_id}")
+async def export_history(machine_id: str,
+                         start: datetime | None = Query(None, alias="from"),
+                         end: datetime | None = Query(None, alias="to"),
+                         format: str = "csv"):
+    # Streams raw sensor_logs through a server-side cursor, one chunk at a time
+    try:
+        check_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    end = to_utc_naive(end) if end else datetime.now(timezone.utc).replace(tzinfo=None)
+    start = to_utc_naive(start) if start else end - timedelta(hours=24)
+
+    if export_slots.locked():
+        raise HTTPException(status_code=503, detail="Too many exports in progress, retry shortly",
+                            headers={"Retry-After": "10"})
+    await export_slots.acquire()
+    stack = AsyncExitStack()
+    stack.callback(export_slots.release)
+
+    # Run the query before answering, so pool/DB errors are still a 503
+    conn = None
+    try:
+        conn = await stack.enter_async_context(db_pool.connection())
+        cursor = await conn.cursor(aiomysql.SSCursor)
+        await cursor.execute(f"""
+            SELECT {", ".join(EXPORT_COLUMNS)}
+            FROM sensor_logs
+            WHERE machine_id = %s AND timestamp BETWEEN %s AND %s
+            ORDER BY timestamp
+        """, (machine_id, start, end))
+    except BaseException as e:
+        # Cancelled too: the slot and the connection must not outlive the request
+        if conn is not None:
+            conn.close()    # The query may be half-sent
+        with anyio.CancelScope(shield=True):
+            await stack.aclose()
+        if isinstance(e, (PoolTimeout, PoolUnavailable, aiomysql.Error)):
+            raise HTTPException(status_code=503, detail=f"Export query failed: {e}") from e
+        raise
+
+    finished = False
+
+    async def chunks():
+        while True:
+            rows = await cursor.fetchmany(EXPORT_CHUNK_ROWS)
+            if not rows:
+                break
+            yield rows
+
+    async def body():
+        nonlocal finished
+        async for data in ENCODERS[format](chunks()):
+            if data:
+                yield data
+        finished = True
+
+    async def release():
+        if finished:
+            await cursor.close()
+        else:
+            # Client went away (maybe before the first chunk): drop the socket
+            # rather than draining the rest of an unbuffered result set
+            conn.close()
+        await stack.aclose()
+
+    media_type, ext = FORMATS[format]
+    filename = f"{machine_id}_{start:%Y%m%dT%H%M%S}_{end:%Y%m%dT%H%M%S}.{ext}"
+    return ReleasingStreamingResponse(body(), release, media_type=media_type,
+                                      headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
 # --- WEBSOCKET ---
-@app.websocket("/ws/machine/{machine_id}")
+@router.websocket("/ws/machine/{machine_id}")
 async def websocket_endpoint(websocket: WebSocket, machine_id: str):
-    await websocket.accept()
-    print(f"✅ {machine_id} Connected")
-    
+    # JSON text frames by default; packed binary frames if the device offers one of our
+    # subprotocols (newest first: v2 carries seq + ts, v1 devices still work)
+    offered = websocket.scope.get("subprotocols", [])
+    subprotocol = next((p for p in BINARY_SUBPROTOCOLS if p in offered), None)
+    await websocket.accept(subprotocol=subprotocol)
+    wire = "binary" if subprotocol else "json"
+    log.info("✅ Machine connected", extra={"machine_id": machine_id, "format": wire})
+    channel = CommandChannel(websocket.send_text)
+    if db_pool.pool is not None:
+        try:
+            await machine_catalog()     # Cached; refreshes the known ids for machine_label
+        except HTTPException:
+            pass
+    # Labelled children looked up once per connection, not per message
+    handle_time = WS_HANDLE.labels(wire)
+    label = machine_label(machine_id)
+    messages = WS_MESSAGES.labels(label)
+    sample_count = WS_SAMPLES.labels(label)
+    rejected = WS_REJECTED.labels(label)
+
+    def reject(error):
+        # One bad sample doesn't cost the rest of the batch
+        ingest_counters["rejected_samples"] += 1
+        rejected.inc()
+        log.debug("Rejected sample", extra={"machine_id": machine_id, "error": str(error)})
+
+    def bad_frame(error):
+        ingest_counters["bad_frames"] += 1
+        log.warning("⚠️ Bad frame", extra={"machine_id": machine_id, "error": str(error)})
+
+    # Receive and processing run as two tasks joined by a small bounded queue
+    # (frame_queue.py): the socket keeps being read (and acks handled) while a
+    # burst is processed. In catch-up the processor takes the whole backlog and
+    # publishes status / bumps caches once for all of it.
+    frames = FrameQueue(CONN_QUEUE_SIZE, CONN_QUEUE_OVERFLOW, LATENCY_BUDGET, ingest_counters)
+    offer = frames.offer
+
+    async def receive_frames():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                if message.get("bytes") is not None:
+                    offer((time.perf_counter(), time.time(), message["bytes"]))
+                    continue
+                try:
+                    data = loads(message["text"])
+                except ValueError as e:
+                    bad_frame(e)
+                    continue
+                # Acks are control traffic: never queued (or dropped) behind telemetry
+                if isinstance(data, dict) and data.get("type") == "ack":
+                    channel.ack(data.get("seq", 0))
+                    continue
+                offer((time.perf_counter(), time.time(), data))
+        except WebSocketDisconnect:
+            pass
+        except Exception:
+            log.exception("⚠️ Machine socket receive error", extra={"machine_id": machine_id})
+        finally:
+            frames.close()  # Socket gone (or broken): lets the processor finish
+
+    def decode(payload):
+        # Validated into SensorReadings here; nothing downstream sees raw payloads
+        if isinstance(payload, bytes):
+            try:
+                return decode_frame(payload, on_invalid=reject)
+            except ValueError as e:
+                bad_frame(e)
+                return []
+        samples = []
+        for raw in (payload if isinstance(payload, list) else [payload]):
+            try:
+                samples.append(SensorReading.parse(raw))
+            except InvalidReading as e:
+                reject(e)
+        return samples
+
+    def ingest(samples, now):
+        """Stores one frame's samples, received at now. Returns (stored anything, newest sample for status)."""
+        ingest_counters["frames"] += 1
+        ingest_counters["samples"] += len(samples)
+        messages.inc()
+        sample_count.inc(len(samples))
+
+        # Sequence check: drop resent samples; a late (reordered) one is
+        # stored but must not overwrite the newer status viewers already have
+        fresh, latest = [], None
+        for data in samples:
+            verdict = sequences.check(machine_id, data)
+            if verdict is DUPLICATE:
+                continue
+            fresh.append(data)
+            if verdict is not REORDERED:
+                latest = data
+
+        # Downsample in memory, then queue for DB (flusher does the write).
+        # Alarm rules only see an append here; they run on the engine's tick.
+        # Server receive time stays the timeline: device clocks drift. It is
+        # taken in receive_frames, so time spent queued doesn't shift it.
+        for data in fresh:
+            ring_buffers.append(machine_id, now, data)
+            sessions.add(machine_id, now, data)
+            alarm_engine.update(machine_id, now, data)
+            stream_stats.update(machine_id, data)
+            enqueue_rows(machine_id, downsamplers.add(machine_id, now, data))
+            enqueue_rollups(rollup_aggregator.add(machine_id, now, data))
+        return bool(fresh), latest
+
+    def publish(latest):
+        captured = latest.get(TS_FIELD)
+        if type(captured) in (float, int):
+            INGEST_LATENCY.observe(max(0.0, time.time() - captured))
+        # Update RAM + push to live viewers (latest sample only)
+        state.set_status(machine_id, latest)
+        live_hub.publish(machine_id, latest)
+
+    command_router.attach(machine_id, channel)
+    sequences.connected(machine_id)
+    ingest_counters["connected"] += 1
+    receiver = asyncio.create_task(receive_frames())
+
     try:
+        # Sync the machine with the current target once, then only on change
+        await channel.push(state.get_motor(machine_id, 0))
+
         while True:
-            # 1. Receive
-            raw = await websocket.receive_text()
-            data = json.loads(raw)
-            
-            # 2. Update RAM
-            realtime_cache[machine_id] = data 
-            
-            # 3. Save to DB (Every 2s)
-            current_time = time.time()
-            last_save = last_db_save_time.get(machine_id, 0)
-            
-            if current_time - last_save > 2.0:
-                await run_in_threadpool(save_data_sync, machine_id, data)
-                last_db_save_time[machine_id] = current_time
-            
-            # 4. Motor
-            target = motor_controls.get(machine_id, 0)
-            await websocket.send_text(json.dumps({"motor_speed": target}))
+            batch = await frames.take()
+            if batch is None:
+                break
+            started = time.perf_counter()
+            QUEUE_WAIT.observe(started - batch[0][0])
+
+            stored, latest = False, None
+            for _, received_at, payload in batch:
+                samples = decode(payload)
+                if samples:
+                    frame_stored, frame_latest = ingest(samples, received_at)
+                    stored = stored or frame_stored
+                    latest = frame_latest or latest
+            if latest is not None:
+                publish(latest)
+            if stored:
+                response_cache.bump(machine_id)  # Cached status/history bodies are stale now
+            handle_time.observe(time.perf_counter() - started)
+            await asyncio.sleep(0)  # Let the receiver move what the socket holds into the queue
+        log.info("❌ Machine disconnected", extra={"machine_id": machine_id})
 
     except WebSocketDisconnect:
-        print(f"❌ {machine_id} Disconnected")
\ No newline at end of file
+        log.info("❌ Machine disconnected", extra={"machine_id": machine_id})
+    finally:
+        receiver.cancel()
+        command_router.detach(machine_id, channel)
+        ingest_counters["connected"] -= 1
+        # Persist any half-filled bucket and free the per-machine state
+        enqueue_rows(machine_id, downsamplers.release(machine_id))
+        enqueue_rollups(rollup_aggregator.release(machine_id))
+        ring_buffers.release(machine_id)
+        state.release(machine_id)
+
+@router.websocket("/ws/subscribe/{machine_id}")
+async def subscribe_endpoint(websocket: WebSocket, machine_id: str):
+    # Viewer side: latest status pushed on every sample, slow viewers get coalesced frames
+    await websocket.accept()
+    sub = live_hub.subscribe(machine_id)
+
+    async def wait_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    closed = asyncio.create_task(wait_disconnect())
+
+    try:
+        status = await run_in_threadpool(state.get_status, machine_id)
+        if status is not None:
+            await websocket.send_text(dumps_str(status))
+        while not closed.done():
+            frame = await sub.next(timeout=SSE_KEEPALIVE)
+            if frame:
+                await websocket.send_text(frame)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        closed.cancel()
+        live_hub.unsubscribe(machine_id, sub)
+
+app = create_app()
+boot["import_ms"] = round((time.perf_counter() - _import_started) * 1000, 1)
@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import requests
+import websockets
+from machine_simulator import build_fleet, run_fleet
+
+# --- INGEST BENCHMARK ---
+# Drives N simulated machines against a (local) backend and reports:
+#   ingest throughput and samples lost between device and backend
+#   sample sent -> visible to viewers (p50/p95/p99), via /ws/subscribe
+#   enqueue -> committed in sensor_logs (p50/p99), from /ingest-stats
+#   motor command RTT: POST /set-motor -> command on the device
+#
+#   python bench_ingest.py --machines 1000 --rate 2 --duration 60
+#
+# Large fleets need a raised open-files limit (ulimit -n) on both ends.
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p / 100))], 1)
+
+def ingest_stats(http_url):
+    return requests.get(f"{http_url}/ingest-stats", timeout=5).json()
+
+async def probe_visibility(ws_url, machine_id, latencies, stop):
+    """Times each frame from device send to arrival at a viewer."""
+    async with websockets.connect(f"{ws_url}/ws/subscribe/{machine_id}") as ws:
+        while not stop.is_set():
+            try:
+                frame = json.loads(await asyncio.wait_for(ws.recv(), 1.0))
+            except asyncio.TimeoutError:
+                continue
+            if frame.get("ts"):
+                latencies.append((time.time() - frame["ts"]) * 1000)
+
+async def drive_commands(http_url, machine_ids, stats, interval, stop):
+    """Changes a probe machine's motor speed every interval and lets the device time it."""
+    while not stop.is_set():
+        await asyncio.sleep(interval)
+        machine_id = random.choice(machine_ids)
+        speed = random.randint(1, 100)
+        stats.command_watch[machine_id] = (speed, time.perf_counter())
+        await asyncio.to_thread(requests.post, f"{http_url}/set-motor/{machine_id}",
+                                json={"speed": speed}, timeout=5)
+
+async def bench(args):
+    http_url = args.url.rstrip("/")
+    ws_url = http_url.replace("http", "ws", 1)
+    before = ingest_stats(http_url)
+
+    stats, machines = build_fleet(args.machines, args.prefix, base_url=ws_url, rate=args.rate,
+                                  batch=args.batch, fmt=args.format, pad=args.pad)
+    probes = [m.machine_id for m in machines[:args.probes]]
+    latencies = []
+    stop = asyncio.Event()
+    side_tasks = [asyncio.create_task(probe_visibility(ws_url, m, latencies, stop)) for m in probes]
+    side_tasks.append(asyncio.create_task(drive_commands(http_url, probes, stats, args.command_interval, stop)))
+
+    print(f"🚀 {args.machines} machines x {args.rate} Hz ({args.format}, batch {args.batch}) for {args.duration}s...")
+    start = time.monotonic()
+    await run_fleet(machines, args.duration, stop)
+    elapsed = time.monotonic() - start
+    await asyncio.gather(*side_tasks, return_exceptions=True)
+
+    await asyncio.sleep(args.settle)    # Let the write-behind queue drain
+    after = ingest_stats(http_url)
+
+    received = after["ingest"]["samples"] - before["ingest"]["samples"]
+    result = {
+        "machines": args.machines,
+        "duration_s": round(elapsed, 1),
+        "sent_samples": stats.samples,
+        "sent_mb": round(stats.bytes / 1e6, 2),
+        "received_samples": received,
+        "ingest_samples_per_s": round(received / elapsed, 1),
+        "lost_in_transit": stats.samples - received,
+        "bad_frames": after["ingest"]["bad_frames"] - before["ingest"]["bad_frames"],
+        "queue_dropped": after["dropped"] - before["dropped"],
+        "queue_spilled": after["spilled"] - before["spilled"],
+        "rows_written": after["written"] - before["written"],
+        "queue_depth_after": after["depth"],
+        "reconnects": stats.disconnects,
+        "visible_ms_p50": percentile(latencies, 50),
+        "visible_ms_p95": percentile(latencies, 95),
+        "visible_ms_p99": percentile(latencies, 99),
+        "persist_ms_p50": after["persist_lag_ms_p50"],
+        "persist_ms_p99": after["persist_lag_ms_p99"],
+        "motor_rtt_ms_p50": percentile(stats.command_rtts, 50),
+        "motor_rtt_ms_p99": percentile(stats.command_rtts, 99),
+        "motor_commands_timed": len(stats.command_rtts),
+    }
+    return result
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Backend ingest benchmark")
+    parser.add_argument("--url", default="http://localhost:8000", help="Backend base URL")
+    parser.add_argument("--machines", type=int, default=100)
+    parser.add_argument("--prefix", default="BENCH", help="Keep benchmark rows apart from real beds")
+    parser.add_argument("--rate", type=float, default=2.0)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--format", choices=["json", "binary"], default="json")
+    parser.add_argument("--pad", type=int, default=0)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--probes", type=int, default=5, help="Machines watched for latency / motor RTT")
+    parser.add_argument("--command-interval", type=float, default=1.0)
+    parser.add_argument("--settle", type=float, default=3.0, help="Seconds to wait for DB flush")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = asyncio.run(bench(args))
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print("\n📈 Ingest Benchmark")
+        for k, v in result.items():
+            print(f"   {k:<22} {v}")
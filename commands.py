@@ -0,0 +1,120 @@
+import asyncio
+import time
+from logs import get_logger
+from serialization import dumps_str
+
+log = get_logger("commands")
+
+# --- MOTOR COMMAND CHANNEL ---
+# Commands go to the machine as soon as they change, instead of riding on the
+# reply to the next telemetry sample. Each command carries a sequence number;
+# the machine answers {"type": "ack", "seq": n}. Unacked commands are resent
+# a few times. A newer command supersedes any older pending one.
+
+
+class CommandChannel:
+    """One per connected machine (per WebSocket)."""
+
+    def __init__(self, send_text, resend_after=1.0, max_retries=3):
+        self.send_text = send_text      # async fn(str)
+        self.resend_after = resend_after
+        self.max_retries = max_retries
+        self.seq = 0
+        self.value = None               # Last value sent to the machine
+        self.pending = None             # [seq, value, sent_at, tries]
+        self.acked_seq = 0
+        self.last_rtt_ms = None
+        self.unacked = 0                # Commands given up on
+        self._lock = asyncio.Lock()
+
+    async def push(self, speed):
+        """Sends the new target if it differs from what the machine already has."""
+        if speed == self.value:
+            return None
+        async with self._lock:
+            self.seq += 1
+            self.value = speed
+            self.pending = [self.seq, speed, time.perf_counter(), 1]
+            await self._send(self.seq, speed)
+            return self.seq
+
+    async def _send(self, seq, speed):
+        await self.send_text(dumps_str({"type": "command", "seq": seq, "motor_speed": speed}))
+
+    def ack(self, seq):
+        if self.pending and seq == self.pending[0]:
+            self.last_rtt_ms = (time.perf_counter() - self.pending[2]) * 1000
+            self.pending = None
+        self.acked_seq = max(self.acked_seq, seq)
+
+    async def resend_due(self):
+        if not self.pending:
+            return
+        seq, speed, sent_at, tries = self.pending
+        if time.perf_counter() - sent_at < self.resend_after * tries:
+            return
+        if tries >= self.max_retries:
+            self.pending = None
+            self.unacked += 1
+            return
+        async with self._lock:
+            self.pending[3] += 1
+            await self._send(seq, speed)
+
+    def stats(self):
+        return {
+            "seq": self.seq,
+            "acked_seq": self.acked_seq,
+            "value": self.value,
+            "pending": self.pending[0] if self.pending else None,
+            "last_rtt_ms": None if self.last_rtt_ms is None else round(self.last_rtt_ms, 2),
+            "unacked": self.unacked,
+        }
+
+
+class CommandRouter:
+    """Channels for machines connected to this worker."""
+
+    def __init__(self, state, interval=0.1):
+        self.state = state              # state_store: source of motor targets
+        self.interval = interval
+        self.channels = {}              # machine_id -> CommandChannel
+        self._task = None
+
+    def attach(self, machine_id, channel):
+        self.channels[machine_id] = channel
+
+    def detach(self, machine_id, channel):
+        if self.channels.get(machine_id) is channel:
+            del self.channels[machine_id]
+
+    async def push(self, machine_id, speed):
+        """Immediate delivery when the machine is connected here. Returns the seq or None."""
+        channel = self.channels.get(machine_id)
+        if channel is None:
+            return None
+        try:
+            return await channel.push(speed)
+        except Exception as e:
+            log.warning("⚠️ Command send error", extra={"machine_id": machine_id, "error": str(e)})
+            return None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        # Picks up targets set on other workers (shared state backends) and resends unacked commands
+        while True:
+            await asyncio.sleep(self.interval)
+            for machine_id, channel in list(self.channels.items()):
+                try:
+                    await channel.push(self.state.get_motor(machine_id, 0))
+                    await channel.resend_due()
+                except Exception as e:
+                    log.warning("⚠️ Command send error",
+                                extra={"machine_id": machine_id, "error": str(e)})
@@ -2,9 +2,13 @@ import streamlit as st
 import requests
 import pandas as pd
 import time
+import json
+import threading
 
 # --- CONFIG ---
 API_URL = "https://dialysis-backend.onrender.com"
+LOG_REFRESH = 5.0   # Seconds between history fetches (shared by all viewers of a machine)
+LOG_WINDOW = 50     # Rows kept in the logs table
 
 st.set_page_config(page_title="Dialysis Monitor", layout="wide", page_icon="🩸")
 
@@ -29,10 +33,6 @@ if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
 if "latest_data" not in st.session_state:
     st.session_state.latest_data = {} # Start empty
-if "logs_df" not in st.session_state:
-    st.session_state.logs_df = pd.DataFrame()
-if "last_log_update" not in st.session_state:
-    st.session_state.last_log_update = 0
 if "session" not in st.session_state:
     st.session_state.session = requests.Session()
 
@@ -76,16 +76,73 @@ if st.sidebar.button("Logout"):
     st.session_state.authenticated = False
     st.rerun()
 
+# --- SHARED CACHES (across every browser session on this host) ---
+class HistoryWindow:
+    """Bounded, append-only log window for one machine.
+
+    Fetched incrementally with ?since=<newest timestamp>, at most once per
+    LOG_REFRESH no matter how many sessions are watching the machine. Sends
+    the last ETag, so a poll with nothing new is an empty 304.
+    """
+
+    def __init__(self, machine_id):
+        self.machine_id = machine_id
+        self.df = pd.DataFrame()
+        self.version = 0        # Bumped only when rows were added
+        self.last_fetch = 0.0
+        self.etag = None
+        self.lock = threading.Lock()
+
+    def refresh(self, session):
+        with self.lock:
+            if time.time() - self.last_fetch < LOG_REFRESH:
+                return
+            self.last_fetch = time.time()
+            params = {"format": "columnar"}    # Column lists: DataFrame without a dict per row
+            if not self.df.empty:
+                params["since"] = self.df["timestamp"].iloc[-1]
+            headers = {"If-None-Match": self.etag} if self.etag else None
+            resp = session.get(f"{API_URL}/history/{self.machine_id}", params=params,
+                               headers=headers, timeout=1.0)
+            if resp.status_code != 200:
+                return  # 304: nothing new since the last poll
+            self.etag = resp.headers.get("ETag")
+            new = pd.DataFrame(resp.json())
+            if new.empty:
+                return
+            if "since" not in params:
+                new = new.iloc[::-1]    # First load is newest first
+            df = pd.concat([self.df, new], ignore_index=True).drop_duplicates()
+            self.df = df.tail(LOG_WINDOW).reset_index(drop=True)
+            self.version += 1
+
+@st.cache_resource
+def http_session():
+    return requests.Session()
+
+@st.cache_resource
+def history_window(machine_id):
+    return HistoryWindow(machine_id)
+
+@st.cache_data(ttl=LOG_REFRESH, show_spinner=False)
+def channel_stats(machine_id):
+    try:
+        resp = http_session().get(f"{API_URL}/stats/{machine_id}", timeout=1.0)
+        if resp.status_code == 200:
+            return resp.json()["metrics"]
+    except:
+        pass
+    return {}
+
 # --- 3. MAIN DASHBOARD ---
 st.title("🩸 Kidney Dialysis Monitor")
-dashboard_placeholder = st.empty()
+metrics_placeholder = st.empty()
+st.markdown("---")
+logs_placeholder = st.empty()
 
-def render_ui():
-    """Draws the UI using data from Memory"""
-    data = st.session_state.latest_data
-    df = st.session_state.logs_df
-    
-    with dashboard_placeholder.container():
+def render_metrics(data, stats):
+    """Live cards + drift flags; only called when the sample or the stats changed"""
+    with metrics_placeholder.container():
         # Timestamp formatting
         ts = data.get("timestamp", "Waiting for Data...")
         if "T" in str(ts): ts = ts.replace("T", " ")[:19]
@@ -103,50 +160,69 @@ def render_ui():
         with r2c3: st.metric("🔽 Pressure", f"{data.get('pressure_Pa', 0)} Pa")
         with r2c4: st.metric("☁️ Humidity", f"{data.get('humidity', 0)} %")
 
-        st.markdown("---")
-        
-        # Logs Table
-        st.subheader("📜 Recent Logs (Updates every 5s)")
+        # Drift / anomaly flags from the backend's running statistics
+        flagged = [(m, s) for m, s in stats.items() if s["drifting"] or s["anomaly"]]
+        for m, s in flagged:
+            label = ("drifting ↑" if s["drift"] > 0 else "drifting ↓") if s["drifting"] else "outlier"
+            st.warning(f"📈 {m} {label} (drift {s['drift']:+.1f}σ, z {s['z']:+.1f}, "
+                       f"ewma {s['ewma']:.2f})")
+
+def render_logs(df):
+    """Logs table; only called when the shared window gained rows"""
+    with logs_placeholder.container():
+        st.subheader(f"📜 Recent Logs (Updates every {LOG_REFRESH:.0f}s)")
         if not df.empty:
             cols = ["timestamp", "current_mA", "ph", "turbidity", 
                     "pressure_Pa", "flow_rate", "temperature", "humidity"]
-            # Only show columns that actually exist
+            # Only show columns that actually exist, newest first
             valid_cols = [c for c in cols if c in df.columns]
-            st.dataframe(df[valid_cols], use_container_width=True, hide_index=True)
+            st.dataframe(df[valid_cols].iloc[::-1], use_container_width=True, hide_index=True)
         else:
             st.info("Loading logs from database...")
 
 # Initial Draw
-render_ui()
+window = history_window(machine_id)
+rendered = {"data": None, "stats": None, "logs": None}
+
+def redraw():
+    """Re-render only the parts whose data actually changed"""
+    data = st.session_state.latest_data
+    stats = channel_stats(machine_id)
+    if data is not rendered["data"] or stats is not rendered["stats"]:
+        render_metrics(data, stats)
+        rendered["data"], rendered["stats"] = data, stats
+    if window.version != rendered["logs"]:
+        render_logs(window.df)
+        rendered["logs"] = window.version
+
+redraw()
 
 # --- 4. DATA FETCH LOOP ---
-while True:
+def refresh_logs():
+    """SLOW LOOP: incremental history, shared with other viewers of this machine"""
     try:
-        # A. FAST LOOP: Get Status from RAM (Every 0.5s)
-        try:
-            resp = st.session_state.session.get(f"{API_URL}/machine-status/{machine_id}", timeout=0.2)
-            if resp.status_code == 200:
-                new_data = resp.json()
-                # Only update if we actually got data, otherwise keep old data
-                if "timestamp" in new_data or "temperature" in new_data:
-                    st.session_state.latest_data = new_data
-        except:
-            pass # Keep showing old data if request fails
-
-        # B. SLOW LOOP: Get History from DB (Every 5s)
-        current_time = time.time()
-        if current_time - st.session_state.last_log_update > 5.0:
-            try:
-                hist_resp = st.session_state.session.get(f"{API_URL}/history/{machine_id}", timeout=1.0)
-                if hist_resp.status_code == 200:
-                    st.session_state.logs_df = pd.DataFrame(hist_resp.json())
-                    st.session_state.last_log_update = current_time
-            except:
-                pass
+        window.refresh(http_session())
+    except:
+        pass
 
-        # C. Redraw
-        render_ui()
-        time.sleep(0.5)
+while True:
+    try:
+        # A. LIVE STATUS: pushed by the backend over SSE, no polling.
+        # Read timeout > server keepalive, so a dead stream reconnects.
+        with st.session_state.session.get(f"{API_URL}/stream/{machine_id}",
+                                          stream=True, timeout=(3, 20)) as stream:
+            for line in stream.iter_lines(decode_unicode=True):
+                if line and line.startswith("data: "):
+                    new_data = json.loads(line[6:])
+                    # Only update if we actually got data, otherwise keep old data
+                    if "timestamp" in new_data or "temperature" in new_data:
+                        st.session_state.latest_data = new_data
+
+                # B. History
+                refresh_logs()
+
+                # C. Redraw (no-op on keepalives and unchanged data)
+                redraw()
 
     except Exception as e:
-        time.sleep(1)
\ No newline at end of file
+        time.sleep(1) # Keep showing old data, then reconnect
@@ -0,0 +1,204 @@
+import json
+import math
+import os
+from telemetry import SEQ_FIELD, TS_FIELD
+
+# --- PER-MACHINE DOWNSAMPLING ---
+# Decides which samples (or in-memory aggregates) go to the write queue.
+# Each policy takes (timestamp, data) and returns a list of (timestamp, data)
+# rows to persist. Aggregation only touches numeric fields; the device's
+# seq / ts envelope is not a reading, so aggregates don't carry it.
+
+DEFAULT_POLICY = {"mode": "bucket", "seconds": 2.0, "agg": "mean"}
+
+
+def _number(name, value, minimum=0.0, inclusive=False):
+    """Validated policy parameter: a finite number above (or at) minimum."""
+    if type(value) not in (int, float) or not math.isfinite(value) or \
+            value < minimum or (value == minimum and not inclusive):
+        raise ValueError(f"{name} must be a number {'>=' if inclusive else '>'} {minimum}, got {value!r}")
+    return value
+
+
+def _numeric(data):
+    return {k: v for k, v in data.items()
+            if isinstance(v, (int, float)) and not isinstance(v, bool)
+            and k != SEQ_FIELD and k != TS_FIELD}
+
+
+class KeepAll:
+    """Full resolution: every sample is stored."""
+
+    def add(self, ts, data):
+        return [(ts, data)]
+
+    def flush(self):
+        return []
+
+
+class EveryNth:
+    """Stores one sample out of every n."""
+
+    def __init__(self, n=4):
+        if type(n) is not int or n < 1:
+            raise ValueError(f"n must be an integer >= 1, got {n!r}")
+        self.n = n
+        self.count = 0
+
+    def add(self, ts, data):
+        keep = self.count % self.n == 0
+        self.count += 1
+        return [(ts, data)] if keep else []
+
+    def flush(self):
+        return []
+
+
+class TimeBucket:
+    """Aggregates samples into fixed time buckets (mean, min or max per field)."""
+
+    def __init__(self, seconds=2.0, agg="mean"):
+        if agg not in ("mean", "min", "max"):
+            raise ValueError(f"Unknown aggregation: {agg}")
+        self.seconds = float(_number("seconds", seconds))
+        self.agg = agg
+        self.bucket = None      # Bucket start time
+        self.values = {}
+        self.counts = {}
+
+    def add(self, ts, data):
+        bucket = ts - (ts % self.seconds)
+        out = []
+        if self.bucket is not None and bucket != self.bucket:
+            out = self.flush()
+        self.bucket = bucket
+        for k, v in _numeric(data).items():
+            self.counts[k] = self.counts.get(k, 0) + 1
+            if k not in self.values:
+                self.values[k] = v
+            elif self.agg == "mean":
+                self.values[k] += v
+            elif self.agg == "min":
+                self.values[k] = min(self.values[k], v)
+            else:
+                self.values[k] = max(self.values[k], v)
+        return out
+
+    def flush(self):
+        if self.bucket is None or not self.values:
+            return []
+        if self.agg == "mean":
+            row = {k: v / self.counts[k] for k, v in self.values.items()}
+        else:
+            row = dict(self.values)
+        out = [(self.bucket, row)]
+        self.bucket, self.values, self.counts = None, {}, {}
+        return out
+
+
+class Deadband:
+    """Stores a sample only when a field moves past its threshold since the
+    last stored sample, plus a heartbeat row every max_interval seconds."""
+
+    def __init__(self, thresholds=None, default_threshold=0.01, max_interval=30.0):
+        thresholds = thresholds or {}
+        if not isinstance(thresholds, dict):
+            raise ValueError("thresholds must be an object of field -> absolute threshold")
+        for field, limit in thresholds.items():
+            _number(f"thresholds.{field}", limit, inclusive=True)
+        self.thresholds = thresholds
+        self.default_threshold = _number("default_threshold", default_threshold,
+                                         inclusive=True)  # Relative (1%) if no absolute given
+        self.max_interval = float(_number("max_interval", max_interval))
+        self.last = None
+        self.last_ts = 0.0
+
+    def _changed(self, data):
+        for k, v in _numeric(data).items():
+            prev = self.last.get(k)
+            if prev is None:
+                return True
+            limit = self.thresholds.get(k, abs(prev) * self.default_threshold)
+            if abs(v - prev) > limit:
+                return True
+        return False
+
+    def add(self, ts, data):
+        if self.last is None or ts - self.last_ts >= self.max_interval or self._changed(data):
+            self.last = _numeric(data)
+            self.last_ts = ts
+            return [(ts, data)]
+        return []
+
+    def flush(self):
+        return []
+
+
+POLICIES = {
+    "keep_all": KeepAll,
+    "every_nth": EveryNth,
+    "bucket": TimeBucket,
+    "deadband": Deadband,
+}
+
+
+def build_policy(spec):
+    """{"mode": "bucket", "seconds": 1, "agg": "max"} -> TimeBucket(1, "max")"""
+    spec = dict(spec)
+    mode = spec.pop("mode", "keep_all")
+    if mode not in POLICIES:
+        raise ValueError(f"Unknown downsampling mode: {mode}")
+    return POLICIES[mode](**spec)
+
+
+class DownsamplerRegistry:
+    """Per-machine policy config plus live policy state for connected machines."""
+
+    def __init__(self, config=None):
+        config = dict(config or {})
+        self.default = config.pop("default", DEFAULT_POLICY)
+        self.specs = config          # machine_id -> spec
+        self.active = {}             # machine_id -> policy instance
+
+        # Fail fast on a bad config file
+        build_policy(self.default)
+        for spec in self.specs.values():
+            build_policy(spec)
+
+    @classmethod
+    def from_env(cls):
+        """DOWNSAMPLE_CONFIG is inline JSON or a path to a JSON file."""
+        raw = os.getenv("DOWNSAMPLE_CONFIG", "")
+        if not raw:
+            return cls()
+        if os.path.exists(raw):
+            with open(raw) as f:
+                return cls(json.load(f))
+        return cls(json.loads(raw))
+
+    def spec_for(self, machine_id):
+        return self.specs.get(machine_id, self.default)
+
+    def set_spec(self, machine_id, spec):
+        build_policy(spec)  # Validate before swapping
+        self.specs[machine_id] = dict(spec)
+        # Flush the old policy so no aggregate is lost on reconfigure
+        old = self.active.pop(machine_id, None)
+        return old.flush() if old else []
+
+    def replay_policy(self, machine_id):
+        """A new policy instance with the machine's spec, to rerun over stored
+        samples; None for keep_all (nothing to rerun)."""
+        spec = self.spec_for(machine_id)
+        return None if spec.get("mode", "keep_all") == "keep_all" else build_policy(spec)
+
+    def add(self, machine_id, ts, data):
+        policy = self.active.get(machine_id)
+        if policy is None:
+            policy = self.active[machine_id] = build_policy(self.spec_for(machine_id))
+        return policy.add(ts, data)
+
+    def release(self, machine_id):
+        """Called on disconnect: drops the state and returns any pending aggregate."""
+        policy = self.active.pop(machine_id, None)
+        return policy.flush() if policy else []
@@ -0,0 +1,121 @@
+import csv
+import io
+import json
+from telemetry import METRICS
+
+# --- STREAMING EXPORT ENCODERS ---
+# Each encoder takes an async iterator of row chunks (tuples in COLUMNS
+# order, straight from a server-side cursor) and yields bytes as soon as a
+# chunk is encoded, so memory stays flat no matter how many rows there are.
+# Arrow / Parquet need pyarrow, imported only when those formats are asked for.
+
+COLUMNS = ("timestamp", *METRICS)
+
+FORMATS = {
+    # format: (media type, file extension)
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+async def encode_csv(chunks):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(COLUMNS)
+    async for rows in chunks:
+        writer.writerows(rows)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+
+async def encode_ndjson(chunks):
+    async for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(COLUMNS, row)), default=str) + "\n" for row in rows
+        ).encode()
+
+
+def _arrow_schema(pa):
+    return pa.schema([("timestamp", pa.timestamp("us"))] + [(m, pa.float32()) for m in METRICS])
+
+
+def _arrow_batch(pa, schema, rows):
+    columns = list(zip(*rows))
+    return pa.record_batch([pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                           schema=schema)
+
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever was written since last drain()."""
+
+    def __init__(self):
+        self.parts = []
+        self.pos = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        out = b"".join(self.parts)
+        self.parts = []
+        return out
+
+
+async def encode_arrow(chunks):
+    import pyarrow as pa
+    schema = _arrow_schema(pa)
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        async for rows in chunks:
+            writer.write_batch(_arrow_batch(pa, schema, rows))
+            yield sink.drain()
+    yield sink.drain()   # End-of-stream marker
+
+
+async def encode_parquet(chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = _arrow_schema(pa)
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        async for rows in chunks:
+            # One row group per chunk; the footer goes out when the writer closes
+            writer.write_batch(_arrow_batch(pa, schema, rows))
+            yield sink.drain()
+    yield sink.drain()
+
+
+ENCODERS = {
+    "csv": encode_csv,
+    "ndjson": encode_ndjson,
+    "arrow": encode_arrow,
+    "parquet": encode_parquet,
+}
+
+
+def check_format(fmt):
+    """Raises ValueError for unknown formats or a missing pyarrow."""
+    if fmt not in ENCODERS:
+        raise ValueError(f"Unknown export format: {fmt} (use {', '.join(ENCODERS)})")
+    if fmt in ("arrow", "parquet"):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError(f"'{fmt}' export needs pyarrow installed on the backend")
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+# --- PER-CONNECTION FRAME QUEUE ---
+# Joins a machine socket's receive task to its processing task. Items are
+# (perf_counter at receive, wall time at receive, payload). Bounded: when the
+# processor falls behind, an overloaded connection sheds frames (drop_oldest:
+# fresh telemetry beats stale; drop_newest: keep what is queued) instead of
+# letting the device's TCP buffers fill up. A frame that waited longer than
+# the latency budget puts the processor in catch-up: take() hands over the
+# whole backlog at once.
+#
+# close() never costs a queued frame: the processor drains what is left and
+# then gets None.
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
+
+
+class FrameQueue:
+    def __init__(self, maxsize, overflow="drop_oldest", latency_budget=0.25, counters=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.queue = asyncio.Queue(maxsize)
+        self.overflow = overflow
+        self.latency_budget = latency_budget
+        self.counters = counters if counters is not None else {}
+        self.closed = False
+
+    def _count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def offer(self, item):
+        """Receive side; never waits."""
+        if self.queue.full():
+            self._count("queue_dropped")
+            if self.overflow == "drop_newest":
+                return
+            self.queue.get_nowait()
+        self.queue.put_nowait(item)
+
+    def close(self):
+        """Socket gone: the processor finishes what is queued, then take() returns None."""
+        self.closed = True
+        if self.queue.empty():
+            self.queue.put_nowait(None)     # Wakes a processor waiting in take()
+
+    async def take(self):
+        """The next frame, or every queued frame if the oldest is over the latency
+        budget. None once closed and drained."""
+        if self.closed and self.queue.empty():
+            return None
+        item = await self.queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        if time.perf_counter() - item[0] > self.latency_budget:
+            while not self.queue.empty():
+                queued = self.queue.get_nowait()
+                if queued is not None:
+                    batch.append(queued)
+            self._count("late_frames", len(batch))
+        return batch
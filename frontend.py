@@ -2,6 +2,7 @@ import streamlit as st
 import requests
 import pandas as pd
 import time
+from datetime import datetime, timedelta, timezone
 
 # -----------------------------------------------------------------------------
 # CONFIGURATION
@@ -9,6 +10,10 @@ import time
 # Replace this with your actual Render Backend URL
 API_URL = "https://dialysis-backend.onrender.com"
 
+# Trend charts: a whole session at a bounded number of points
+TREND_HOURS = 4
+TREND_POINTS = 300
+
 st.set_page_config(
     page_title="Dialysis Remote Monitor",
     page_icon="🏥",
@@ -19,35 +24,31 @@ st.set_page_config(
 # HELPER FUNCTIONS
 # -----------------------------------------------------------------------------
 
-def get_machines():
-    """Fetch the list of active machines from the backend."""
+def get_ward_status(machine_ids=None):
+    """Latest snapshot of every bed (or just machine_ids) in one request."""
     try:
-        response = requests.get(f"{API_URL}/machines")
+        params = {"ids": ",".join(machine_ids)} if machine_ids else None
+        response = requests.get(f"{API_URL}/machines/status", params=params, timeout=3)
         if response.status_code == 200:
             return response.json()
         return []
     except:
         return []
 
-def get_latest_data(machine_id):
-    """Fetch the single most recent data point for the live cards."""
-    try:
-        response = requests.get(f"{API_URL}/data/{machine_id}")
-        if response.status_code == 200:
-            return response.json()
-        return None
-    except:
-        return None
-
-def get_history_data(machine_id):
-    """Fetch the last 100 data points for the trend graphs."""
+def get_history_data(machine_id, hours=TREND_HOURS):
+    """Fetch a downsampled trend window; the backend picks the rollup tier."""
+    start = datetime.now(timezone.utc) - timedelta(hours=hours)
     try:
-        response = requests.get(f"{API_URL}/history/{machine_id}")
+        response = requests.get(
+            f"{API_URL}/history/{machine_id}",
+            params={"from": start.isoformat(), "resolution": "auto", "points": TREND_POINTS,
+                    "format": "columnar"}
+        )
         if response.status_code == 200:
-            return response.json()
-        return []
+            return pd.DataFrame(response.json())    # Columns straight in, no row dicts
+        return pd.DataFrame()
     except:
-        return []
+        return pd.DataFrame()
 
 # -----------------------------------------------------------------------------
 # MAIN DASHBOARD UI
@@ -57,31 +58,64 @@ st.title("🏥 Renal Care - Remote Dialysis Monitor")
 st.markdown("Real-time telemetry and trend monitoring for ICU Units.")
 st.divider()
 
-# --- SIDEBAR: Machine Selection ---
+# --- SIDEBAR: View Selection ---
 st.sidebar.header("Control Panel")
-machines = get_machines()
+view = st.sidebar.radio("View", ["Ward Overview", "Bed Detail"])
+ward = get_ward_status()    # One request for every bed, whichever view is shown
 
-if not machines:
+if not ward:
     st.warning("⚠️ No machines detected. Please run the simulator.")
     st.stop() # Stop execution if no machines
 
-# Create a dropdown to select a machine
-machine_ids = [m['machine_id'] for m in machines]
-selected_machine = st.sidebar.selectbox("Select Patient Monitor:", machine_ids)
-
 # Add a manual refresh button
 if st.sidebar.button("🔄 Refresh Data"):
     st.rerun()
 
-# --- MAIN DISPLAY ---
+def alarm_badge(bed):
+    if any(a["severity"] == "critical" for a in bed["alarms"]):
+        return "🔴"
+    if bed["alarms"]:
+        return "🟠"
+    return "🟢" if bed["status"] else "⚪"
+
+# --- WARD OVERVIEW ---
+if view == "Ward Overview":
+    st.subheader(f"🛏️ Ward Overview ({len(ward)} beds)")
+    per_row = 5
+    for i in range(0, len(ward), per_row):
+        for col, bed in zip(st.columns(per_row), ward[i:i + per_row]):
+            with col.container(border=True):
+                st.markdown(f"**{alarm_badge(bed)} {bed['machine_id']}** · {bed['location'] or '—'}")
+                data = bed["status"]
+                if not data:
+                    st.caption("No data")
+                    continue
+                st.metric("🌡️ Temp", f"{data.get('temperature', 0)} °C")
+                st.metric("💧 Flow", f"{data.get('flow_rate', 0)} ml/min")
+                st.metric("🔽 Pressure", f"{data.get('pressure_Pa', 0)} Pa")
+                for alarm in bed["alarms"]:
+                    st.caption(f"🚨 {alarm['rule']}")
+    time.sleep(2)
+    st.rerun()
+
+# --- BED DETAIL ---
+machine_ids = [bed["machine_id"] for bed in ward]
+selected_machine = st.sidebar.selectbox("Select Patient Monitor:", machine_ids)
+bed = next(b for b in ward if b["machine_id"] == selected_machine)
 
-# 1. Fetch Data
-current_data = get_latest_data(selected_machine)
+# 1. Fetch Data (live values + alarms came with the ward snapshot)
+current_data = bed["status"]
+alarms = bed["alarms"]
+alarm_metrics = {a["metric"] for a in alarms}
 history_data = get_history_data(selected_machine)
 
 # 2. Display Live Metrics (The "Now" View)
 st.subheader(f"📍 Live Status: {selected_machine}")
 
+for alarm in alarms:
+    show = st.error if alarm["severity"] == "critical" else st.warning
+    show(f"🚨 {alarm['rule']}: {alarm['metric']} = {alarm['value']}")
+
 if current_data:
     # Create 3 columns for big numbers
     col1, col2, col3 = st.columns(3)
@@ -89,9 +123,9 @@ if current_data:
     with col1:
         st.metric(
             label="🌡️ Temperature",
-            value=f"{current_data.get('temperature', 0)} °F",
-            delta="Normal" if 97 < current_data.get('temperature', 0) < 99 else "Warning",
-            delta_color="normal" if 97 < current_data.get('temperature', 0) < 99 else "inverse"
+            value=f"{current_data.get('temperature', 0)} °C",
+            delta="Warning" if "temperature" in alarm_metrics else "Normal",
+            delta_color="inverse" if "temperature" in alarm_metrics else "normal"
         )
     
     with col2:
@@ -111,11 +145,10 @@ else:
 
 # 3. Display History Graphs (The "Trend" View)
 st.divider()
-st.subheader("📈 Patient Trends (Last 100 Readings)")
+st.subheader(f"📈 Patient Trends (Last {TREND_HOURS} Hours)")
 
-if history_data:
-    # Convert the JSON list to a Pandas DataFrame (Excel sheet format)
-    df = pd.DataFrame(history_data)
+if not history_data.empty:
+    df = history_data
     
     # Convert timestamp string to datetime objects for better graphing
     if 'timestamp' in df.columns:
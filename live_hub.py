@@ -0,0 +1,67 @@
+import asyncio
+from serialization import dumps_str
+
+# --- LIVE STATUS FAN-OUT ---
+# websocket_endpoint publishes every sample here; viewers subscribe per
+# machine. Each subscriber holds only the latest frame, so a slow viewer
+# skips stale frames instead of building a backlog. Machines ingested by
+# another worker are published by the state store (see follow()).
+
+
+class Subscriber:
+    __slots__ = ("latest", "event", "skipped")
+
+    def __init__(self):
+        self.latest = None
+        self.event = asyncio.Event()
+        self.skipped = 0
+
+    def offer(self, frame):
+        if self.latest is not None:
+            self.skipped += 1   # Coalesced: viewer never saw the previous frame
+        self.latest = frame
+        self.event.set()
+
+    async def next(self, timeout=None):
+        """Waits for the newest frame. Returns None on timeout."""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self.event.clear()
+        frame, self.latest = self.latest, None
+        return frame
+
+
+class LiveHub:
+    def __init__(self):
+        self.subscribers = {}   # machine_id -> set of Subscriber
+        self.published = 0
+
+    def subscribe(self, machine_id):
+        sub = Subscriber()
+        self.subscribers.setdefault(machine_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, machine_id, sub):
+        subs = self.subscribers.get(machine_id)
+        if subs:
+            subs.discard(sub)
+            if not subs:
+                del self.subscribers[machine_id]
+
+    def publish(self, machine_id, data):
+        subs = self.subscribers.get(machine_id)
+        if not subs:
+            return
+        frame = dumps_str(data)  # Encode once, share with every viewer
+        for sub in subs:
+            sub.offer(frame)
+        self.published += 1
+
+    def stats(self):
+        return {
+            "published": self.published,
+            "viewers": {m: len(s) for m, s in self.subscribers.items()},
+            "coalesced": sum(sub.skipped for s in self.subscribers.values() for sub in s),
+        }
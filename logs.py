@@ -0,0 +1,61 @@
+import json
+import logging
+import os
+import sys
+import time
+
+# --- STRUCTURED LOGGING ---
+# Leveled replacement for the print() calls: LOG_LEVEL=WARNING in production
+# drops connect/disconnect chatter before any formatting or I/O happens.
+# Fields passed as extra={...} come out as key=value pairs (LOG_FORMAT=text)
+# or as JSON keys (LOG_FORMAT=json), e.g.
+#
+#   log.info("✅ Connected", extra={"machine_id": "M1", "format": "binary"})
+
+_STANDARD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+def _fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _STANDARD}
+
+
+class TextFormatter(logging.Formatter):
+    converter = time.gmtime     # UTC, like the DB timestamps
+
+    def format(self, record):
+        line = f"{self.formatTime(record)} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **_fields(record),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure(level=None, fmt=None):
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = fmt or os.getenv("LOG_FORMAT", "text")
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    root = logging.getLogger("dialysis")
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    root.propagate = False
+
+
+def get_logger(name):
+    return logging.getLogger(f"dialysis.{name}")
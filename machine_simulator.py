@@ -1,10 +1,17 @@
+import argparse
 import asyncio
 import websockets
 import json
+import os
 import random
+import time
+from telemetry import BINARY_SUBPROTOCOLS, SensorReading, encode_frame
 
-# Localhost URL
-WS_URL = "wss://dialysis-backend.onrender.com/ws/machine/M1"
+# Render deployment by default; pass --url ws://localhost:8000 for a local backend
+BASE_URL = os.getenv("SIM_URL", "wss://dialysis-backend.onrender.com")
+
+# "json" (default) or "binary": packed float32 frames, negotiated via subprotocol
+WIRE_FORMAT = os.getenv("SIM_FORMAT", "json")
 
 def get_data():
     return {
@@ -17,36 +24,164 @@ def get_data():
         "humidity": int(random.uniform(40, 60))
     }
 
-async def run_persistent():
-    while True:
-        try:
-            print(f"🔌 Connecting to {WS_URL}...")
-            # ping_interval=None prevents timeouts during slow operations
-            async with websockets.connect(WS_URL, ping_interval=None) as ws:
-                print("✅ Connected! Streaming data...")
-                
-                while True:
-                    data = get_data()
-                    await ws.send(json.dumps(data))
-                    print(f"📤 Sent Fast: Temp={data['temperature']}C")
-                    
+# --- FLEET ---
+class FleetStats:
+    """Counters shared by every simulated machine (read by bench_ingest.py)."""
+
+    def __init__(self):
+        self.samples = 0
+        self.frames = 0
+        self.bytes = 0
+        self.connects = 0
+        self.disconnects = 0
+        self.commands = 0
+        self.command_watch = {}     # machine_id -> (speed, posted_at), set by the benchmark
+        self.command_rtts = []      # ms from POST /set-motor to command on the device
+
+class SimMachine:
+    def __init__(self, machine_id, base_url=BASE_URL, rate=2.0, batch=1,
+                 fmt=WIRE_FORMAT, pad=0, stats=None, verbose=False):
+        self.machine_id = machine_id
+        self.url = f"{base_url.rstrip('/')}/ws/machine/{machine_id}"
+        self.interval = batch / rate    # Seconds between frames
+        self.batch = batch
+        self.fmt = fmt
+        self.pad = "x" * pad            # Extra JSON payload to test larger messages
+        self.stats = stats or FleetStats()
+        self.verbose = verbose
+        self.motor_speed = 0
+        self.seq = 0                    # Device sample counter, survives reconnects
+        self.wire_version = None        # Binary frame version the backend agreed to
+
+    async def listen(self, ws):
+        """Applies motor commands as soon as they arrive and acknowledges them."""
+        async for msg in ws:
+            cmd = json.loads(msg)
+            if "motor_speed" in cmd:
+                self.motor_speed = cmd["motor_speed"]
+                self.stats.commands += 1
+                watched = self.stats.command_watch.get(self.machine_id)
+                if watched and watched[0] == self.motor_speed:
+                    self.stats.command_rtts.append((time.perf_counter() - watched[1]) * 1000)
+                    del self.stats.command_watch[self.machine_id]
+                if self.verbose:
+                    print(f"   ⚙️ Motor Speed: {cmd['motor_speed']}%")
+            if cmd.get("type") == "command":
+                await ws.send(json.dumps({"type": "ack", "seq": cmd["seq"]}))
+
+    def capture(self):
+        """One sample, numbered and stamped like real hardware would."""
+        self.seq += 1
+        return SensorReading(**get_data(), seq=self.seq, ts=time.time())
+
+    def next_frame(self):
+        # ts also lets the benchmark time sample -> visible to viewers
+        samples = [self.capture() for _ in range(self.batch)]
+        if self.fmt == "binary":
+            return samples, encode_frame(samples, version=self.wire_version)
+        payload = [s.as_dict() for s in samples]
+        if self.pad:
+            payload[-1]["pad"] = self.pad
+        return samples, json.dumps(payload if self.batch > 1 else payload[0])
+
+    async def run(self, stop=None):
+        stop = stop or asyncio.Event()
+        while not stop.is_set():
+            try:
+                if self.verbose:
+                    print(f"🔌 Connecting to {self.url}...")
+                # ping_interval=None prevents timeouts during slow operations
+                offer = list(BINARY_SUBPROTOCOLS) if self.fmt == "binary" else None
+                async with websockets.connect(self.url, ping_interval=None, subprotocols=offer) as ws:
+                    # Older backends don't accept the subprotocol: fall back to JSON
+                    if self.fmt == "binary":
+                        if ws.subprotocol in BINARY_SUBPROTOCOLS:
+                            self.wire_version = BINARY_SUBPROTOCOLS[ws.subprotocol]
+                        else:
+                            self.fmt = "json"
+                    self.stats.connects += 1
+                    if self.verbose:
+                        print(f"✅ Connected! Streaming {self.fmt} data...")
+                    listener = asyncio.create_task(self.listen(ws))
+
                     try:
-                        msg = await asyncio.wait_for(ws.recv(), timeout=0.1)
-                        cmd = json.loads(msg)
-                        if "motor_speed" in cmd:
-                            print(f"   ⚙️ Motor Speed: {cmd['motor_speed']}%")
-                    except asyncio.TimeoutError:
-                        pass
-                    
-                    # FAST SPEED: 0.5s
-                    await asyncio.sleep(0.5)
-
-        except Exception as e:
-            print("❌ Connection Lost. Retrying...")
-            await asyncio.sleep(3)
+                        next_at = time.monotonic()
+                        while not stop.is_set():
+                            samples, frame = self.next_frame()
+                            await ws.send(frame)
+                            self.stats.frames += 1
+                            self.stats.samples += len(samples)
+                            self.stats.bytes += len(frame)
+                            if self.verbose:
+                                print(f"📤 Sent Fast: Temp={samples[-1].temperature}C")
+
+                            # Fixed schedule so slow sends don't lower the rate
+                            next_at += self.interval
+                            await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+                    finally:
+                        listener.cancel()
+
+            except Exception as e:
+                self.stats.disconnects += 1
+                if self.verbose:
+                    print("❌ Connection Lost. Retrying...")
+                if not stop.is_set():
+                    await asyncio.sleep(random.uniform(1, 3))  # Jitter: no reconnect storm
+
+def build_fleet(count, prefix="M", stats=None, **kwargs):
+    stats = stats or FleetStats()
+    return stats, [SimMachine(f"{prefix}{i}", stats=stats, **kwargs) for i in range(1, count + 1)]
+
+async def run_fleet(machines, duration=None, stop=None):
+    """Runs every machine, start times spread over one send interval."""
+    stop = stop or asyncio.Event()
+
+    async def start(m):
+        await asyncio.sleep(random.uniform(0, m.interval))
+        await m.run(stop)
+
+    tasks = [asyncio.create_task(start(m)) for m in machines]
+    if duration:
+        await asyncio.sleep(duration)
+        stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def report(stats, every=5.0):
+    last, last_t = 0, time.monotonic()
+    while True:
+        await asyncio.sleep(every)
+        now = time.monotonic()
+        rate = (stats.samples - last) / (now - last_t)
+        last, last_t = stats.samples, now
+        print(f"📊 {rate:,.0f} samples/s | sent {stats.samples:,} | "
+              f"connects {stats.connects} | drops {stats.disconnects}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Simulated dialysis machines")
+    parser.add_argument("--url", default=BASE_URL, help="Backend base URL (ws:// or wss://)")
+    parser.add_argument("--machines", type=int, default=1)
+    parser.add_argument("--prefix", default="M", help="Machine ids are <prefix>1..<prefix>N")
+    parser.add_argument("--rate", type=float, default=2.0, help="Samples per second per machine")
+    parser.add_argument("--batch", type=int, default=1, help="Samples per frame")
+    parser.add_argument("--format", choices=["json", "binary"], default=WIRE_FORMAT)
+    parser.add_argument("--pad", type=int, default=0, help="Extra bytes per JSON frame")
+    parser.add_argument("--duration", type=float, default=None, help="Seconds (default: forever)")
+    parser.add_argument("--quiet", action="store_true")
+    return parser.parse_args()
+
+async def main(args):
+    verbose = args.machines == 1 and not args.quiet
+    stats, machines = build_fleet(args.machines, args.prefix, base_url=args.url, rate=args.rate,
+                                  batch=args.batch, fmt=args.format, pad=args.pad, verbose=verbose)
+    reporter = None if verbose else asyncio.create_task(report(stats))
+    try:
+        await run_fleet(machines, args.duration)
+    finally:
+        if reporter:
+            reporter.cancel()
 
 if __name__ == "__main__":
     try:
-        asyncio.run(run_persistent())
+        asyncio.run(main(parse_args()))
     except KeyboardInterrupt:
-        print("\n🛑 Stopped")
\ No newline at end of file
+        print("\n🛑 Stopped")
@@ -0,0 +1,379 @@
+import argparse
+import os
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
+from dotenv import load_dotenv
+from rollups import TIERS, rollup_table_ddl, table_name
+from sessions import session_table_ddl
+
+# --- VERSIONED SCHEMA MIGRATIONS ---
+# One ordered list of migrations, applied once each and recorded in
+# schema_migrations. Runs against TiDB/MySQL, or SQLite as a local stand-in
+# (partitioning steps are skipped there and retention falls back to DELETE).
+#
+#   python migrate.py                      # apply pending migrations
+#   python migrate.py status
+#   python migrate.py partitions --days-ahead 7
+#   python migrate.py prune --retention-days 90 --rollup-retention-days 30
+#   python migrate.py --sqlite local.db    # same commands on SQLite
+
+load_dotenv()
+
+PARTITIONED_TABLE = "sensor_logs"
+# Daily RANGE-partitioned tables -> partitioning column. The 1 s rollup tier
+# grows at about the raw row rate, so it is partitioned and pruned the same
+# way (on its own, shorter retention); 1 min / 15 min stay small and are kept.
+PARTITIONED_TABLES = {PARTITIONED_TABLE: "timestamp", table_name("1s"): "bucket_start"}
+
+
+class Database:
+    """Thin wrapper hiding the MySQL / SQLite differences the migrations care about."""
+
+    def __init__(self, conn, dialect):
+        self.conn = conn
+        self.dialect = dialect
+
+    @classmethod
+    def connect(cls, sqlite_path=None):
+        if sqlite_path:
+            return cls(sqlite3.connect(sqlite_path), "sqlite")
+        import mysql.connector
+        conn = mysql.connector.connect(
+            host=os.getenv("DB_HOST"),
+            port=os.getenv("DB_PORT"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            database=os.getenv("DB_NAME", "test"),
+            ssl_disabled=False
+        )
+        return cls(conn, "mysql")
+
+    def execute(self, sql, params=()):
+        if self.dialect == "sqlite":
+            sql = sql.replace("%s", "?")
+        cursor = self.conn.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall() if cursor.description else []
+        cursor.close()
+        return rows
+
+    def columns(self, table):
+        if self.dialect == "sqlite":
+            return {row[1] for row in self.execute(f"PRAGMA table_info({table})")}
+        rows = self.execute("""
+            SELECT COLUMN_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        """, (table,))
+        return {row[0] for row in rows}
+
+    def add_column(self, table, definition):
+        """Adds a column unless it already exists (older trees ran update_db.py)."""
+        name = definition.split()[0]
+        if name in self.columns(table):
+            return False
+        self.execute(f"ALTER TABLE {table} ADD COLUMN {definition}")
+        return True
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+# --- MIGRATIONS ---
+def m001_baseline(db):
+    auto_pk = ("INTEGER PRIMARY KEY AUTOINCREMENT" if db.dialect == "sqlite"
+               else "INT AUTO_INCREMENT PRIMARY KEY")
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS doctors (
+        username VARCHAR(50) PRIMARY KEY,
+        password VARCHAR(50) NOT NULL
+    )
+    """)
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS machines (
+        machine_id VARCHAR(20) PRIMARY KEY,
+        location VARCHAR(100),
+        is_active BOOLEAN DEFAULT FALSE
+    )
+    """)
+    db.execute(f"""
+    CREATE TABLE IF NOT EXISTS sensor_logs (
+        id {auto_pk},
+        machine_id VARCHAR(20),
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        temperature FLOAT,
+        flow_rate FLOAT,
+        turbidity FLOAT,
+        ph FLOAT,
+        conductivity FLOAT,
+        blood_leak BOOLEAN,
+        total_volume FLOAT,
+        FOREIGN KEY (machine_id) REFERENCES machines(machine_id)
+    )
+    """)
+
+
+def m002_telemetry_columns(db):
+    # Formerly update_db.py + add_column.py
+    for col in [
+        "current_mA FLOAT DEFAULT 0",
+        "ph FLOAT DEFAULT 7.0",
+        "turbidity FLOAT DEFAULT 0",
+        "pressure_Pa FLOAT DEFAULT 0",
+        "flow_rate FLOAT DEFAULT 0",
+        "temperature FLOAT DEFAULT 0",
+        "humidity FLOAT DEFAULT 0",
+        "heart_rate FLOAT DEFAULT 0",
+    ]:
+        db.add_column("sensor_logs", col)
+    db.add_column("machines", "motor_speed INT DEFAULT 0")
+
+
+def m003_rollup_tables(db):
+    for tier, _ in TIERS:
+        db.execute(rollup_table_ddl(tier))
+
+
+def m004_history_index(db):
+    # Serves WHERE machine_id = ? ORDER BY timestamp as an index range scan
+    db.execute("CREATE INDEX idx_sensor_logs_machine_ts ON sensor_logs (machine_id, timestamp)")
+
+
+def m005_partition_sensor_logs(db):
+    """Daily RANGE partitions so retention is DROP PARTITION, not DELETE."""
+    if db.dialect != "mysql":
+        return
+    # Partitioned InnoDB tables cannot carry foreign keys, and every unique
+    # key must include the partitioning column.
+    for (fk,) in db.execute("""
+        SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS
+        WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = 'sensor_logs'
+    """):
+        db.execute(f"ALTER TABLE sensor_logs DROP FOREIGN KEY {fk}")
+    db.execute("UPDATE sensor_logs SET timestamp = CURRENT_TIMESTAMP WHERE timestamp IS NULL")
+    db.execute("""
+        ALTER TABLE sensor_logs
+        MODIFY timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        DROP PRIMARY KEY,
+        ADD PRIMARY KEY (id, timestamp)
+    """)
+    _partition_by_day(db, "sensor_logs", "timestamp")
+
+
+def m006_ingest_ids(db):
+    """Per-sample ingest_id so replaying the write-ahead log is idempotent."""
+    db.add_column("sensor_logs", "ingest_id BIGINT NULL")
+    # Must include the partitioning column on MySQL; old rows stay NULL (not unique-checked)
+    db.execute("CREATE UNIQUE INDEX uq_sensor_logs_ingest ON sensor_logs (ingest_id, timestamp)")
+
+
+def m007_sequence_columns(db):
+    """Device sample counter and capture time, next to the receive-time timestamp."""
+    db.add_column("sensor_logs", "seq BIGINT NULL")
+    db.add_column("sensor_logs", "device_ts DATETIME(3) NULL")
+
+
+def m008_treatment_sessions(db):
+    """One row per treatment, summary maintained by the backend during ingest."""
+    db.execute(session_table_ddl())
+    db.execute("CREATE INDEX idx_treatment_sessions_machine ON treatment_sessions (machine_id, started_at)")
+
+
+def m009_rollup_write_ids(db):
+    """Rollup buckets stored as parts keyed by write_id, so WAL replay can't double-count."""
+    for tier, _ in TIERS:
+        table = table_name(tier)
+        columns = db.columns(table)
+        if "write_id" in columns:
+            continue
+        # The primary key changes: rebuild (works on MySQL and SQLite alike)
+        db.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+        db.execute(rollup_table_ddl(tier))
+        keep = ", ".join(sorted(columns))
+        db.execute(f"INSERT INTO {table} ({keep}) SELECT {keep} FROM {table}_old")
+        db.execute(f"DROP TABLE {table}_old")
+
+
+def m010_partition_rollup_1s(db):
+    """Daily partitions on the 1 s rollup tier, pruned like sensor_logs."""
+    if db.dialect != "mysql":
+        return
+    # bucket_start is already in the primary key; no foreign keys
+    _partition_by_day(db, table_name("1s"), "bucket_start")
+
+
+MIGRATIONS = [
+    (1, "baseline tables", m001_baseline),
+    (2, "telemetry columns", m002_telemetry_columns),
+    (3, "rollup tables", m003_rollup_tables),
+    (4, "composite (machine_id, timestamp) index", m004_history_index),
+    (5, "daily partitions on sensor_logs", m005_partition_sensor_logs),
+    (6, "idempotent ingest ids", m006_ingest_ids),
+    (7, "device seq / capture time", m007_sequence_columns),
+    (8, "treatment sessions", m008_treatment_sessions),
+    (9, "rollup bucket parts (write_id)", m009_rollup_write_ids),
+    (10, "daily partitions on the 1s rollup tier", m010_partition_rollup_1s),
+]
+
+
+# --- RUNNER ---
+def ensure_version_table(db):
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    db.commit()
+
+
+def applied_versions(db):
+    ensure_version_table(db)
+    return {row[0] for row in db.execute("SELECT version FROM schema_migrations")}
+
+
+def upgrade(db):
+    """Applies pending migrations in order; stops at the first failure."""
+    done = applied_versions(db)
+    applied = []
+    for version, name, fn in MIGRATIONS:
+        if version in done:
+            continue
+        print(f"🛠  Applying {version:03d} {name}...")
+        # DDL auto-commits on MySQL, so a failure here leaves the version
+        # unrecorded and the error is raised for the operator to fix.
+        fn(db)
+        db.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        db.commit()
+        applied.append(version)
+    return applied
+
+
+def status(db):
+    done = applied_versions(db)
+    return [(version, name, version in done) for version, name, _ in MIGRATIONS]
+
+
+# --- PARTITION MAINTENANCE ---
+def _partition_def(day):
+    return f"PARTITION p{day:%Y%m%d} VALUES LESS THAN (TO_DAYS('{day + timedelta(days=1)}'))"
+
+
+def _partition_by_day(db, table, column):
+    """p_old for everything before today, a week of daily partitions, pmax."""
+    today = datetime.now(timezone.utc).date()
+    days = [today + timedelta(days=i) for i in range(8)]
+    parts = [f"PARTITION p_old VALUES LESS THAN (TO_DAYS('{today}'))"]
+    parts += [_partition_def(d) for d in days]
+    parts.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    db.execute(f"ALTER TABLE {table} PARTITION BY RANGE (TO_DAYS({column})) ({', '.join(parts)})")
+
+
+def _partitions(db, table=PARTITIONED_TABLE):
+    return [row[0] for row in db.execute("""
+        SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """, (table,))]
+
+
+def _partition_day(name):
+    try:
+        return datetime.strptime(name[1:], "%Y%m%d").date()
+    except ValueError:
+        return None     # p_old / pmax
+
+
+def _partition_bounds(db, table=PARTITIONED_TABLE):
+    """[(name, first day NOT in the partition)]; None for pmax (MAXVALUE)."""
+    rows = db.execute("""
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """, (table,))
+    # LESS THAN (TO_DAYS(d)) is stored as the day number; TO_DAYS('0001-01-01') = 366
+    return [(name, None if not str(bound).isdigit() else date.fromordinal(int(bound) - 365))
+            for name, bound in rows]
+
+
+def expired_partitions(bounds, cutoff):
+    """Partitions whose every row is older than cutoff. p_old (everything from
+    before the partitioning migration) only goes once the migration day itself
+    is past the retention window."""
+    old = [name for name, upper in bounds if upper is not None and upper <= cutoff]
+    # A range-partitioned table must keep at least one partition
+    return [n for n in old if bounds and n != bounds[-1][0]]
+
+
+def ensure_partitions(db, days_ahead=7, table=PARTITIONED_TABLE):
+    """Splits pmax so there is a daily partition up to days_ahead from today."""
+    if db.dialect != "mysql":
+        return []
+    days = [d for d in map(_partition_day, _partitions(db, table)) if d]
+    if not days:
+        return []
+    target = datetime.now(timezone.utc).date() + timedelta(days=days_ahead)
+    new_days = []
+    day = max(days) + timedelta(days=1)
+    while day <= target:
+        new_days.append(day)
+        day += timedelta(days=1)
+    if new_days:
+        defs = [_partition_def(d) for d in new_days]
+        defs.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+        db.execute(f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ({', '.join(defs)})")
+    return new_days
+
+
+def prune(db, retention_days, table=PARTITIONED_TABLE):
+    """Drops whole partitions older than the retention window.
+    On SQLite (no partitions) this is a plain DELETE."""
+    cutoff = datetime.now(timezone.utc).date() - timedelta(days=retention_days)
+    if db.dialect != "mysql":
+        db.execute(f"DELETE FROM {table} WHERE {PARTITIONED_TABLES[table]} < %s", (str(cutoff),))
+        db.commit()
+        return []
+
+    old = expired_partitions(_partition_bounds(db, table), cutoff)
+    if old:
+        db.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(old)}")
+    return old
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dialysis DB schema migrations")
+    parser.add_argument("command", nargs="?", default="upgrade",
+                        choices=["upgrade", "status", "partitions", "prune"])
+    parser.add_argument("--sqlite", help="Run against a local SQLite file instead of TiDB")
+    parser.add_argument("--days-ahead", type=int, default=7)
+    parser.add_argument("--retention-days", type=int, default=90)
+    parser.add_argument("--rollup-retention-days", type=int, default=30,
+                        help=f"Retention of {table_name('1s')} (coarser tiers are kept)")
+    args = parser.parse_args()
+
+    db = Database.connect(args.sqlite)
+    try:
+        if args.command == "upgrade":
+            applied = upgrade(db)
+            print(f"🎉 Applied {len(applied)} migration(s)." if applied else "✅ Schema up to date.")
+        elif args.command == "status":
+            for version, name, done in status(db):
+                print(f"{'✅' if done else '⏳'} {version:03d} {name}")
+        elif args.command == "partitions":
+            for table in PARTITIONED_TABLES:
+                added = ensure_partitions(db, args.days_ahead, table)
+                print(f"✅ {table}: added {len(added)} daily partition(s).")
+        elif args.command == "prune":
+            retention = {PARTITIONED_TABLE: args.retention_days, table_name("1s"): args.rollup_retention_days}
+            for table, days in retention.items():
+                dropped = prune(db, days, table)
+                print(f"🧹 {table}: dropped partitions: {', '.join(dropped) or 'none'}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
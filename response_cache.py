@@ -0,0 +1,65 @@
+import os
+import time
+import zlib
+from collections import OrderedDict
+
+# --- RESPONSE CACHE (ETag / If-None-Match) ---
+# Serialized JSON bodies per (machine, request), each tagged with the
+# machine's version at the time it was built. Ingest bumps the version (an
+# int increment, nothing is scanned), which makes every cached body for that
+# machine stale at once. The TTL bounds staleness for data this worker can't
+# see change: machines ingested by another worker, and the DB itself.
+#
+# ETags are a hash of the body, so they stay valid across workers and
+# restarts: a poll whose If-None-Match still matches gets a bodiless 304.
+
+
+class CachedBody:
+    __slots__ = ("body", "etag", "headers", "version", "expires")
+
+    def __init__(self, body, headers, version, expires):
+        self.body = body
+        self.etag = f'"{zlib.crc32(body):08x}-{len(body):x}"'
+        self.headers = headers
+        self.version = version
+        self.expires = expires
+
+
+class ResponseCache:
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self.versions = {}          # machine_id -> int, bumped per ingested frame
+        self.entries = OrderedDict()    # (machine_id, key) -> CachedBody, LRU order
+        self.counters = {"hits": 0, "misses": 0, "not_modified": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(int(os.getenv("RESPONSE_CACHE_ENTRIES", 2048)))
+
+    def bump(self, machine_id):
+        self.versions[machine_id] = self.versions.get(machine_id, 0) + 1
+
+    def version(self, machine_id):
+        return self.versions.get(machine_id, 0)
+
+    def get(self, machine_id, key):
+        entry = self.entries.get((machine_id, key))
+        if entry is None or entry.version != self.versions.get(machine_id, 0) \
+                or entry.expires < time.monotonic():
+            self.counters["misses"] += 1
+            return None
+        self.entries.move_to_end((machine_id, key))
+        self.counters["hits"] += 1
+        return entry
+
+    def put(self, machine_id, key, body, headers, ttl, version):
+        """version: read before the body was built, so ingest during an await invalidates it."""
+        entry = CachedBody(body, headers, version, time.monotonic() + ttl)
+        self.entries[(machine_id, key)] = entry
+        self.entries.move_to_end((machine_id, key))
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    def stats(self):
+        return {**self.counters, "entries": len(self.entries), "machines": len(self.versions)}
@@ -0,0 +1,171 @@
+from datetime import datetime, timezone
+import numpy as np
+from telemetry import METRICS
+
+# --- RECENT-HISTORY RING BUFFERS ---
+# The last N minutes of every sample, per machine, in preallocated NumPy
+# arrays (float64 timestamps + float32 channels, NaN = missing). Recent
+# history queries are answered from here; the DB is only asked for ranges
+# older than what the buffer holds. Rings are freed when the machine
+# disconnects (the DB has everything by then).
+#
+# The buffer holds every sample, but sensor_logs only what the machine's
+# downsampling policy kept: raw-row answers take that policy (a fresh
+# instance, replayed over the window) so both sources have one resolution.
+# Bucketed answers come from every sample, like the rollup tables.
+
+
+def _to_datetime(ts):
+    # Same shape as DB rows: naive UTC
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+
+def _clean(v):
+    # float32 noise off, NaN -> None
+    return None if v != v else round(float(v), 3)
+
+
+class MachineRing:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.ts = np.zeros(capacity, dtype=np.float64)
+        self.values = np.full((capacity, len(METRICS)), np.nan, dtype=np.float32)
+        self.head = 0       # Next slot to write
+        self.count = 0
+
+    def append(self, ts, data):
+        i = self.head
+        try:
+            self.values[i] = [data.get(m, np.nan) for m in METRICS]
+        except (TypeError, ValueError):
+            return  # Non-numeric payload: not worth a history slot
+        self.ts[i] = ts
+        self.head = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    @property
+    def oldest(self):
+        if not self.count:
+            return None
+        return self.ts[(self.head - self.count) % self.capacity]
+
+    def _ordered(self):
+        """Oldest -> newest views (copies only when the buffer has wrapped)."""
+        if self.count < self.capacity:
+            return self.ts[:self.count], self.values[:self.count]
+        idx = np.arange(self.head, self.head + self.capacity) % self.capacity
+        return self.ts[idx], self.values[idx]
+
+    def covers(self, start_ts):
+        return self.count > 0 and self.oldest <= start_ts
+
+    def latest_rows(self, n, policy=None):
+        """Newest first, like ORDER BY timestamp DESC LIMIT n."""
+        if policy is not None:
+            return self.raw_rows(-np.inf, np.inf, self.count, policy=policy)[-n:][::-1]
+        ts, values = self._ordered()
+        ts, values = ts[-n:][::-1], values[-n:][::-1]
+        return [self._row(t, v) for t, v in zip(ts, values)]
+
+    def raw_rows(self, start_ts, end_ts, limit, inclusive=True, policy=None, newest=False):
+        """Oldest first; inclusive=False excludes start_ts itself (a since= cursor).
+        With a downsampling policy: the rows it closes (what the DB writer got).
+        newest=True keeps the newest `limit` rows of the range instead of the oldest."""
+        ts, values = self._ordered()
+        lo = np.searchsorted(ts, start_ts, side="left" if inclusive else "right")
+        hi = np.searchsorted(ts, end_ts, side="right")
+        if policy is None:
+            if newest:
+                lo = max(lo, hi - limit)
+            else:
+                hi = min(hi, lo + limit)
+            return [self._row(t, v) for t, v in zip(ts[lo:hi], values[lo:hi])]
+
+        rows = []
+        for t, v in zip(ts[lo:hi].tolist(), values[lo:hi].tolist()):
+            data = {m: x for m, x in zip(METRICS, v) if x == x}
+            for row_ts, row in policy.add(t, data):
+                # A bucket that started before the window only saw part of its samples
+                if row_ts > start_ts or (inclusive and row_ts == start_ts):
+                    rows.append(self._dict_row(row_ts, row))
+            if len(rows) >= limit and not newest:
+                break
+        return rows[-limit:] if newest else rows[:limit]
+
+    def bucket_rows(self, start_ts, end_ts, seconds, limit, newest=False):
+        """Same columns as the rollup tables: avg under the metric name, plus _min/_max.
+        newest=True keeps the newest `limit` buckets instead of the oldest."""
+        ts, values = self._ordered()
+        lo = np.searchsorted(ts, start_ts, side="left")
+        hi = np.searchsorted(ts, end_ts, side="right")
+        ts, values = ts[lo:hi], values[lo:hi].astype(np.float64)
+        if not len(ts):
+            return []
+
+        buckets = np.floor(ts / seconds)
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        if len(starts) > limit:
+            # Cut the samples too: reduceat runs the last bucket to the end of the array
+            if newest:
+                ts, values, buckets = ts[starts[-limit]:], values[starts[-limit]:], buckets[starts[-limit]:]
+                starts = starts[-limit:] - starts[-limit]
+            else:
+                ts, values, buckets = ts[:starts[limit]], values[:starts[limit]], buckets[:starts[limit]]
+                starts = starts[:limit]
+        counts = np.r_[starts[1:], len(ts)] - starts
+        present = ~np.isnan(values)
+        sums = np.add.reduceat(np.where(present, values, 0.0), starts)
+        n = np.add.reduceat(present, starts)
+        mins = np.fmin.reduceat(values, starts)
+        maxs = np.fmax.reduceat(values, starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avgs = sums / n
+
+        rows = []
+        for b in range(len(starts)):
+            row = {"timestamp": _to_datetime(buckets[starts[b]] * seconds),
+                   "sample_count": int(counts[b])}
+            for j, m in enumerate(METRICS):
+                row[m] = _clean(avgs[b, j])
+                row[f"{m}_min"] = _clean(mins[b, j])
+                row[f"{m}_max"] = _clean(maxs[b, j])
+            rows.append(row)
+        return rows
+
+    def _row(self, t, v):
+        row = {"timestamp": _to_datetime(t)}
+        for m, x in zip(METRICS, v):
+            row[m] = _clean(x)
+        return row
+
+    def _dict_row(self, t, data):
+        row = {"timestamp": _to_datetime(t)}
+        for m in METRICS:
+            row[m] = _clean(data.get(m, np.nan))
+        return row
+
+
+class RingBuffers:
+    def __init__(self, minutes=10, rate=2.0):
+        self.capacity = int(minutes * 60 * rate)
+        self.rings = {}     # machine_id -> MachineRing
+
+    def append(self, machine_id, ts, data):
+        ring = self.rings.get(machine_id)
+        if ring is None:
+            ring = self.rings[machine_id] = MachineRing(self.capacity)
+        ring.append(ts, data)
+
+    def get(self, machine_id):
+        return self.rings.get(machine_id)
+
+    def release(self, machine_id):
+        self.rings.pop(machine_id, None)
+
+    def stats(self):
+        return {
+            "machines": len(self.rings),
+            "capacity": self.capacity,
+            "bytes": sum(r.ts.nbytes + r.values.nbytes for r in self.rings.values()),
+        }
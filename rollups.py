@@ -0,0 +1,183 @@
+from datetime import datetime, timezone
+from telemetry import METRICS
+
+# --- TIME-SERIES ROLLUPS ---
+# Every raw sample feeds the 1 s tier; each closed bucket cascades into the
+# next tier (1 s -> 1 min -> 15 min). Closed buckets come out as rows for the
+# write-behind queue, so rollup tables stay current without re-aggregating
+# sensor_logs.
+#
+# A bucket can be written in parts (flushed half-full on disconnect, the rest
+# after a reconnect or by another worker). Each part is its own row, keyed by
+# a write_id like sensor_logs' ingest_id, so replaying the write-ahead log
+# never counts a part twice; readers merge the parts (see select_columns).
+
+TIERS = (("1s", 1), ("1m", 60), ("15m", 900))
+TIER_SECONDS = dict(TIERS)
+
+
+def table_name(tier):
+    return f"sensor_rollup_{tier}"
+
+
+def rollup_table_ddl(tier):
+    cols = ",\n".join(
+        f"        {m}_min FLOAT, {m}_max FLOAT, {m}_avg FLOAT" for m in METRICS
+    )
+    return f"""
+    CREATE TABLE IF NOT EXISTS {table_name(tier)} (
+        machine_id VARCHAR(20) NOT NULL,
+        bucket_start DATETIME NOT NULL,
+        sample_count INT NOT NULL,
+{cols},
+        write_id BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (machine_id, bucket_start, write_id)
+    )
+    """
+
+
+def _columns():
+    cols = ["machine_id", "bucket_start", "sample_count"]
+    for m in METRICS:
+        cols += [f"{m}_min", f"{m}_max", f"{m}_avg"]
+    return cols
+
+
+def insert_sql(tier):
+    """One bucket part; a replayed part is a no-op on its write_id."""
+    cols = _columns() + ["write_id"]
+    return (
+        f"INSERT INTO {table_name(tier)} ({', '.join(cols)}) "
+        f"VALUES ({', '.join(['%s'] * len(cols))}) "
+        f"ON DUPLICATE KEY UPDATE write_id = write_id"
+    )
+
+
+def legacy_upsert_sql(tier):
+    """Rows from before write_ids (still in older write-ahead logs): merged
+    additively into the bucket's write_id 0 part, as they always were."""
+    cols = _columns()
+    updates = []
+    for m in METRICS:
+        updates += [
+            f"{m}_min = LEAST({m}_min, VALUES({m}_min))",
+            f"{m}_max = GREATEST({m}_max, VALUES({m}_max))",
+            f"{m}_avg = ({m}_avg * sample_count + VALUES({m}_avg) * VALUES(sample_count))"
+            f" / (sample_count + VALUES(sample_count))",
+        ]
+    # MySQL applies assignments left to right: sample_count must come last
+    updates.append("sample_count = sample_count + VALUES(sample_count)")
+    return (
+        f"INSERT INTO {table_name(tier)} ({', '.join(cols)}) "
+        f"VALUES ({', '.join(['%s'] * len(cols))}) "
+        f"ON DUPLICATE KEY UPDATE {', '.join(updates)}"
+    )
+
+
+def select_columns():
+    """Parts merged per bucket (GROUP BY machine_id, bucket_start): average under
+    the plain metric name so charts work unchanged, plus _min/_max."""
+    cols = ["SUM(sample_count) AS sample_count"]
+    for m in METRICS:
+        cols += [
+            f"SUM({m}_avg * sample_count) / SUM(CASE WHEN {m}_avg IS NOT NULL THEN sample_count END) AS {m}",
+            f"MIN({m}_min) AS {m}_min",
+            f"MAX({m}_max) AS {m}_max",
+        ]
+    return ", ".join(cols)
+
+
+class _Bucket:
+    __slots__ = ("start", "count", "stats")
+
+    def __init__(self, start):
+        self.start = start
+        self.count = 0
+        self.stats = {}     # metric -> [min, max, sum, n]
+
+    def add(self, metric, lo, hi, total, n):
+        s = self.stats.get(metric)
+        if s is None:
+            self.stats[metric] = [lo, hi, total, n]
+        else:
+            if lo < s[0]: s[0] = lo
+            if hi > s[1]: s[1] = hi
+            s[2] += total
+            s[3] += n
+
+    def row(self, machine_id, write_id):
+        params = [
+            machine_id,
+            datetime.fromtimestamp(self.start, timezone.utc).replace(tzinfo=None),
+            self.count,
+        ]
+        for m in METRICS:
+            s = self.stats.get(m)
+            params += [s[0], s[1], s[2] / s[3]] if s else [None, None, None]
+        params.append(write_id)
+        return tuple(params)
+
+
+class RollupAggregator:
+    """In-memory open buckets per machine per tier."""
+
+    def __init__(self, ids):
+        self.ids = ids      # IngestIds: one write_id per bucket part
+        self.open = {}      # machine_id -> [bucket per tier]
+
+    def add(self, machine_id, ts, data):
+        """Feeds one raw sample. Returns [(kind, params)] for closed buckets."""
+        out = []
+        leaf = _Bucket(ts - ts % TIERS[0][1])
+        leaf.count = 1
+        for m in METRICS:
+            v = data.get(m)
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                leaf.add(m, v, v, v, 1)
+        self._merge(machine_id, 0, leaf, out)
+        return out
+
+    def _merge(self, machine_id, level, child, out):
+        seconds = TIERS[level][1]
+        buckets = self.open.setdefault(machine_id, [None] * len(TIERS))
+        start = child.start - child.start % seconds
+        current = buckets[level]
+
+        if current is not None and current.start != start:
+            self._close(machine_id, level, out)
+            current = None
+        if current is None:
+            current = buckets[level] = _Bucket(start)
+
+        current.count += child.count
+        for m, (lo, hi, total, n) in child.stats.items():
+            current.add(m, lo, hi, total, n)
+
+    def _close(self, machine_id, level, out):
+        buckets = self.open[machine_id]
+        bucket = buckets[level]
+        buckets[level] = None
+        out.append((f"rollup_{TIERS[level][0]}_v2", bucket.row(machine_id, self.ids.next())))
+        if level + 1 < len(TIERS):
+            self._merge(machine_id, level + 1, bucket, out)
+
+    def release(self, machine_id):
+        """Flushes every open bucket for a disconnected machine (as parts,
+        merged with the rest of the bucket by readers)."""
+        out = []
+        if machine_id not in self.open:
+            return out
+        for level in range(len(TIERS)):
+            if self.open[machine_id][level] is not None:
+                self._close(machine_id, level, out)
+        del self.open[machine_id]
+        return out
+
+
+def pick_tier(span_seconds, max_points):
+    """Finest tier whose bucket count over the span fits the point budget; the
+    coarsest otherwise (the history API then returns its newest buckets, X-Truncated)."""
+    for tier, seconds in TIERS:
+        if span_seconds / seconds <= max_points:
+            return tier
+    return TIERS[-1][0]
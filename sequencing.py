@@ -0,0 +1,132 @@
+from collections import OrderedDict
+
+# --- SEQUENCE TRACKING ---
+# Devices number their samples (seq, monotonic from 1 per boot) and stamp the
+# capture time (ts). Per machine we keep the next expected seq and the seqs
+# a gap skipped over, so each arriving sample is one of:
+#
+#   ok         - the expected seq (or the device sends no seq at all)
+#   gap        - ahead of expected; the skipped seqs count as lost for now
+#   reordered  - one of those skipped seqs, arriving late: no longer lost
+#   duplicate  - already seen; the caller drops it
+#
+# A seq below expected that isn't one of the skipped ones is either a resend
+# (duplicate) or a device restart, which must not turn every new sample into a
+# "duplicate", even when seq 1 was lost. With a capture ts the ts decides: a
+# resent sample repeats its old ts, so only a ts newer than anything seen, or
+# more than TS_REWIND seconds behind (device clock reset on boot), is a
+# restart - also right after a reconnect, when devices resend what they had
+# buffered. Without a ts, a restart is a seq of 1, any backwards seq on a
+# fresh connection, or a seq further back than the reorder window.
+# Loss rate = lost / (received + lost).
+
+OK, GAP, REORDERED, DUPLICATE = "ok", "gap", "reordered", "duplicate"
+TS_REWIND = 60.0
+
+
+class MachineSequence:
+    __slots__ = ("expected", "missing", "received", "lost", "gaps", "duplicates",
+                 "reordered", "restarts", "max_missing", "last_ts", "reconnected")
+
+    def __init__(self, max_missing=4096):
+        self.expected = None
+        self.last_ts = None             # Newest device ts seen since the last restart
+        self.reconnected = False        # Next sample is the first of a new connection
+        self.missing = OrderedDict()    # seq -> None, oldest first (bounded)
+        self.max_missing = max_missing
+        self.received = 0
+        self.lost = 0
+        self.gaps = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.restarts = 0
+
+    def check(self, seq, ts, reorder_window):
+        if self.expected is None or self._restarted(seq, ts, reorder_window):
+            self.restarts += self.expected is not None
+            self.expected = seq + 1
+            self.missing.clear()
+            self.last_ts = ts
+            self.reconnected = False
+            self.received += 1
+            return OK
+        self.reconnected = False
+        if ts is not None and (self.last_ts is None or ts > self.last_ts):
+            self.last_ts = ts
+
+        if seq == self.expected:
+            self.expected += 1
+            self.received += 1
+            return OK
+
+        if seq > self.expected:
+            skipped = seq - self.expected
+            self.gaps += 1
+            self.lost += skipped
+            # Remember (a bounded number of) skipped seqs so late arrivals can be told apart
+            for s in range(max(self.expected, seq - self.max_missing), seq):
+                self.missing[s] = None
+            while len(self.missing) > self.max_missing:
+                self.missing.popitem(last=False)
+            self.expected = seq + 1
+            self.received += 1
+            return GAP
+
+        if seq in self.missing:
+            del self.missing[seq]
+            self.lost -= 1
+            self.reordered += 1
+            self.received += 1
+            return REORDERED
+
+        self.duplicates += 1
+        return DUPLICATE
+
+    def _restarted(self, seq, ts, reorder_window):
+        if seq >= self.expected or seq in self.missing:
+            return False
+        if ts is not None and self.last_ts is not None:
+            return ts > self.last_ts or ts < self.last_ts - TS_REWIND
+        return (seq == 1 and self.expected > 2) or self.reconnected or self.expected - seq > reorder_window
+
+    def stats(self):
+        seen = self.received + self.lost
+        return {
+            "received": self.received,
+            "lost": self.lost,
+            "loss_rate": round(self.lost / seen, 6) if seen else 0.0,
+            "gaps": self.gaps,
+            "duplicates": self.duplicates,
+            "reordered": self.reordered,
+            "restarts": self.restarts,
+            "next_seq": self.expected,
+        }
+
+
+class SequenceTracker:
+    def __init__(self, reorder_window=256):
+        self.reorder_window = reorder_window
+        self.machines = {}      # machine_id -> MachineSequence
+
+    def connected(self, machine_id):
+        """A new connection: a device that rebooted in between may start below expected."""
+        tracker = self.machines.get(machine_id)
+        if tracker is not None:
+            tracker.reconnected = True
+
+    def check(self, machine_id, sample):
+        """Classifies one sample; samples without an integer seq are always OK."""
+        seq = sample.get("seq")
+        if type(seq) is not int or seq < 1:
+            return OK
+        tracker = self.machines.get(machine_id)
+        if tracker is None:
+            tracker = self.machines[machine_id] = MachineSequence()
+        ts = sample.get("ts")
+        return tracker.check(seq, ts if type(ts) in (float, int) else None, self.reorder_window)
+
+    def stats(self, machine_id=None):
+        if machine_id is not None:
+            tracker = self.machines.get(machine_id)
+            return tracker.stats() if tracker else None
+        return {m: t.stats() for m, t in self.machines.items()}
@@ -0,0 +1,75 @@
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from starlette.responses import Response
+
+try:
+    import orjson  # optional: several times faster, native datetime / numpy support
+except ImportError:
+    orjson = None
+if os.getenv("JSON_BACKEND", "orjson") == "json":
+    orjson = None
+
+# --- JSON SERIALIZATION ---
+# One place that decides how JSON is encoded: WebSocket frames, SSE/live
+# pushes and HTTP responses. orjson when installed, stdlib json otherwise;
+# both give the same output for what we send (ISO datetimes, Decimal as float).
+# JSON_BACKEND=json forces the stdlib (to compare the two).
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "as_dict"):  # SensorReading
+        return value.as_dict()
+    if hasattr(value, "item"):     # NumPy scalar (stdlib json only, orjson has its own)
+        return value.item()
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        """JSON as bytes."""
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+    def dumps_str(obj):
+        return orjson.dumps(obj, default=_default, option=_OPTIONS).decode()
+
+    loads = orjson.loads    # str or bytes
+else:
+    def dumps(obj):
+        """JSON as bytes."""
+        return json.dumps(obj, default=_default, separators=(",", ":")).encode()
+
+    def dumps_str(obj):
+        return json.dumps(obj, default=_default, separators=(",", ":"))
+
+    loads = json.loads
+
+
+class FastJSONResponse(Response):
+    """Default response class: the serializer above instead of Starlette's json.dumps."""
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
+
+
+def to_columnar(columns, rows):
+    """Tuples -> {"column": [values...]}: what pd.DataFrame(...) loads without a dict per row."""
+    if not rows:
+        return {c: [] for c in columns}
+    return {c: list(values) for c, values in zip(columns, zip(*rows))}
+
+
+def dict_rows(rows):
+    """List of row dicts -> (columns, tuples) in first-seen column order."""
+    columns = list(dict.fromkeys(k for r in rows for k in r))
+    return columns, [tuple(r.get(c) for c in columns) for r in rows]
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from telemetry import METRICS
+from logs import get_logger
+
+log = get_logger("sessions")
+
+# --- TREATMENT SESSIONS ---
+# A session is one treatment on one machine, started and stopped through the
+# API. While it runs, every ingested sample folds into a summary held in RAM:
+# sample count, min/max/sum per channel, delivered volume (flow_rate in
+# ml/min integrated over time) and alarm counts (via AlarmEngine.listeners).
+# At stop the summary is finalized and written as one treatment_sessions row,
+# so a session report is a single-row lookup instead of an aggregation over
+# sensor_logs. Running sessions are checkpointed to the same row every
+# checkpoint_interval seconds and picked up again after a restart.
+#
+# Sessions are tracked by the worker holding the machine's socket; start/stop
+# must reach that worker (single worker, or sticky routing by machine_id).
+
+TABLE = "treatment_sessions"
+RUNNING, COMPLETED = "running", "completed"
+SUMMARY_COLUMNS = ["session_id", "machine_id", "patient_id", "started_at", "ended_at", "status",
+                   "sample_count", "duration_s", "volume_ml", "alarm_count", "critical_alarm_count",
+                   "alarm_rules"]
+COLUMNS = SUMMARY_COLUMNS + [f"{m}_{agg}" for m in METRICS for agg in ("min", "max", "avg")]
+
+
+def session_table_ddl():
+    cols = ",\n".join(f"        {m}_min FLOAT, {m}_max FLOAT, {m}_avg FLOAT" for m in METRICS)
+    return f"""
+    CREATE TABLE IF NOT EXISTS {TABLE} (
+        session_id BIGINT PRIMARY KEY,
+        machine_id VARCHAR(20) NOT NULL,
+        patient_id VARCHAR(64),
+        started_at DATETIME(3) NOT NULL,
+        ended_at DATETIME(3),
+        status VARCHAR(10) NOT NULL,
+        sample_count INT NOT NULL,
+        duration_s DOUBLE,
+        volume_ml DOUBLE,
+        alarm_count INT NOT NULL,
+        critical_alarm_count INT NOT NULL,
+        alarm_rules TEXT,
+{cols}
+    )
+    """
+
+
+def upsert_sql():
+    """Checkpoints and the final write replace the whole summary."""
+    updates = ", ".join(f"{c} = VALUES({c})" for c in COLUMNS if c != "session_id")
+    return (
+        f"INSERT INTO {TABLE} ({', '.join(COLUMNS)}) "
+        f"VALUES ({', '.join(['%s'] * len(COLUMNS))}) "
+        f"ON DUPLICATE KEY UPDATE {updates}"
+    )
+
+
+def _naive_utc(ts):
+    return None if ts is None else datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+
+class SessionSummary:
+    __slots__ = ("session_id", "machine_id", "patient_id", "started_at", "ended_at",
+                 "count", "stats", "volume_ml", "last_ts", "last_flow",
+                 "alarms", "critical", "by_rule", "dirty")
+
+    def __init__(self, session_id, machine_id, patient_id, started_at):
+        self.session_id = session_id
+        self.machine_id = machine_id
+        self.patient_id = patient_id
+        self.started_at = started_at    # Unix seconds
+        self.ended_at = None
+        self.count = 0
+        self.stats = {}                 # metric -> [min, max, sum, n]
+        self.volume_ml = 0.0
+        self.last_ts = None
+        self.last_flow = None
+        self.alarms = 0
+        self.critical = 0
+        self.by_rule = {}
+        self.dirty = True
+
+    def add(self, ts, data, max_gap):
+        self.count += 1
+        stats = self.stats
+        for m in METRICS:
+            v = data.get(m)
+            if type(v) is not float and type(v) is not int:
+                continue
+            s = stats.get(m)
+            if s is None:
+                stats[m] = [v, v, v, 1]
+            else:
+                if v < s[0]:
+                    s[0] = v
+                if v > s[1]:
+                    s[1] = v
+                s[2] += v
+                s[3] += 1
+        flow = data.get("flow_rate")
+        if type(flow) is float or type(flow) is int:
+            # Trapezoid between samples; no volume across a gap (machine offline)
+            if self.last_flow is not None and 0 < ts - self.last_ts <= max_gap:
+                self.volume_ml += (self.last_flow + flow) / 2 * (ts - self.last_ts) / 60
+            self.last_ts, self.last_flow = ts, flow
+        self.dirty = True
+
+    def on_alarm(self, event):
+        if event["state"] != "raised":
+            return
+        self.alarms += 1
+        self.critical += event.get("severity") == "critical"
+        self.by_rule[event["rule"]] = self.by_rule.get(event["rule"], 0) + 1
+        self.dirty = True
+
+    @property
+    def status(self):
+        return RUNNING if self.ended_at is None else COMPLETED
+
+    def duration(self, now=None):
+        end = self.ended_at if self.ended_at is not None else (now or time.time())
+        return end - self.started_at
+
+    def row(self):
+        params = [self.session_id, self.machine_id, self.patient_id,
+                  _naive_utc(self.started_at), _naive_utc(self.ended_at), self.status,
+                  self.count, round(self.duration(), 3), round(self.volume_ml, 3),
+                  self.alarms, self.critical, json.dumps(self.by_rule)]
+        for m in METRICS:
+            s = self.stats.get(m)
+            params += [s[0], s[1], s[2] / s[3]] if s else [None, None, None]
+        return tuple(params)
+
+    def report(self):
+        """Same shape as a treatment_sessions row read back from the DB."""
+        return session_report(dict(zip(COLUMNS, self.row())))
+
+    @classmethod
+    def from_row(cls, row):
+        """Resumes a running session from its last checkpoint (row as a dict)."""
+        s = cls(row["session_id"], row["machine_id"], row["patient_id"],
+                row["started_at"].replace(tzinfo=timezone.utc).timestamp())
+        s.count = row["sample_count"]
+        s.volume_ml = row["volume_ml"] or 0.0
+        s.alarms = row["alarm_count"]
+        s.critical = row["critical_alarm_count"]
+        s.by_rule = json.loads(row["alarm_rules"] or "{}")
+        for m in METRICS:
+            if row[f"{m}_avg"] is not None:
+                # Per-channel counts aren't stored: assume every sample carried the channel
+                s.stats[m] = [row[f"{m}_min"], row[f"{m}_max"], row[f"{m}_avg"] * s.count, s.count]
+        s.dirty = False
+        return s
+
+
+def session_report(row):
+    """treatment_sessions row (dict) -> API response. Ids as strings: 63-bit ints break JS clients."""
+    report = {k: row[k] for k in SUMMARY_COLUMNS}
+    report["session_id"] = str(row["session_id"])
+    report["alarm_rules"] = json.loads(row["alarm_rules"] or "{}")
+    report["metrics"] = {m: {"min": row[f"{m}_min"], "max": row[f"{m}_max"], "avg": row[f"{m}_avg"]}
+                         for m in METRICS}
+    return report
+
+
+class SessionRegistry:
+    def __init__(self, ids, write, checkpoint_interval=30.0, max_gap=60.0, keep_finished=256):
+        self.ids = ids                  # IngestIds: unique without a DB round trip
+        self.write = write              # fn(kind, params) -> write-behind queue
+        self.checkpoint_interval = checkpoint_interval
+        self.max_gap = max_gap
+        self.keep_finished = keep_finished
+        self.active = {}                # machine_id -> SessionSummary
+        self.finished = {}              # session_id -> SessionSummary, newest last
+        self._task = None
+
+    # --- LIFECYCLE (API) ---
+    def begin(self, machine_id, patient_id=None, now=None):
+        if machine_id in self.active:
+            raise ValueError(f"{machine_id} already has a running session")
+        session = SessionSummary(self.ids.next(), machine_id, patient_id, now or time.time())
+        self.active[machine_id] = session
+        self.write("treatment_sessions", session.row())
+        session.dirty = False
+        log.info("▶️ Session started", extra={"machine_id": machine_id, "session_id": session.session_id})
+        return session
+
+    def end(self, machine_id, now=None):
+        session = self.active.pop(machine_id, None)
+        if session is None:
+            raise KeyError(machine_id)
+        session.ended_at = now or time.time()
+        self.write("treatment_sessions", session.row())
+        session.dirty = False
+        self.finished[session.session_id] = session
+        while len(self.finished) > self.keep_finished:
+            del self.finished[next(iter(self.finished))]
+        log.info("⏹️ Session completed", extra={"machine_id": machine_id, "session_id": session.session_id,
+                                               "samples": session.count})
+        return session
+
+    def resume(self, session):
+        self.active.setdefault(session.machine_id, session)
+
+    def get(self, session_id):
+        for session in self.active.values():
+            if session.session_id == session_id:
+                return session
+        return self.finished.get(session_id)
+
+    # --- HOT PATH ---
+    def add(self, machine_id, ts, data):
+        session = self.active.get(machine_id)
+        if session is not None:
+            session.add(ts, data, self.max_gap)
+
+    def on_alarm(self, event):
+        session = self.active.get(event["machine_id"])
+        if session is not None:
+            session.on_alarm(event)
+
+    # --- CHECKPOINTS ---
+    def checkpoint(self):
+        for session in self.active.values():
+            if session.dirty:
+                self.write("treatment_sessions", session.row())
+                session.dirty = False
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self.checkpoint()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            self.checkpoint()
+
+    def stats(self):
+        return {"active": len(self.active), "finished_in_memory": len(self.finished)}
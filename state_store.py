@@ -0,0 +1,296 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from logs import get_logger
+from serialization import dumps_str
+
+log = get_logger("state")
+
+# --- REALTIME STATE STORE ---
+# Latest status per machine and the motor targets. One of:
+#   memory - plain dicts, single worker (default)
+#   shared - SQLite on tmpfs (/dev/shm), shared by every worker on the host
+#   redis  - any Redis-compatible server (fakeredis in tests), across nodes
+#
+# Status writes land in a local dict first and are flushed to the shared
+# backend in the background, so the ingest loop never waits on it. Reads of
+# machines this worker is ingesting stay pure RAM; other machines are read
+# through a short TTL cache. Motor targets are re-synced in the same
+# background loop, so the ingest loop only ever reads a local dict.
+#
+# Live viewers (LiveHub) are per process. follow() lets the same loop poll
+# the status of machines watched here but ingested by another worker and
+# hand every change to the hub, so /stream and /ws/subscribe work on any
+# worker (one flush interval, 50 ms by default, behind the ingesting one).
+#
+# lease_worker_id() hands each starting worker the next value of a shared
+# counter (mod 1024) for the IngestIds worker bits, so workers never need a
+# hand-set WORKER_ID. Blocking; called once from lifespan.
+
+
+class MemoryStore:
+    name = "memory"
+
+    def __init__(self):
+        self.status = {}
+        self.motor = {}
+
+    def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def set_status(self, machine_id, data):
+        self.status[machine_id] = data
+
+    def get_status(self, machine_id):
+        return self.status.get(machine_id)
+
+    def all_status(self):
+        return dict(self.status)
+
+    def set_motor(self, machine_id, speed):
+        self.motor[machine_id] = speed
+
+    def get_motor(self, machine_id, default=0):
+        return self.motor.get(machine_id, default)
+
+    def release(self, machine_id):
+        pass
+
+    def follow(self, machine_ids, on_change):
+        pass    # Single process: ingest publishes every change itself
+
+    def lease_worker_id(self):
+        return os.getpid() & 0x3FF
+
+
+class _SharedStore(MemoryStore):
+    """Write-behind local cache in front of a shared backend."""
+
+    def __init__(self, flush_interval=0.05, read_ttl=0.25):
+        super().__init__()
+        self.flush_interval = flush_interval
+        self.read_ttl = read_ttl
+        self._dirty = {}
+        self._local = set()         # Machines ingested by this worker
+        self._read_cache = {}       # key -> (expires, value)
+        self._follow = None         # (fn() -> watched machine ids, fn(machine_id, status))
+        self._seen = {}             # Followed machine -> last status handed on
+        self._task = None
+
+    # Backend hooks
+    def _write_status(self, items): raise NotImplementedError
+    def _read_status(self, machine_id): raise NotImplementedError
+    def _read_all_status(self): raise NotImplementedError
+    def _read_many_status(self, machine_ids): raise NotImplementedError
+    def _write_motor(self, machine_id, speed): raise NotImplementedError
+    def _read_all_motor(self): raise NotImplementedError
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self._flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush()
+            try:
+                self.motor = await asyncio.to_thread(self._read_all_motor)
+                await self._poll_followed()
+            except Exception as e:
+                log.warning("⚠️ State store sync error", extra={"error": str(e)})
+
+    def follow(self, machine_ids, on_change):
+        self._follow = (machine_ids, on_change)
+
+    async def _poll_followed(self):
+        """Changed status of watched machines that another worker ingests -> on_change."""
+        if self._follow is None:
+            return
+        machine_ids, on_change = self._follow
+        remote = [m for m in machine_ids() if m not in self._local]
+        if not remote:
+            self._seen = {}
+            return
+        values = await asyncio.to_thread(self._read_many_status, remote)
+        seen = {}
+        for machine_id in remote:
+            data = values.get(machine_id)
+            if data is None:
+                continue
+            seen[machine_id] = data
+            if data != self._seen.get(machine_id):
+                on_change(machine_id, data)
+        self._seen = seen
+
+    async def _flush(self):
+        # Swap on the event loop thread so set_status never races the writer
+        items, self._dirty = self._dirty, {}
+        if not items:
+            return
+        try:
+            await asyncio.to_thread(self._write_status, items)
+        except Exception as e:
+            log.warning("⚠️ State store flush error", extra={"error": str(e)})
+            for k, v in items.items():
+                self._dirty.setdefault(k, v)
+
+    def _cached(self, key, loader):
+        now = time.monotonic()
+        hit = self._read_cache.get(key)
+        if hit and hit[0] > now:
+            return hit[1]
+        value = loader()
+        self._read_cache[key] = (now + self.read_ttl, value)
+        return value
+
+    def set_status(self, machine_id, data):
+        self.status[machine_id] = data
+        self._local.add(machine_id)
+        self._dirty[machine_id] = data
+
+    def release(self, machine_id):
+        """Machine disconnected from this worker: stop treating our copy as authoritative."""
+        self._local.discard(machine_id)
+
+    def get_status(self, machine_id):
+        if machine_id in self._local:
+            return self.status.get(machine_id)
+        return self._cached(("status", machine_id), lambda: self._read_status(machine_id))
+
+    def all_status(self):
+        merged = self._cached(("status", "*"), self._read_all_status)
+        merged = dict(merged)
+        for machine_id in self._local:
+            merged[machine_id] = self.status[machine_id]
+        return merged
+
+    def set_motor(self, machine_id, speed):
+        self._write_motor(machine_id, speed)
+        self.motor[machine_id] = speed
+
+
+class SharedMemoryStore(_SharedStore):
+    """SQLite database on tmpfs; every local worker opens the same file."""
+
+    name = "shared"
+
+    def __init__(self, path="/dev/shm/dialysis_state.db", **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._tls = threading.local()
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS state (ns TEXT, key TEXT, value TEXT, PRIMARY KEY (ns, key))")
+
+    def _conn(self):
+        conn = getattr(self._tls, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")   # RAM-backed, nothing to fsync
+            self._tls.conn = conn
+        return conn
+
+    def _write_status(self, items):
+        conn = self._conn()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO state VALUES ('status', ?, ?)",
+                             [(k, dumps_str(v)) for k, v in items.items()])
+
+    def _read_status(self, machine_id):
+        row = self._conn().execute("SELECT value FROM state WHERE ns = 'status' AND key = ?",
+                                   (machine_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _read_all_status(self):
+        rows = self._conn().execute("SELECT key, value FROM state WHERE ns = 'status'").fetchall()
+        return {k: json.loads(v) for k, v in rows}
+
+    def _read_many_status(self, machine_ids):
+        rows = self._conn().execute(
+            f"SELECT key, value FROM state WHERE ns = 'status' AND key IN ({', '.join('?' * len(machine_ids))})",
+            machine_ids).fetchall()
+        return {k: json.loads(v) for k, v in rows}
+
+    def _write_motor(self, machine_id, speed):
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO state VALUES ('motor', ?, ?)",
+                         (machine_id, json.dumps(speed)))
+
+    def _read_all_motor(self):
+        rows = self._conn().execute("SELECT key, value FROM state WHERE ns = 'motor'").fetchall()
+        return {k: json.loads(v) for k, v in rows}
+
+    def lease_worker_id(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")     # Two workers starting together: one waits
+        try:
+            row = conn.execute("SELECT value FROM state WHERE ns = 'lease' AND key = 'worker'").fetchone()
+            worker = int(row[0]) + 1 if row else 0
+            conn.execute("INSERT OR REPLACE INTO state VALUES ('lease', 'worker', ?)", (str(worker),))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return worker & 0x3FF
+
+
+class RedisStore(_SharedStore):
+    """Redis hashes dialysis:status / dialysis:motor. Pass client= (e.g. fakeredis) in tests."""
+
+    name = "redis"
+
+    def __init__(self, url="redis://localhost:6379/0", client=None, **kwargs):
+        super().__init__(**kwargs)
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+
+    def _write_status(self, items):
+        self.client.hset("dialysis:status", mapping={k: dumps_str(v) for k, v in items.items()})
+
+    def _read_status(self, machine_id):
+        raw = self.client.hget("dialysis:status", machine_id)
+        return json.loads(raw) if raw else None
+
+    def _read_all_status(self):
+        return {k.decode() if isinstance(k, bytes) else k: json.loads(v)
+                for k, v in self.client.hgetall("dialysis:status").items()}
+
+    def _read_many_status(self, machine_ids):
+        raws = self.client.hmget("dialysis:status", machine_ids)
+        return {m: json.loads(raw) for m, raw in zip(machine_ids, raws) if raw}
+
+    def _write_motor(self, machine_id, speed):
+        self.client.hset("dialysis:motor", machine_id, json.dumps(speed))
+
+    def _read_all_motor(self):
+        return {k.decode() if isinstance(k, bytes) else k: json.loads(v)
+                for k, v in self.client.hgetall("dialysis:motor").items()}
+
+    def lease_worker_id(self):
+        return (self.client.incr("dialysis:worker_seq") - 1) & 0x3FF
+
+
+def store_from_env():
+    """STATE_BACKEND=memory|shared|redis (REDIS_URL, STATE_SHM_PATH)."""
+    backend = os.getenv("STATE_BACKEND", "memory")
+    if backend == "memory":
+        return MemoryStore()
+    if backend == "shared":
+        return SharedMemoryStore(os.getenv("STATE_SHM_PATH", "/dev/shm/dialysis_state.db"))
+    if backend == "redis":
+        return RedisStore(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    raise ValueError(f"Unknown STATE_BACKEND: {backend}")
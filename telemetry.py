@@ -0,0 +1,183 @@
+import math
+import struct
+
+# --- TELEMETRY FIELDS ---
+# The seven sensor channels a machine streams, in sensor_logs column order.
+METRICS = (
+    "current_mA",
+    "ph",
+    "turbidity",
+    "pressure_Pa",
+    "flow_rate",
+    "temperature",
+    "humidity",
+)
+
+# Value stored when a sample is missing a channel
+DEFAULTS = {m: 0 for m in METRICS}
+DEFAULTS["ph"] = 7.0
+
+# --- SAMPLE METADATA ---
+# Optional per-sample fields next to the channels: "seq" (device counter,
+# monotonic from 1 per boot) and "ts" (device capture time, unix seconds).
+# The backend uses them for gap/duplicate/reorder detection and latency.
+SEQ_FIELD = "seq"
+TS_FIELD = "ts"
+
+# --- SENSOR READING ---
+# One validated sample, checked once at the edge (WebSocket handler) and then
+# shared by the status cache, ring buffers, alarm/stat engines and DB writer.
+# __slots__ instead of a dict: less than half the memory, and a fixed set of
+# fields, so unknown keys never travel further. A missing channel is None
+# (stored as DEFAULTS by the DB writer). It answers .get()/.items() like the
+# dicts it replaces, so aggregates (plain dicts) and readings mix freely.
+#
+# LIMITS are what the sensors can physically report, not clinical ranges
+# (those are alarm rules): a value outside them is a broken sensor or garbage.
+LIMITS = {
+    "current_mA": (0, 5000),
+    "ph": (0, 14),
+    "turbidity": (0, 4000),         # NTU
+    "pressure_Pa": (-100000, 1000000),
+    "flow_rate": (0, 2000),         # ml/min
+    "temperature": (0, 60),         # °C
+    "humidity": (0, 100),           # %
+}
+
+_CHECKS = tuple((m, *LIMITS[m]) for m in METRICS)
+
+
+class InvalidReading(ValueError):
+    pass
+
+
+class SensorReading:
+    __slots__ = (*METRICS, SEQ_FIELD, TS_FIELD)
+
+    def __init__(self, current_mA=None, ph=None, turbidity=None, pressure_Pa=None,
+                 flow_rate=None, temperature=None, humidity=None, seq=None, ts=None):
+        """Trusted values (simulator, tests); data from devices goes through parse()."""
+        self.current_mA = current_mA
+        self.ph = ph
+        self.turbidity = turbidity
+        self.pressure_Pa = pressure_Pa
+        self.flow_rate = flow_rate
+        self.temperature = temperature
+        self.humidity = humidity
+        self.seq = seq
+        self.ts = ts
+
+    @classmethod
+    def parse(cls, data):
+        """JSON sample (dict) -> SensorReading. Unknown keys are ignored."""
+        if not isinstance(data, dict):
+            raise InvalidReading("sample must be a JSON object")
+        return cls.from_values([data.get(m) for m in METRICS],
+                               data.get(SEQ_FIELD), data.get(TS_FIELD))
+
+    @classmethod
+    def from_values(cls, values, seq=None, ts=None):
+        """values in METRICS order. InvalidReading on a wrong type, an impossible
+        value or a sample without a single channel."""
+        present = 0
+        for (m, lo, hi), v in zip(_CHECKS, values):
+            if v is not None:
+                if type(v) is not float and type(v) is not int:
+                    raise InvalidReading(f"{m}: expected a number, got {type(v).__name__}")
+                if not lo <= v <= hi:   # NaN fails this too
+                    raise InvalidReading(f"{m}={v} outside {lo}..{hi}")
+                present += 1
+        if not present:
+            raise InvalidReading("sample has no sensor channels")
+        if seq is not None and (type(seq) is not int or seq < 1):
+            raise InvalidReading(f"seq must be a positive integer, got {seq!r}")
+        if ts is not None and (type(ts) not in (float, int) or not math.isfinite(ts)):
+            raise InvalidReading(f"ts must be unix seconds, got {ts!r}")
+        return cls(*values, seq=seq, ts=ts)
+
+    def get(self, name, default=None):
+        value = getattr(self, name, None)
+        return default if value is None else value
+
+    def items(self):
+        """(field, value) for every field that is present, like dict.items()."""
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is not None:
+                yield name, value
+
+    def as_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        return isinstance(other, SensorReading) and all(
+            getattr(self, n) == getattr(other, n) for n in self.__slots__)
+
+    def __repr__(self):
+        return "SensorReading(" + ", ".join(f"{k}={v!r}" for k, v in self.items()) + ")"
+
+# --- BINARY WIRE FORMAT ---
+# Negotiated with the WebSocket subprotocol; plain JSON text frames remain the
+# fallback. A frame is a 2-byte header (version, sample count) followed by
+# `count` samples, so a device can batch up to 255 samples per frame:
+#   v1: seven little-endian float32 in METRICS order            (28 bytes)
+#   v2: u32 seq, float64 capture ts, then the seven float32     (40 bytes)
+# One v2 sample is 42 bytes on the wire vs ~190 bytes of JSON.
+BINARY_SUBPROTOCOLS = {"dialysis.bin.v2": 2, "dialysis.bin.v1": 1}   # Preferred first
+BINARY_SUBPROTOCOL = "dialysis.bin.v2"
+BINARY_VERSION = 2
+_HEADER = struct.Struct("<BB")
+_SAMPLE = {
+    1: struct.Struct("<" + "f" * len(METRICS)),
+    2: struct.Struct("<Id" + "f" * len(METRICS)),
+}
+
+
+def encode_frame(samples, version=BINARY_VERSION):
+    """samples: iterable of SensorReadings, dicts, or sequences in METRICS order.
+    A missing channel goes out as NaN."""
+    rows = []
+    for s in samples:
+        if isinstance(s, (SensorReading, dict)):
+            values = tuple(s.get(m, math.nan) for m in METRICS)
+            seq, ts = s.get(SEQ_FIELD, 0), s.get(TS_FIELD, 0.0)
+        else:
+            values = tuple(s[:len(METRICS)])
+            seq, ts = 0, 0.0
+        rows.append((seq, ts, *values) if version == 2 else values)
+    if not 0 < len(rows) < 256:
+        raise ValueError("A binary frame carries 1-255 samples")
+    layout = _SAMPLE[version]
+    return _HEADER.pack(version, len(rows)) + b"".join(layout.pack(*r) for r in rows)
+
+
+def _channels(values):
+    # float32 noise rounded off to 3 decimals; NaN marks a missing channel
+    return [None if v != v else round(v, 3) for v in values]
+
+
+def decode_frame(buf, on_invalid=None):
+    """bytes -> [SensorReading]. A sample failing validation raises InvalidReading,
+    or with on_invalid(error) is reported and left out. A malformed frame raises ValueError."""
+    if len(buf) < _HEADER.size:
+        raise ValueError("Truncated binary frame")
+    version, count = _HEADER.unpack_from(buf)
+    layout = _SAMPLE.get(version)
+    if layout is None:
+        raise ValueError(f"Unsupported frame version: {version}")
+    if len(buf) != _HEADER.size + count * layout.size:
+        raise ValueError("Truncated binary frame")
+    body = memoryview(buf)[_HEADER.size:]
+    readings = []
+    for values in layout.iter_unpack(body):
+        try:
+            if version == 1:
+                readings.append(SensorReading.from_values(_channels(values)))
+            else:
+                readings.append(SensorReading.from_values(
+                    _channels(values[2:]), values[0] or None, values[1] or None))
+        except InvalidReading as e:
+            if on_invalid is None:
+                raise
+            on_invalid(e)
+    return readings
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules live flat in the repo root (python backend.py, uvicorn backend:app)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
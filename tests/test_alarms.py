@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+from alarms import AlarmEngine
+
+RULES = [
+    {"name": "ph_range", "metric": "ph", "kind": "threshold", "min": 6.7, "max": 7.6,
+     "for_seconds": 2, "severity": "warning"},
+    {"name": "pressure_rising", "metric": "pressure_Pa", "kind": "rate", "max_rate": 50,
+     "direction": "rise", "severity": "critical"},
+]
+
+
+def engine():
+    return AlarmEngine(RULES, clear_seconds=1.0, stale_seconds=10.0)
+
+
+def states(events):
+    return [(e["machine_id"], e["rule"], e["state"]) for e in events]
+
+
+def test_sustained_threshold_raises_then_clears_with_debounce():
+    e = engine()
+    e.update("M1", 100.0, {"ph": 8.0})
+    assert e.evaluate(100.0) == []                  # Not held for 2 s yet
+    e.update("M1", 101.0, {"ph": 8.1})
+    assert e.evaluate(101.0) == []
+    e.update("M1", 102.0, {"ph": 8.1})
+    assert states(e.evaluate(102.0)) == [("M1", "ph_range", "raised")]
+    e.update("M1", 102.5, {"ph": 7.2})
+    assert e.evaluate(102.5) == []                  # Must stay clear for 1 s
+    e.update("M1", 103.5, {"ph": 7.2})
+    assert states(e.evaluate(103.5)) == [("M1", "ph_range", "cleared")]
+    assert e.snapshot("M1")["active"] == []
+
+
+def test_spike_between_ticks_is_seen():
+    e = AlarmEngine([dict(RULES[0], for_seconds=0)])
+    e.update("M1", 100.0, {"ph": 7.0})
+    e.update("M1", 100.1, {"ph": 9.0})
+    e.update("M1", 100.2, {"ph": 7.0})
+    (event,) = e.evaluate(100.2)
+    assert event["state"] == "raised" and event["value"] == 9.0
+
+
+def test_rate_rule_and_machines_are_independent():
+    e = engine()
+    e.update("M1", 100.0, {"pressure_Pa": 900})
+    e.update("M2", 100.0, {"pressure_Pa": 900})
+    e.evaluate(100.0)
+    e.update("M1", 101.0, {"pressure_Pa": 1000})    # +100 Pa/s
+    e.update("M2", 101.0, {"pressure_Pa": 910})
+    assert states(e.evaluate(101.0)) == [("M1", "pressure_rising", "raised")]
+
+
+def test_stale_machine_does_not_alarm():
+    e = AlarmEngine([dict(RULES[0], for_seconds=0)], stale_seconds=5)
+    e.update("M1", 100.0, {"ph": 9.0})
+    assert e.evaluate(200.0) == []
+
+
+def test_listeners_and_subscribers_get_events():
+    e = AlarmEngine([dict(RULES[0], for_seconds=0)])
+    heard = []
+    e.listeners.append(heard.append)
+
+    async def scenario():
+        q = e.subscribe()
+        e.update("M1", 100.0, {"ph": 9.0})
+        e.evaluate(100.0)
+        return await asyncio.wait_for(q.get(), 1)
+    assert asyncio.run(scenario())["rule"] == "ph_range" and len(heard) == 1
+
+
+def test_many_machines_grow_the_matrix():
+    e = AlarmEngine([dict(RULES[0], for_seconds=0)])
+    for i in range(200):
+        e.update(f"M{i}", 100.0, {"ph": 9.0 if i % 50 == 0 else 7.0})
+    assert sorted(m for m, _, _ in states(e.evaluate(100.0))) == ["M0", "M100", "M150", "M50"]
+
+
+def test_bad_rule_rejected():
+    with pytest.raises(ValueError):
+        AlarmEngine([{"name": "x", "metric": "spo2"}])
@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+from fastapi.testclient import TestClient
+import backend
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_touches_no_files(tmp_path):
+    subprocess.run([sys.executable, "-c", "import backend"], cwd=tmp_path, check=True,
+                   env={**os.environ, "PYTHONPATH": ROOT})
+    assert os.listdir(tmp_path) == []       # WAL directory only appears in lifespan
+
+
+def test_serving_before_the_database_is_reachable(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)             # Lifespan opens the WAL under ./wal
+    monkeypatch.setitem(backend.DB_CONFIG, "host", "127.0.0.1")
+    monkeypatch.setitem(backend.DB_CONFIG, "port", 9)   # Nothing listens: warm-up keeps retrying
+    with TestClient(backend.create_app()) as client:
+        assert client.get("/livez").json() == {"status": "ok"}
+        ready = client.get("/readyz")
+        assert ready.status_code == 503
+        assert ready.json()["checks"] == {"started": True, "db": False}
+        monkeypatch.setattr(backend, "READY_REQUIRES_DB", False)
+        assert client.get("/readyz").status_code == 200
+    assert backend.boot["started"] is False and os.path.isdir(tmp_path / "wal")
@@ -0,0 +1,74 @@
+import asyncio
+from async_db import AsyncPool
+
+
+class FakeConn:
+    def __init__(self):
+        self.closed = False
+        self.in_trans = False
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        return self.in_trans
+
+    async def ping(self, reconnect=True):
+        pass
+
+    async def rollback(self):
+        self.rollbacks += 1
+        self.in_trans = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool:
+    """Mimics aiomysql: a connection released mid-transaction is closed, not reused."""
+
+    def __init__(self):
+        self.free = [FakeConn()]
+        self.opened = 1
+
+    async def acquire(self):
+        if not self.free:
+            self.free.append(FakeConn())
+            self.opened += 1
+        return self.free.pop()
+
+    def release(self, conn):
+        if conn.get_transaction_status():
+            conn.close()
+        elif not conn.closed:
+            self.free.append(conn)
+
+
+def test_read_only_work_keeps_the_connection_pooled():
+    pool = AsyncPool({})
+    pool.pool = FakePool()
+
+    async def read():
+        async with pool.connection() as conn:
+            conn.in_trans = True    # A SELECT with autocommit off
+            return conn
+
+    async def scenario():
+        return await read(), await read()
+    first, second = asyncio.run(scenario())
+    assert first is second and first.rollbacks == 2
+    assert pool.pool.opened == 1
+
+
+def test_failed_work_is_rolled_back_and_raised():
+    pool = AsyncPool({})
+    pool.pool = FakePool()
+
+    async def fail():
+        async with pool.connection() as conn:
+            conn.in_trans = True
+            raise RuntimeError("boom")
+
+    try:
+        asyncio.run(fail())
+    except RuntimeError:
+        pass
+    assert pool.pool.free[0].rollbacks == 1
@@ -0,0 +1,50 @@
+import asyncio
+from commands import CommandChannel, CommandRouter
+from serialization import loads
+
+
+def channel(**kwargs):
+    sent = []
+
+    async def send_text(text):
+        sent.append(loads(text))
+    return CommandChannel(send_text, **kwargs), sent
+
+
+def test_push_only_on_change_and_ack_clears_pending():
+    async def scenario():
+        ch, sent = channel()
+        assert await ch.push(40) == 1
+        assert await ch.push(40) is None        # Machine already has it
+        ch.ack(1)
+        return ch, sent
+
+    ch, sent = asyncio.run(scenario())
+    assert sent == [{"type": "command", "seq": 1, "motor_speed": 40}]
+    assert ch.pending is None and ch.acked_seq == 1 and ch.last_rtt_ms is not None
+
+
+def test_unacked_command_is_resent_then_given_up():
+    async def scenario():
+        ch, sent = channel(resend_after=0, max_retries=2)
+        await ch.push(40)
+        await ch.resend_due()       # Second try
+        await ch.resend_due()       # Out of retries
+        return ch, sent
+
+    ch, sent = asyncio.run(scenario())
+    assert [m["seq"] for m in sent] == [1, 1]
+    assert ch.pending is None and ch.unacked == 1
+
+
+def test_router_delivers_only_to_attached_machines():
+    async def scenario():
+        router = CommandRouter(state=None)
+        ch, sent = channel()
+        router.attach("M1", ch)
+        delivered = await router.push("M1", 55), await router.push("M2", 55)
+        router.detach("M1", ch)
+        return router, sent, delivered
+
+    router, sent, delivered = asyncio.run(scenario())
+    assert delivered == (1, None) and sent[0]["motor_speed"] == 55 and router.channels == {}
@@ -0,0 +1,59 @@
+import pytest
+from fastapi.testclient import TestClient
+import backend
+from downsampling import DownsamplerRegistry, build_policy
+
+
+def test_bucket_mean_ignores_seq_and_ts():
+    policy = build_policy({"mode": "bucket", "seconds": 2, "agg": "mean"})
+    assert policy.add(10.0, {"ph": 7.0, "seq": 1, "ts": 9.9}) == []
+    assert policy.add(11.0, {"ph": 7.2, "seq": 2, "ts": 10.9}) == []
+    ((ts, row),) = policy.add(12.0, {"ph": 7.4, "seq": 3})
+    assert ts == 10.0 and row == {"ph": pytest.approx(7.1)}
+
+
+def test_deadband_stores_changes_and_heartbeats():
+    policy = build_policy({"mode": "deadband", "thresholds": {"ph": 0.1}, "max_interval": 10})
+    assert policy.add(0, {"ph": 7.0})
+    assert not policy.add(1, {"ph": 7.05})
+    assert policy.add(2, {"ph": 7.2})
+    assert policy.add(12, {"ph": 7.2})
+
+
+def test_set_spec_flushes_pending_aggregate():
+    registry = DownsamplerRegistry()
+    registry.add("M1", 10.0, {"ph": 7.0})
+    assert registry.set_spec("M1", {"mode": "keep_all"}) == [(10.0, {"ph": 7.0})]
+    assert registry.add("M1", 11.0, {"ph": 7.1}) == [(11.0, {"ph": 7.1})]
+    with pytest.raises(ValueError):
+        registry.set_spec("M1", {"mode": "median"})
+
+
+BAD_SPECS = [
+    {"mode": "bucket", "seconds": 0},
+    {"mode": "bucket", "seconds": -1},
+    {"mode": "bucket", "seconds": "2"},
+    {"mode": "every_nth", "n": 0},
+    {"mode": "every_nth", "n": 2.5},
+    {"mode": "deadband", "thresholds": [1]},
+    {"mode": "deadband", "thresholds": {"ph": -0.1}},
+    {"mode": "deadband", "max_interval": 0},
+    {"mode": "deadband", "unknown": 1},
+]
+
+
+@pytest.mark.parametrize("spec", BAD_SPECS)
+def test_bad_specs_are_rejected_with_400(spec):
+    before = backend.downsamplers.spec_for("Z1")
+    response = TestClient(backend.create_app()).put("/downsampling/Z1", json=spec)
+    assert response.status_code == 400
+    assert backend.downsamplers.spec_for("Z1") == before     # Old policy still in force
+
+
+def test_good_spec_is_accepted():
+    client = TestClient(backend.create_app())
+    try:
+        response = client.put("/downsampling/Z2", json={"mode": "deadband", "thresholds": {"ph": 0.05}})
+        assert response.status_code == 200
+    finally:
+        backend.downsamplers.specs.pop("Z2", None)
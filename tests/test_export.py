@@ -0,0 +1,158 @@
+import asyncio
+import contextlib
+import csv
+import io
+import json
+from datetime import datetime
+import pytest
+import backend
+from export import COLUMNS, ENCODERS, check_format
+
+ROWS = [(datetime(2026, 1, 1, 0, 0, i), 150.0, 7.1, 3.0, 990.0, 500.0, 37.0, 45.0) for i in range(5)]
+
+
+def encode(fmt, chunk=2):
+    async def chunks():
+        for i in range(0, len(ROWS), chunk):
+            yield ROWS[i:i + chunk]
+
+    async def run():
+        return [part async for part in ENCODERS[fmt](chunks())]
+    return asyncio.run(run())
+
+
+def test_csv_streams_a_part_per_chunk():
+    parts = encode("csv")
+    assert len(parts) == 3
+    rows = list(csv.reader(io.StringIO(b"".join(parts).decode())))
+    assert rows[0] == list(COLUMNS) and len(rows) == 6 and rows[1][2] == "7.1"
+
+
+def test_ndjson():
+    lines = b"".join(encode("ndjson")).decode().splitlines()
+    assert len(lines) == 5 and json.loads(lines[0])["ph"] == 7.1
+
+
+@pytest.mark.parametrize("fmt", ["arrow", "parquet"])
+def test_arrow_and_parquet_roundtrip(fmt):
+    pa = pytest.importorskip("pyarrow")
+    data = pa.BufferReader(b"".join(encode(fmt)))
+    if fmt == "arrow":
+        table = pa.ipc.open_stream(data).read_all()
+    else:
+        import pyarrow.parquet as pq
+        table = pq.read_table(data)
+    assert table.num_rows == 5 and table.column_names == list(COLUMNS)
+
+
+def test_unknown_format_rejected():
+    with pytest.raises(ValueError):
+        check_format("xlsx")
+
+
+class FakeCursor:
+    def __init__(self, rows, block=False):
+        self.rows, self.block, self.closed = list(rows), block, False
+
+    async def execute(self, sql, params):
+        if self.block:
+            await asyncio.Event().wait()    # Query still running when the request is cancelled
+
+    async def fetchmany(self, n):
+        rows, self.rows = self.rows[:n], self.rows[n:]
+        return rows
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeConn:
+    def __init__(self, cursor):
+        self._cursor, self.closed = cursor, False
+
+    async def cursor(self, cls=None):
+        return self._cursor
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn, self.borrowed = conn, 0
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        self.borrowed += 1
+        try:
+            yield self.conn
+        finally:
+            self.borrowed -= 1
+
+
+def http_scope():
+    return {"type": "http", "method": "GET", "path": "/export/E1", "headers": [], "query_string": b""}
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    def install(cursor):
+        pool = FakePool(FakeConn(cursor))
+        monkeypatch.setattr(backend, "db_pool", pool)
+        monkeypatch.setattr(backend, "export_slots", asyncio.Semaphore(1))
+        return pool
+    return install
+
+
+def test_disconnect_before_first_chunk_releases_slot_and_connection(pool):
+    fake = pool(FakeCursor(ROWS))
+
+    async def scenario():
+        response = await backend.export_history("E1", start=None, end=None, format="csv")
+        assert backend.export_slots.locked() and fake.borrowed == 1
+
+        async def receive():
+            return {"type": "http.disconnect"}     # Gone before the body was iterated
+
+        async def send(message):
+            raise OSError("client gone")
+        with contextlib.suppress(Exception):
+            await response(http_scope(), receive, send)
+
+    asyncio.run(scenario())
+    assert not backend.export_slots.locked() and fake.borrowed == 0 and fake.conn.closed
+
+
+def test_completed_export_returns_the_connection(pool):
+    fake = pool(FakeCursor(ROWS))
+    sent = []
+
+    async def scenario():
+        response = await backend.export_history("E1", start=None, end=None, format="ndjson")
+
+        async def receive():
+            await asyncio.Event().wait()
+
+        async def send(message):
+            sent.append(message)
+        await response(http_scope(), receive, send)
+
+    asyncio.run(scenario())
+    body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    assert len(body.splitlines()) == len(ROWS)
+    assert fake.conn._cursor.closed and not fake.conn.closed
+    assert not backend.export_slots.locked() and fake.borrowed == 0
+
+
+def test_cancelled_query_releases_slot_and_connection(pool):
+    fake = pool(FakeCursor(ROWS, block=True))
+
+    async def scenario():
+        task = asyncio.create_task(backend.export_history("E1", start=None, end=None, format="csv"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert not backend.export_slots.locked() and fake.borrowed == 0 and fake.conn.closed
@@ -0,0 +1,115 @@
+import asyncio
+import time
+import pytest
+from frame_queue import FrameQueue
+
+
+def frame(n, waited=0.0):
+    return (time.perf_counter() - waited, time.time(), n)
+
+
+def drain(q):
+    async def run():
+        taken = []
+        while (batch := await q.take()) is not None:
+            taken.append([payload for _, _, payload in batch])
+        return taken
+    return asyncio.run(run())
+
+
+def test_drop_oldest_keeps_the_newest_frames():
+    counters = {"queue_dropped": 0}
+    q = FrameQueue(4, "drop_oldest", counters=counters)
+    for n in range(10):                 # Processor stalled: nothing is taken
+        q.offer(frame(n))
+    q.close()
+    assert drain(q) == [[6], [7], [8], [9]]
+    assert counters["queue_dropped"] == 6
+
+
+def test_drop_newest_keeps_the_queued_frames():
+    counters = {"queue_dropped": 0}
+    q = FrameQueue(4, "drop_newest", counters=counters)
+    for n in range(10):
+        q.offer(frame(n))
+    q.close()
+    assert drain(q) == [[0], [1], [2], [3]]
+    assert counters["queue_dropped"] == 6
+
+
+def test_close_on_a_full_queue_keeps_every_frame():
+    counters = {}
+    q = FrameQueue(3, counters=counters)
+    for n in range(3):
+        q.offer(frame(n))
+    q.close()
+    assert drain(q) == [[0], [1], [2]]
+    assert counters.get("queue_dropped", 0) == 0
+
+
+def test_late_frame_takes_the_backlog_in_one_batch():
+    counters = {"late_frames": 0}
+    q = FrameQueue(8, latency_budget=0.25, counters=counters)
+    q.offer(frame(0, waited=1.0))       # Waited past the budget: catch-up
+    for n in range(1, 5):
+        q.offer(frame(n))
+    q.close()
+    assert drain(q) == [[0, 1, 2, 3, 4]]
+    assert counters["late_frames"] == 5
+
+
+def test_frames_within_budget_are_taken_one_at_a_time():
+    counters = {"late_frames": 0}
+    q = FrameQueue(8, latency_budget=60, counters=counters)
+    for n in range(3):
+        q.offer(frame(n))
+    q.close()
+    assert drain(q) == [[0], [1], [2]]
+    assert counters["late_frames"] == 0
+
+
+def test_slow_processor_sheds_and_catches_up():
+    counters = {"queue_dropped": 0, "late_frames": 0}
+    q = FrameQueue(4, "drop_oldest", latency_budget=0.02, counters=counters)
+
+    async def receiver():
+        for n in range(12):
+            q.offer(frame(n))
+            await asyncio.sleep(0.005)
+        q.close()
+
+    async def processor():
+        taken = []
+        while (batch := await q.take()) is not None:
+            taken.append([payload for _, _, payload in batch])
+            await asyncio.sleep(0.05)   # Much slower than frames arrive
+        return taken
+
+    async def run():
+        _, taken = await asyncio.gather(receiver(), processor())
+        return taken
+
+    taken = asyncio.run(run())
+    processed = [n for batch in taken for n in batch]
+    assert processed == sorted(processed) and processed[-1] == 11
+    assert counters["queue_dropped"] == 12 - len(processed)
+    assert counters["queue_dropped"] > 0
+    assert any(len(batch) > 1 for batch in taken)
+    assert counters["late_frames"] >= sum(len(batch) for batch in taken if len(batch) > 1)
+
+
+def test_close_wakes_a_waiting_processor():
+    q = FrameQueue(4)
+
+    async def run():
+        waiter = asyncio.create_task(q.take())
+        await asyncio.sleep(0)
+        q.close()
+        return await asyncio.wait_for(waiter, 1)
+
+    assert asyncio.run(run()) is None
+
+
+def test_unknown_overflow_policy_is_rejected():
+    with pytest.raises(ValueError):
+        FrameQueue(4, "drop_random")
@@ -0,0 +1,91 @@
+from datetime import datetime, timezone
+import pytest
+from fastapi.testclient import TestClient
+import backend
+from telemetry import SensorReading
+
+T0 = 1_700_000_000.0
+
+
+def iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def test_since_returns_only_newer_rows_from_memory(monkeypatch):
+    monkeypatch.setitem(backend.downsamplers.specs, "H1", {"mode": "keep_all"})
+    for i in range(10):
+        backend.ring_buffers.append("H1", T0 + i, SensorReading(ph=7.0 + i / 100))
+    try:
+        client = TestClient(backend.create_app())
+        response = client.get("/history/H1", params={"since": iso(T0 + 4)})
+        assert response.headers["X-Source"] == "memory"
+        assert [row["timestamp"] for row in response.json()] == [iso(T0 + i) for i in range(5, 10)]
+        # The dashboard's next poll with its newest row as the cursor: nothing new
+        again = client.get("/history/H1", params={"since": iso(T0 + 9)})
+        assert again.json() == []
+    finally:
+        backend.ring_buffers.release("H1")
+
+
+def test_long_ranges_read_the_matching_rollup_tier(monkeypatch):
+    queries = []
+
+    async def query_history(sql, params):
+        queries.append((sql, params))
+        return ["timestamp", "sample_count", "ph"], [(datetime(2024, 1, 1), 60, 7.1)]
+    monkeypatch.setattr(backend, "query_history", query_history)
+    client = TestClient(backend.create_app())
+
+    day = client.get("/history/R1", params={"from": "2024-01-01T00:00:00", "to": "2024-01-02T00:00:00"})
+    assert day.headers["X-Resolution"] == "15m"
+    assert "FROM sensor_rollup_15m" in queries[0][0] and "GROUP BY bucket_start" in queries[0][0]
+    assert day.json() == [{"timestamp": "2024-01-01T00:00:00", "sample_count": 60, "ph": 7.1}]
+
+    hour = client.get("/history/R1", params={"from": "2024-01-01T00:00:00", "to": "2024-01-01T01:00:00",
+                                             "resolution": "1m"})
+    assert hour.headers["X-Resolution"] == "1m" and "sensor_rollup_1m" in queries[1][0]
+    assert client.get("/history/R1", params={"resolution": "5m"}).status_code == 400
+
+
+def test_range_over_budget_returns_the_newest_window(monkeypatch):
+    queries = []
+
+    async def query_history(sql, params):
+        queries.append((sql, params))
+        limit = params[-1]      # DESC LIMIT points + 1: the DB has more than that
+        return ["timestamp", "ph"], [(datetime(2024, 1, 1, 0, 59 - i), 7.0) for i in range(limit)]
+    monkeypatch.setattr(backend, "query_history", query_history)
+    client = TestClient(backend.create_app())
+
+    response = client.get("/history/R2", params={"from": "2024-01-01T00:00:00", "to": "2024-01-01T01:00:00",
+                                                 "resolution": "raw", "points": 5})
+    assert response.headers["X-Truncated"] == "true"
+    assert "ORDER BY timestamp DESC" in queries[0][0] and queries[0][1][-1] == 6
+    assert [row["timestamp"] for row in response.json()] == [f"2024-01-01T00:{m}:00" for m in range(55, 60)]
+
+
+def test_range_within_budget_is_not_truncated(monkeypatch):
+    async def query_history(sql, params):
+        return ["timestamp", "ph"], [(datetime(2024, 1, 1, 0, 1), 7.0), (datetime(2024, 1, 1, 0, 0), 7.1)]
+    monkeypatch.setattr(backend, "query_history", query_history)
+    response = TestClient(backend.create_app()).get(
+        "/history/R3", params={"from": "2024-01-01T00:00:00", "to": "2024-01-01T01:00:00", "resolution": "1m"})
+    assert "X-Truncated" not in response.headers
+    assert [row["ph"] for row in response.json()] == [7.1, 7.0]     # Oldest first
+
+
+def test_memory_range_over_budget_returns_the_newest_buckets(monkeypatch):
+    monkeypatch.setitem(backend.downsamplers.specs, "H2", {"mode": "keep_all"})
+    for i in range(120):
+        backend.ring_buffers.append("H2", T0 + i, SensorReading(ph=7.0 + i / 1000))
+    try:
+        client = TestClient(backend.create_app())
+        params = {"from": iso(T0), "to": iso(T0 + 119), "points": 10}
+        raw = client.get("/history/H2", params={**params, "resolution": "raw"})
+        assert raw.headers["X-Source"] == "memory" and raw.headers["X-Truncated"] == "true"
+        assert [row["timestamp"] for row in raw.json()] == [iso(T0 + i) for i in range(110, 120)]
+        buckets = client.get("/history/H2", params={**params, "resolution": "1s"}).json()
+        assert [row["sample_count"] for row in buckets] == [1] * 10
+        assert buckets[-1]["ph"] == pytest.approx(7.119)
+    finally:
+        backend.ring_buffers.release("H2")
@@ -0,0 +1,29 @@
+import asyncio
+from live_hub import LiveHub
+from serialization import loads
+
+
+def test_slow_viewer_gets_only_the_newest_frame():
+    async def scenario():
+        hub = LiveHub()
+        sub = hub.subscribe("M1")
+        for ph in (7.0, 7.1, 7.2):
+            hub.publish("M1", {"ph": ph})
+        frame = await sub.next(timeout=1)
+        return hub, sub, frame, await sub.next(timeout=0.01)
+
+    hub, sub, frame, nothing = asyncio.run(scenario())
+    assert loads(frame) == {"ph": 7.2} and nothing is None
+    assert sub.skipped == 2 and hub.stats()["coalesced"] == 2
+
+
+def test_publish_without_viewers_and_unsubscribe():
+    hub = LiveHub()
+    hub.publish("M1", {"ph": 7.0})
+    assert hub.published == 0
+    a, b = hub.subscribe("M1"), hub.subscribe("M1")
+    hub.publish("M1", {"ph": 7.0})
+    assert a.latest == b.latest and hub.stats()["viewers"] == {"M1": 2}
+    hub.unsubscribe("M1", a)
+    hub.unsubscribe("M1", b)
+    assert hub.subscribers == {}
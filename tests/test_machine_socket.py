@@ -0,0 +1,17 @@
+import logging
+from fastapi.testclient import TestClient
+import backend
+
+
+def test_receive_errors_are_logged_and_end_the_connection(monkeypatch, caplog):
+    def broken_loads(text):
+        raise RuntimeError("decoder blew up")
+    monkeypatch.setattr(backend, "loads", broken_loads)
+    client = TestClient(backend.create_app())     # No lifespan: no DB, no background tasks
+    with caplog.at_level(logging.ERROR, logger="dialysis.backend"):
+        with client.websocket_connect("/ws/machine/T1") as ws:
+            ws.receive_text()                       # Motor target pushed on connect
+            ws.send_text('{"ph": 7.0}')
+    errors = [r for r in caplog.records if r.levelno >= logging.ERROR]
+    assert errors and errors[0].exc_info[0] is RuntimeError
+    assert backend.ingest_counters["connected"] == 0
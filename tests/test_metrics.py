@@ -0,0 +1,64 @@
+import pytest
+from fastapi.testclient import TestClient
+import backend
+from metrics import Registry
+
+
+def test_counter_labels_and_escaping():
+    registry = Registry()
+    messages = registry.counter("ws_messages_total", "Frames", ["machine_id"])
+    messages.labels("M1").inc()
+    messages.labels("M1").inc(2)
+    messages.labels('bad"id').inc()
+    text = registry.render()
+    assert '# TYPE ws_messages_total counter' in text
+    assert 'ws_messages_total{machine_id="M1"} 3' in text
+    assert 'ws_messages_total{machine_id="bad\\"id"} 1' in text
+    with pytest.raises(ValueError):
+        messages.labels("M1", "extra")
+    with pytest.raises(ValueError):
+        registry.gauge("ws_messages_total", "again")
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram("handle_seconds", "Handling time", buckets=(0.01, 0.1))
+    for value in (0.005, 0.05, 0.05, 3.0):
+        latency.observe(value)
+    lines = registry.render().splitlines()
+    assert 'handle_seconds_bucket{le="0.01"} 1' in lines
+    assert 'handle_seconds_bucket{le="0.1"} 3' in lines
+    assert 'handle_seconds_bucket{le="+Inf"} 4' in lines
+    assert "handle_seconds_count 4" in lines
+
+
+def test_gauge_read_at_scrape_time():
+    registry = Registry()
+    depth = {"M1": 4, "M2": None}
+    registry.gauge("queue_depth", "Depth", ["machine_id"], fn=lambda: depth)
+    text = registry.render()
+    assert 'queue_depth{machine_id="M1"} 4' in text and "M2" not in text
+
+
+def test_metrics_endpoint_renders_the_backend_registry():
+    response = TestClient(backend.create_app()).get("/metrics")
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE ws_connected gauge" in response.text
+
+
+def test_unknown_machine_ids_share_one_series(monkeypatch):
+    monkeypatch.setitem(backend.machines_cache, "ids", frozenset({"M1"}))
+    client = TestClient(backend.create_app())
+    for machine_id in ("M1", "x7f3a9", "q0b2c1"):
+        with client.websocket_connect(f"/ws/machine/{machine_id}") as ws:
+            ws.receive_text()
+            ws.send_text('{"ph": 7.0}')
+    text = client.get("/metrics").text
+    assert "x7f3a9" not in text and "q0b2c1" not in text
+    assert 'ws_messages_total{machine_id="M1"}' in text
+    assert 'ws_messages_total{machine_id="other"}' in text
+
+
+def test_per_machine_sums_unknown_ids(monkeypatch):
+    monkeypatch.setitem(backend.machines_cache, "ids", frozenset({"M1"}))
+    assert backend.per_machine({"M1": 2, "a": 1, "b": 3}) == {"M1": 2, "other": 4}
@@ -0,0 +1,83 @@
+from datetime import date, datetime, timedelta
+import migrate
+from migrate import Database, expired_partitions
+
+
+def test_upgrade_on_sqlite_is_idempotent(tmp_path):
+    db = Database.connect(str(tmp_path / "local.db"))
+    applied = migrate.upgrade(db)
+    assert applied == [v for v, _, _ in migrate.MIGRATIONS]
+    assert migrate.upgrade(db) == []
+    assert all(done for _, _, done in migrate.status(db))
+    assert {"ingest_id", "seq", "device_ts"} <= db.columns("sensor_logs")
+    db.close()
+
+
+def test_prune_on_sqlite_deletes_old_rows(tmp_path):
+    db = Database.connect(str(tmp_path / "local.db"))
+    migrate.upgrade(db)
+    old = datetime.now() - timedelta(days=100)
+    for ts in (old, datetime.now()):
+        db.execute("INSERT INTO sensor_logs (machine_id, timestamp, ph) VALUES (%s, %s, %s)",
+                   ("M1", ts.strftime("%Y-%m-%d %H:%M:%S"), 7.0))
+    db.commit()
+    migrate.prune(db, retention_days=90)
+    assert db.execute("SELECT COUNT(*) FROM sensor_logs") == [(1,)]
+    db.close()
+
+
+def test_p_old_kept_until_migration_day_leaves_retention():
+    migrated = date(2026, 1, 10)
+    bounds = [("p_old", migrated)] + \
+        [(f"p{migrated + timedelta(days=i):%Y%m%d}", migrated + timedelta(days=i + 1)) for i in range(3)] + \
+        [("pmax", None)]
+    # Inside the retention window: nothing from before the migration may go
+    assert expired_partitions(bounds, migrated - timedelta(days=5)) == []
+    assert expired_partitions(bounds, migrated) == ["p_old"]
+    assert expired_partitions(bounds, migrated + timedelta(days=2)) == ["p_old", "p20260110", "p20260111"]
+
+
+def test_last_partition_never_dropped():
+    bounds = [("p20260101", date(2026, 1, 2))]
+    assert expired_partitions(bounds, date(2026, 6, 1)) == []
+
+
+class RecordingMySQL:
+    """Database stand-in with the MySQL dialect: records statements, answers partition lookups."""
+    dialect = "mysql"
+
+    def __init__(self, bounds=()):
+        self.bounds, self.sql = list(bounds), []
+
+    def execute(self, sql, params=()):
+        self.sql.append((" ".join(sql.split()), params))
+        return self.bounds if "information_schema.PARTITIONS" in sql else []
+
+
+def test_rollup_1s_partitioned_by_bucket_start():
+    db = RecordingMySQL()
+    migrate.m010_partition_rollup_1s(db)
+    ((sql, _),) = db.sql
+    assert sql.startswith("ALTER TABLE sensor_rollup_1s PARTITION BY RANGE (TO_DAYS(bucket_start))")
+    assert "PARTITION p_old" in sql and "PARTITION pmax VALUES LESS THAN MAXVALUE" in sql
+
+
+def test_prune_drops_expired_rollup_partitions():
+    old_day = date.today() - timedelta(days=40)
+    bound = (old_day + timedelta(days=1)).toordinal() + 365     # What TO_DAYS() stores
+    db = RecordingMySQL([("p_old", str(bound - 1)), (f"p{old_day:%Y%m%d}", str(bound)), ("pmax", "MAXVALUE")])
+    assert migrate.prune(db, 30, "sensor_rollup_1s") == ["p_old", f"p{old_day:%Y%m%d}"]
+    assert db.sql[0][1] == ("sensor_rollup_1s",)
+    assert db.sql[-1][0] == f"ALTER TABLE sensor_rollup_1s DROP PARTITION p_old, p{old_day:%Y%m%d}"
+
+
+def test_prune_on_sqlite_deletes_old_rollup_buckets(tmp_path):
+    db = Database.connect(str(tmp_path / "local.db"))
+    migrate.upgrade(db)
+    for day in (datetime.now() - timedelta(days=40), datetime.now()):
+        db.execute("INSERT INTO sensor_rollup_1s (machine_id, bucket_start, sample_count) VALUES (%s, %s, 1)",
+                   ("M1", day.strftime("%Y-%m-%d %H:%M:%S")))
+    db.commit()
+    migrate.prune(db, 30, "sensor_rollup_1s")
+    assert db.execute("SELECT COUNT(*) FROM sensor_rollup_1s") == [(1,)]
+    db.close()
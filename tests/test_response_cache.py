@@ -0,0 +1,53 @@
+import pytest
+from fastapi.testclient import TestClient
+import backend
+from response_cache import ResponseCache
+from state_store import MemoryStore
+
+
+def test_bump_invalidates_and_lru_bound():
+    cache = ResponseCache(max_entries=2)
+    cache.put("M1", "a", b"{}", {}, ttl=60, version=cache.version("M1"))
+    assert cache.get("M1", "a").body == b"{}"
+    cache.bump("M1")
+    assert cache.get("M1", "a") is None
+    for key in ("a", "b", "c"):
+        cache.put("M2", key, b"[]", {}, ttl=60, version=0)
+    assert [k for _, k in cache.entries] == ["b", "c"]
+
+
+def test_body_built_before_a_bump_is_not_served():
+    cache = ResponseCache()
+    version = cache.version("M1")   # Read, then ingest lands while the body is built
+    cache.bump("M1")
+    cache.put("M1", "a", b"{}", {}, ttl=60, version=version)
+    assert cache.get("M1", "a") is None
+
+
+def test_etag_survives_rebuilds_of_the_same_body():
+    cache = ResponseCache()
+    first = cache.put("M1", "a", b'{"ph":7.0}', {}, ttl=60, version=0)
+    cache.bump("M1")
+    assert cache.put("M1", "a", b'{"ph":7.0}', {}, ttl=60, version=1).etag == first.etag
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(backend, "state", MemoryStore())
+    monkeypatch.setattr(backend, "response_cache", ResponseCache())
+    return TestClient(backend.create_app())
+
+
+def test_status_poll_gets_304_until_ingest(client):
+    backend.state.set_status("C1", {"ph": 7.1})
+    first = client.get("/machine-status/C1")
+    etag = first.headers["ETag"]
+    assert first.json() == {"ph": 7.1}
+    again = client.get("/machine-status/C1", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+
+    backend.state.set_status("C1", {"ph": 7.3})
+    backend.response_cache.bump("C1")
+    changed = client.get("/machine-status/C1", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.json() == {"ph": 7.3}
+    assert backend.response_cache.counters["not_modified"] == 1
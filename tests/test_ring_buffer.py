@@ -0,0 +1,72 @@
+import pytest
+from datetime import timezone
+from downsampling import DownsamplerRegistry, build_policy
+from ring_buffer import MachineRing, RingBuffers
+
+
+def filled_ring(n=20, capacity=64):
+    ring = MachineRing(capacity)
+    for i in range(n):
+        ring.append(1000.0 + i * 0.5, {"ph": 7.0 + i / 100, "flow_rate": 500})
+    return ring
+
+
+def ts(row):
+    return row["timestamp"].replace(tzinfo=timezone.utc).timestamp()
+
+
+def test_raw_rows_and_wraparound():
+    ring = filled_ring(n=100, capacity=64)
+    assert ring.count == 64 and ring.oldest == 1000.0 + 36 * 0.5
+    rows = ring.raw_rows(1030.0, 1040.0, 100)
+    assert [ts(r) for r in rows] == [1030.0 + i * 0.5 for i in range(21)]
+    assert [ts(r) for r in ring.latest_rows(3)] == [1049.5, 1049.0, 1048.5]
+
+
+def test_policy_rows_match_what_the_db_writer_got():
+    ring = filled_ring()
+    stored = []
+    live = build_policy({"mode": "bucket", "seconds": 2})
+    for i in range(20):
+        stored += live.add(1000.0 + i * 0.5, {"ph": 7.0 + i / 100, "flow_rate": 500})
+    rows = ring.raw_rows(1000.0, float("inf"), 100, policy=build_policy({"mode": "bucket", "seconds": 2}))
+    assert [ts(r) for r in rows] == [t for t, _ in stored]      # Closed buckets only
+    assert [r["ph"] for r in rows] == [pytest.approx(d["ph"], abs=1e-3) for _, d in stored]
+
+
+def test_since_cursor_skips_partial_and_seen_buckets():
+    ring = filled_ring()
+    policy = build_policy({"mode": "bucket", "seconds": 2})
+    rows = ring.raw_rows(1003.0, float("inf"), 100, inclusive=False, policy=policy)
+    assert [ts(r) for r in rows] == [1004.0, 1006.0]
+
+
+def test_latest_rows_through_policy_newest_first():
+    ring = filled_ring()
+    rows = ring.latest_rows(2, build_policy({"mode": "bucket", "seconds": 2}))
+    assert [ts(r) for r in rows] == [1006.0, 1004.0]
+
+
+def test_bucket_rows_use_every_sample():
+    ring = filled_ring(n=4)
+    (row,) = ring.bucket_rows(1000.0, 1002.0, 60, 10)
+    assert row["sample_count"] == 4 and row["ph_min"] == 7.0 and row["ph_max"] == 7.03
+
+
+def test_replay_policy_and_release():
+    registry = DownsamplerRegistry({"M2": {"mode": "keep_all"}})
+    assert registry.replay_policy("M2") is None
+    assert registry.replay_policy("M1") is not None
+    rings = RingBuffers(minutes=1, rate=1)
+    rings.append("M1", 1000.0, {"ph": 7.0})
+    rings.release("M1")
+    assert rings.get("M1") is None and rings.stats()["machines"] == 0
+
+
+def test_bucket_rows_limit_keeps_each_bucket_to_its_own_samples():
+    ring = filled_ring(n=20)        # 0.5 s apart: two samples per 1 s bucket
+    oldest = ring.bucket_rows(1000.0, 1010.0, 1, 3)
+    newest = ring.bucket_rows(1000.0, 1010.0, 1, 3, newest=True)
+    assert [r["sample_count"] for r in oldest] == [r["sample_count"] for r in newest] == [2, 2, 2]
+    assert [ts(r) for r in oldest] == [1000.0, 1001.0, 1002.0]
+    assert [ts(r) for r in newest] == [1007.0, 1008.0, 1009.0]
@@ -0,0 +1,90 @@
+import itertools
+from datetime import datetime
+import pytest
+import migrate
+from migrate import Database
+from rollups import RollupAggregator, TIERS, pick_tier, select_columns, table_name
+from telemetry import METRICS
+
+
+class Ids:
+    def __init__(self):
+        self._next = itertools.count(1)
+
+    def next(self):
+        return next(self._next)
+
+
+def by_kind(items):
+    out = {}
+    for kind, params in items:
+        out.setdefault(kind, []).append(params)
+    return out
+
+
+def test_closed_buckets_cascade_through_tiers():
+    agg = RollupAggregator(Ids())
+    out = []
+    for i in range(121):
+        out += agg.add("M1", 1000.0 * 60 + i, {"ph": 7.0 + (i % 2) / 10})
+    kinds = by_kind(out)
+    assert len(kinds["rollup_1s_v2"]) == 120
+    (minute,) = kinds["rollup_1m_v2"]     # The second minute closes with the next 1 s bucket
+    ph = 3 + 3 * METRICS.index("ph")
+    assert minute[2] == 60 and minute[ph:ph + 3] == (7.0, 7.1, pytest.approx(7.05))
+    assert len({params[-1] for _, params in out}) == len(out)     # One write_id per part
+
+
+def test_release_flushes_partial_buckets_as_parts():
+    agg = RollupAggregator(Ids())
+    agg.add("M1", 60000.0, {"ph": 7.0})
+    parts = by_kind(agg.release("M1"))
+    assert set(parts) == {f"rollup_{t}_v2" for t, _ in TIERS}
+    assert agg.release("M1") == []
+
+
+def test_parts_merge_on_read(tmp_path):
+    db = Database.connect(str(tmp_path / "local.db"))
+    migrate.upgrade(db)
+    agg = RollupAggregator(Ids())
+    for ts, ph in ((60000.0, 7.0), (60000.5, 7.2)):
+        agg.add("M1", ts, {"ph": ph})
+    first = [p for k, p in agg.release("M1") if k == "rollup_1m_v2"]
+    agg.add("M1", 60030.0, {"ph": 7.6, "flow_rate": 500})     # Reconnected, same minute
+    second = [p for k, p in agg.release("M1") if k == "rollup_1m_v2"]
+    placeholders = ", ".join("?" * len(first[0]))
+    cols = ", ".join(["machine_id", "bucket_start", "sample_count"] +
+                     [f"{m}_{a}" for m in METRICS for a in ("min", "max", "avg")] + ["write_id"])
+    for params in first + second + first:      # The first part replayed: ignored
+        db.conn.execute(f"INSERT OR IGNORE INTO {table_name('1m')} ({cols}) VALUES ({placeholders})",
+                        [str(p) if isinstance(p, datetime) else p for p in params])
+    rows = db.execute(f"SELECT bucket_start, {select_columns()} FROM {table_name('1m')} "
+                      f"WHERE machine_id = 'M1' GROUP BY bucket_start")
+    assert len(rows) == 1
+    row = dict(zip(["bucket_start", "sample_count"] +
+                   [f"{m}{s}" for m in METRICS for s in ("", "_min", "_max")], rows[0]))
+    assert row["sample_count"] == 3
+    assert row["ph"] == pytest.approx((7.0 + 7.2 + 7.6) / 3)
+    assert (row["ph_min"], row["ph_max"]) == (7.0, 7.6)
+    assert row["flow_rate"] == 500 and row["flow_rate_min"] == 500
+    db.close()
+
+
+def test_write_id_migration_keeps_existing_buckets(tmp_path):
+    db = Database.connect(str(tmp_path / "local.db"))
+    migrate.upgrade(db)
+    table = table_name("1s")
+    db.execute(f"DROP TABLE {table}")
+    db.execute(f"CREATE TABLE {table} (machine_id VARCHAR(20) NOT NULL, bucket_start DATETIME NOT NULL, "
+               f"sample_count INT NOT NULL, ph_avg FLOAT, PRIMARY KEY (machine_id, bucket_start))")
+    db.execute(f"INSERT INTO {table} VALUES ('M1', '2026-01-01 00:00:00', 2, 7.1)")
+    migrate.m009_rollup_write_ids(db)
+    assert "write_id" in db.columns(table)
+    assert db.execute(f"SELECT machine_id, sample_count, ph_avg, write_id FROM {table}") == [("M1", 2, 7.1, 0)]
+    db.close()
+
+
+def test_pick_tier():
+    assert pick_tier(300, 500) == "1s"
+    assert pick_tier(24 * 3600, 500) == "15m"
+    assert pick_tier(6 * 3600, 500) == "1m"
@@ -0,0 +1,21 @@
+import asyncio
+import pytest
+import backend
+
+# Routes reading state that ingest mutates on the event loop must run on it too
+LOOP_STATE_ROUTES = [
+    ("GET", "/sequence-stats"),
+    ("GET", "/sequence-stats/{machine_id}"),
+    ("GET", "/ingest-stats"),
+    ("GET", "/alarms"),
+    ("GET", "/alarms/{machine_id}"),
+    ("GET", "/stats/{machine_id}"),
+    ("PUT", "/downsampling/{machine_id}"),
+]
+
+
+@pytest.mark.parametrize("method,path", LOOP_STATE_ROUTES)
+def test_loop_state_routes_are_async(method, path):
+    route = next(r for r in backend.router.routes
+                 if r.path == path and method in getattr(r, "methods", ()))
+    assert asyncio.iscoroutinefunction(route.endpoint)
@@ -0,0 +1,61 @@
+from sequencing import DUPLICATE, GAP, OK, REORDERED, SequenceTracker
+
+
+def feed(tracker, *samples, machine_id="M1"):
+    return [tracker.check(machine_id, s) for s in samples]
+
+
+def test_gap_then_late_arrival_is_reordered():
+    tracker = SequenceTracker()
+    assert feed(tracker, {"seq": 1}, {"seq": 2}, {"seq": 4}, {"seq": 3}, {"seq": 3}) == \
+        [OK, OK, GAP, REORDERED, DUPLICATE]
+    stats = tracker.stats("M1")
+    assert stats["lost"] == 0 and stats["duplicates"] == 1 and stats["restarts"] == 0
+
+
+def test_restart_with_lost_first_sample_is_not_a_duplicate_flood():
+    tracker = SequenceTracker(reorder_window=8)
+    feed(tracker, *({"seq": s} for s in range(1, 51)))
+    # Rebooted without a reconnect or ts, and seq 1 was lost
+    assert feed(tracker, {"seq": 2}, {"seq": 3}) == [OK, OK]
+    stats = tracker.stats("M1")
+    assert stats["restarts"] == 1 and stats["duplicates"] == 0 and stats["next_seq"] == 4
+
+
+def test_new_connection_accepts_a_lower_seq():
+    tracker = SequenceTracker()
+    feed(tracker, *({"seq": s, "ts": 1000.0 + s} for s in range(1, 11)))
+    tracker.connected("M1")
+    assert feed(tracker, {"seq": 3, "ts": 1050.0}, {"seq": 4, "ts": 1051.0}) == [OK, OK]
+    assert tracker.stats("M1")["restarts"] == 1
+    assert feed(tracker, {"seq": 4, "ts": 1051.0}) == [DUPLICATE]
+
+
+def test_resend_after_reconnect_is_duplicate():
+    tracker = SequenceTracker()
+    feed(tracker, *({"seq": s, "ts": 1000.0 + s} for s in range(1, 11)))
+    tracker.connected("M1")
+    # Device resends its buffered tail with the original capture times
+    assert feed(tracker, *({"seq": s, "ts": 1000.0 + s} for s in (8, 9, 10))) == [DUPLICATE] * 3
+    assert feed(tracker, {"seq": 11, "ts": 1011.0}) == [OK]
+    stats = tracker.stats("M1")
+    assert stats["restarts"] == 0 and stats["duplicates"] == 3
+
+
+def test_new_connection_without_ts_rebaselines():
+    tracker = SequenceTracker()
+    feed(tracker, *({"seq": s} for s in range(1, 11)))
+    tracker.connected("M1")
+    assert feed(tracker, {"seq": 3}, {"seq": 4}) == [OK, OK]
+    assert tracker.stats("M1")["restarts"] == 1
+    assert feed(tracker, {"seq": 4}) == [DUPLICATE]     # Only the first sample rebaselines
+
+
+def test_device_ts_detects_restart_inside_the_window():
+    tracker = SequenceTracker()
+    feed(tracker, *({"seq": s, "ts": 1000.0 + s} for s in range(1, 21)))
+    assert feed(tracker, {"seq": 10, "ts": 1010.0}) == [DUPLICATE]     # Same ts as before
+    assert feed(tracker, {"seq": 2, "ts": 1100.0}) == [OK]             # Newer than anything seen
+    feed(tracker, *({"seq": s, "ts": 1100.0 + s} for s in range(3, 21)))
+    assert feed(tracker, {"seq": 2, "ts": 5.0}) == [OK]                # Clock reset on boot
+    assert tracker.stats("M1")["restarts"] == 2
@@ -0,0 +1,44 @@
+import importlib.util
+from datetime import datetime
+from decimal import Decimal
+import numpy as np
+import pytest
+import serialization
+from serialization import dict_rows, to_columnar
+from telemetry import SensorReading
+
+
+def load_backend(monkeypatch, name):
+    """A separate copy of serialization.py with JSON_BACKEND=name."""
+    monkeypatch.setenv("JSON_BACKEND", name)
+    spec = importlib.util.spec_from_file_location(f"serialization_{name}", serialization.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+PAYLOAD = {
+    "timestamp": datetime(2024, 1, 2, 3, 4, 5),
+    "avg": Decimal("7.25"),
+    "count": np.int64(3),
+    "reading": SensorReading(ph=7.1, seq=4),
+}
+
+
+def test_orjson_and_stdlib_agree(monkeypatch):
+    pytest.importorskip("orjson")
+    fast, stdlib = load_backend(monkeypatch, "orjson"), load_backend(monkeypatch, "json")
+    assert (fast.BACKEND, stdlib.BACKEND) == ("orjson", "json")
+    assert fast.loads(fast.dumps(PAYLOAD)) == stdlib.loads(stdlib.dumps(PAYLOAD)) == {
+        "timestamp": "2024-01-02T03:04:05", "avg": 7.25, "count": 3, "reading": {"ph": 7.1, "seq": 4}}
+
+
+def test_unknown_types_raise(monkeypatch):
+    with pytest.raises(TypeError):
+        load_backend(monkeypatch, "json").dumps({"x": object()})
+
+
+def test_columnar_helpers():
+    assert to_columnar(["a", "b"], [(1, 2), (3, 4)]) == {"a": [1, 3], "b": [2, 4]}
+    assert to_columnar(["a"], []) == {"a": []}
+    assert dict_rows([{"a": 1}, {"b": 2, "a": 3}]) == (["a", "b"], [(1, None), (3, 2)])
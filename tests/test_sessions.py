@@ -0,0 +1,49 @@
+import pytest
+from sessions import COLUMNS, SessionRegistry, SessionSummary, upsert_sql
+from write_queue import IngestIds
+
+
+def registry():
+    writes = []
+    return SessionRegistry(IngestIds(worker=1), lambda kind, params: writes.append(params)), writes
+
+
+def test_summary_volume_and_stats():
+    s = SessionSummary(1, "M1", "P1", started_at=1000.0)
+    s.add(1000.0, {"flow_rate": 300, "ph": 7.0}, max_gap=60)
+    s.add(1060.0, {"flow_rate": 500, "ph": 7.4}, max_gap=60)    # 400 ml/min for a minute
+    s.add(1300.0, {"flow_rate": 500}, max_gap=60)               # Gap: machine was offline
+    assert s.volume_ml == pytest.approx(400)
+    assert s.stats["ph"] == [7.0, 7.4, pytest.approx(14.4), 2] and s.count == 3
+
+
+def test_begin_end_and_checkpoints_write_whole_rows():
+    sessions, writes = registry()
+    session = sessions.begin("M1", "P1", now=1000.0)
+    with pytest.raises(ValueError):
+        sessions.begin("M1")
+    sessions.checkpoint()
+    assert len(writes) == 1             # Nothing changed since the start row
+    sessions.add("M1", 1001.0, {"ph": 7.1})
+    sessions.on_alarm({"machine_id": "M1", "rule": "ph_range", "state": "raised", "severity": "critical"})
+    sessions.checkpoint()
+    sessions.end("M1", now=1100.0)
+    assert len(writes) == 3 and all(len(row) == len(COLUMNS) for row in writes)
+    report = sessions.get(session.session_id).report()
+    assert report["status"] == "completed" and report["duration_s"] == 100.0
+    assert report["critical_alarm_count"] == 1 and report["alarm_rules"] == {"ph_range": 1}
+    assert report["metrics"]["ph"] == {"min": 7.1, "max": 7.1, "avg": 7.1}
+    assert report["session_id"] == str(session.session_id)
+    assert upsert_sql().count("%s") == len(COLUMNS)
+
+
+def test_resume_from_checkpoint_row():
+    sessions, _ = registry()
+    running = sessions.begin("M1", now=1000.0)
+    running.add(1000.0, {"ph": 7.0, "flow_rate": 400}, max_gap=60)
+    running.add(1030.0, {"ph": 7.2, "flow_rate": 400}, max_gap=60)
+    row = dict(zip(COLUMNS, running.row()))
+    resumed = SessionSummary.from_row(row)
+    assert resumed.status == "running" and resumed.started_at == 1000.0
+    assert resumed.count == 2 and resumed.volume_ml == pytest.approx(200)
+    assert resumed.report()["metrics"] == running.report()["metrics"]
@@ -0,0 +1,27 @@
+import json
+from bench_ingest import percentile
+from machine_simulator import build_fleet
+from telemetry import SensorReading, decode_frame
+
+
+def test_fleet_frames_are_numbered_and_valid():
+    stats, machines = build_fleet(3, prefix="S", base_url="ws://localhost:8000", rate=10, batch=4)
+    assert [m.machine_id for m in machines] == ["S1", "S2", "S3"]
+    assert all(m.stats is stats for m in machines)
+    sim = machines[0]
+    _, frame = sim.next_frame()
+    readings = [SensorReading.parse(s) for s in json.loads(frame)]
+    assert [r.seq for r in readings] == [1, 2, 3, 4] and sim.interval == 0.4
+
+
+def test_binary_frames_decode_on_the_backend_side():
+    _, (sim,) = build_fleet(1, base_url="ws://localhost:8000", fmt="binary", batch=2)
+    sim.wire_version = 2
+    samples, frame = sim.next_frame()
+    decoded = decode_frame(frame)
+    assert [r.seq for r in decoded] == [s.seq for s in samples] == [1, 2]
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile(list(range(1, 101)), 99) == 100 and percentile([3, 1, 2], 50) == 2
@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from state_store import MemoryStore, RedisStore, SharedMemoryStore
+
+
+def redis_pair():
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    return (RedisStore(client=fakeredis.FakeRedis(server=server)),
+            RedisStore(client=fakeredis.FakeRedis(server=server)))
+
+
+def shm_pair(tmp_path):
+    path = str(tmp_path / "state.db")
+    return SharedMemoryStore(path), SharedMemoryStore(path)
+
+
+@pytest.fixture(params=["redis", "shared"])
+def workers(request, tmp_path):
+    return redis_pair() if request.param == "redis" else shm_pair(tmp_path)
+
+
+def test_memory_store_roundtrip():
+    store = MemoryStore()
+    store.set_status("M1", {"ph": 7.0})
+    store.set_motor("M1", 40)
+    assert store.get_status("M1") == {"ph": 7.0}
+    assert store.get_motor("M1") == 40 and store.get_motor("M2", 5) == 5
+
+
+def test_status_visible_to_other_worker(workers):
+    ingesting, viewing = workers
+    ingesting.set_status("M1", {"ph": 7.1})
+    asyncio.run(ingesting._flush())
+    assert viewing.get_status("M1") == {"ph": 7.1}
+    assert viewing.all_status() == {"M1": {"ph": 7.1}}
+
+
+def test_followed_machines_are_published_on_change(workers):
+    ingesting, viewing = workers
+    published = []
+    watched = ["M1"]
+    viewing.follow(lambda: watched, lambda m, data: published.append((m, data)))
+
+    async def scenario():
+        ingesting.set_status("M1", {"ph": 7.0})
+        await ingesting._flush()
+        await viewing._poll_followed()
+        await viewing._poll_followed()      # Unchanged: nothing new
+        ingesting.set_status("M1", {"ph": 7.3})
+        await ingesting._flush()
+        await viewing._poll_followed()
+    asyncio.run(scenario())
+    assert published == [("M1", {"ph": 7.0}), ("M1", {"ph": 7.3})]
+
+
+def test_local_machines_are_not_followed(workers):
+    ingesting, _ = workers
+    published = []
+    ingesting.follow(lambda: ["M1"], lambda m, data: published.append(m))
+    ingesting.set_status("M1", {"ph": 7.0})
+
+    async def scenario():
+        await ingesting._flush()
+        await ingesting._poll_followed()
+    asyncio.run(scenario())
+    assert published == []      # The ingest loop publishes those itself
+
+
+def test_workers_lease_distinct_worker_ids(workers):
+    first, second = workers
+    assert first.lease_worker_id() != second.lease_worker_id()
@@ -0,0 +1,40 @@
+import statistics
+import pytest
+from stream_stats import StreamStats
+
+
+def test_mean_and_std_match_batch_statistics():
+    values = [7.0, 7.2, 6.9, 7.1, 7.4, 7.0]
+    s = StreamStats()
+    for v in values:
+        s.update("M1", {"ph": v, "seq": 1})
+    ph = s.snapshot("M1")["ph"]
+    assert ph["count"] == 6 and ph["last"] == 7.0
+    assert ph["mean"] == pytest.approx(statistics.mean(values), abs=1e-4)
+    assert ph["std"] == pytest.approx(statistics.stdev(values), abs=1e-4)
+    assert "seq" not in s.snapshot("M1")
+
+
+def test_outlier_flagged_against_the_baseline():
+    s = StreamStats(span=50, z_limit=3.0)
+    for i in range(200):
+        s.update("M1", {"pressure_Pa": 1000 + (i % 5)})
+    assert not s.snapshot("M1")["pressure_Pa"]["anomaly"]
+    s.update("M1", {"pressure_Pa": 1100})
+    assert s.snapshot("M1")["pressure_Pa"]["anomaly"]
+
+
+def test_slow_ramp_shows_as_drift():
+    s = StreamStats(span=600, fast_span=20, drift_limit=1.0)
+    for i in range(600):
+        s.update("M1", {"pressure_Pa": 1000 + (i % 3)})
+    for i in range(100):
+        s.update("M1", {"pressure_Pa": 1000 + i * 0.3})
+    assert s.snapshot("M1")["pressure_Pa"]["drifting"]
+
+
+def test_unknown_machine_and_bad_values():
+    s = StreamStats()
+    assert s.snapshot("M1") is None
+    s.update("M1", {"ph": float("nan"), "flow_rate": "x", "temperature": 37})
+    assert list(s.snapshot("M1")) == ["temperature"]
@@ -0,0 +1,67 @@
+import math
+import pytest
+from telemetry import InvalidReading, SensorReading, decode_frame, encode_frame
+
+
+def reading(**kw):
+    values = dict(current_mA=150.0, ph=7.25, turbidity=3.0, pressure_Pa=990.5,
+                  flow_rate=500.0, temperature=37.0, humidity=45.0)
+    return SensorReading(**{**values, **kw})
+
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_frame_roundtrip(version):
+    samples = [reading(seq=1, ts=1700000000.25), reading(ph=7.0, seq=2, ts=1700000000.75)]
+    decoded = decode_frame(encode_frame(samples, version=version))
+    if version == 1:
+        samples = [reading(), reading(ph=7.0)]     # v1 carries no seq / ts
+    assert decoded == samples
+
+
+def test_missing_channel_travels_as_nan():
+    frame = encode_frame([{"ph": 7.1, "seq": 3}])
+    (decoded,) = decode_frame(frame)
+    assert decoded.ph == pytest.approx(7.1) and decoded.flow_rate is None and decoded.seq == 3
+
+
+@pytest.mark.parametrize("buf", [b"", b"\x02", b"\x09\x01" + bytes(40), b"\x02\x02" + bytes(40)])
+def test_malformed_frames_raise_value_error(buf):
+    with pytest.raises(ValueError):
+        decode_frame(buf)
+
+
+def test_invalid_sample_reported_and_skipped():
+    frame = encode_frame([reading(seq=1), reading(ph=20.0, seq=2), reading(seq=3)])
+    errors = []
+    decoded = decode_frame(frame, on_invalid=errors.append)
+    assert [r.seq for r in decoded] == [1, 3]
+    assert len(errors) == 1 and isinstance(errors[0], InvalidReading)
+    with pytest.raises(InvalidReading):
+        decode_frame(frame)
+
+
+@pytest.mark.parametrize("sample", [
+    {"ph": "7"}, {"ph": math.nan}, {"ph": 7.0, "seq": 0}, {"ph": 7.0, "ts": math.inf}, {"seq": 1}, [7.0],
+])
+def test_parse_rejects(sample):
+    with pytest.raises(InvalidReading):
+        SensorReading.parse(sample)
+
+
+def test_parse_drops_unknown_keys():
+    r = SensorReading.parse({"ph": 7.0, "seq": 4, "pad": "x" * 10})
+    assert r.as_dict() == {"ph": 7.0, "seq": 4}
+
+
+def test_reading_answers_like_a_dict():
+    r = SensorReading.parse({"ph": 7, "temperature": 36.6})
+    assert r.get("ph") == 7 and r.get("humidity") is None and r.get("humidity", 0) == 0
+    assert dict(r.items()) == {"ph": 7, "temperature": 36.6}
+    assert r == SensorReading(ph=7, temperature=36.6) and r != {"ph": 7, "temperature": 36.6}
+    assert not hasattr(r, "__dict__")       # Slotted: no per-sample dict
+
+
+@pytest.mark.parametrize("sample", [{"ph": True}, {"temperature": 61}, {"pressure_Pa": -100001}])
+def test_parse_rejects_impossible_values(sample):
+    with pytest.raises(InvalidReading):
+        SensorReading.parse(sample)
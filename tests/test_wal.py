@@ -0,0 +1,142 @@
+import asyncio
+import json
+import os
+from wal import DEAD_LETTER, SegmentWAL
+from write_queue import WriteBehindQueue
+
+
+class RowError(Exception):
+    """Stands in for IntegrityError / DataError."""
+
+
+class FakeDB:
+    def __init__(self):
+        self.rows = []
+        self.down = False
+        self.bad = set()        # params the DB rejects for their content
+
+    async def write(self, items):
+        if self.down:
+            raise ConnectionError("db down")
+        if any(params[0] in self.bad for _, params in items):
+            raise RowError("constraint violated")
+        self.rows += [params[0] for _, params in items]
+
+
+def queue(tmp_path, db, **kw):
+    wal = SegmentWAL(str(tmp_path / "wal"), segment_bytes=4096)
+    wal.open()
+    return WriteBehindQueue(db.write, overflow="spill", wal=wal, batch_size=4,
+                            permanent=(RowError,), **kw), wal
+
+
+def test_segments_roll_over_and_read_back(tmp_path):
+    wal = SegmentWAL(str(tmp_path), segment_bytes=256)
+    wal.open()
+    wal.append([["sensor_logs", [i, "x" * 20]] for i in range(20)])
+    wal.seal()
+    segments = wal.sealed()
+    assert len(segments) > 1
+    records = [r for path in segments for _, r in wal.read(path, 100)]
+    assert [p[0] for _, p in records] == list(range(20))
+
+
+def test_replay_resumes_from_saved_progress(tmp_path):
+    wal = SegmentWAL(str(tmp_path))
+    wal.open()
+    wal.append([["sensor_logs", [i]] for i in range(10)])
+    wal.seal()
+    (path,) = wal.sealed()
+    chunk = wal.read(path, 4)
+    wal.save_progress(path, chunk[-1][0])
+    assert [p[0] for _, (_, p) in wal.read(path, 100)] == list(range(4, 10))
+
+
+def test_torn_tail_ends_the_segment(tmp_path):
+    wal = SegmentWAL(str(tmp_path))
+    wal.open()
+    wal.append([["sensor_logs", [i]] for i in range(3)])
+    wal.seal()
+    (path,) = wal.sealed()
+    with open(path, "r+b") as f:
+        f.seek(-2, os.SEEK_END)
+        f.write(b"!!")
+    assert [p[0] for _, (_, p) in wal.read(path, 100)] == [0, 1]
+    assert wal.counters["corrupt_tails"] == 1
+
+
+def test_open_segment_recovered_after_crash(tmp_path):
+    wal = SegmentWAL(str(tmp_path))
+    wal.open()
+    wal.append([["sensor_logs", [1]]])
+    wal.sync()
+    restarted = SegmentWAL(str(tmp_path))     # The old process never sealed
+    restarted.open()
+    (path,) = restarted.sealed()
+    assert [p for _, (_, p) in restarted.read(path, 10)] == [[1]]
+
+
+def test_outage_spills_then_replays_everything_once(tmp_path):
+    db = FakeDB()
+    q, wal = queue(tmp_path, db)
+
+    async def scenario():
+        db.down = True
+        for i in range(10):
+            q.enqueue("sensor_logs", (i,))
+        assert not await q.flush()
+        assert not q.db_ok and q.counters["spilled"] == 4
+        q._spill(list(q._queue))
+        q._queue.clear()
+        assert not await q._replay_wal()
+        db.down = False
+        assert await q._replay_wal()
+    asyncio.run(scenario())
+    assert sorted(db.rows) == list(range(10))
+    assert not wal.has_backlog
+
+
+def test_rejected_rows_are_dead_lettered_not_retried(tmp_path):
+    db = FakeDB()
+    db.bad = {3, 6}
+    q, wal = queue(tmp_path, db)
+    for i in range(8):
+        q.enqueue("sensor_logs", (i,))
+    assert asyncio.run(q.flush())
+    assert q.db_ok and sorted(db.rows) == [0, 1, 2, 4, 5, 7]
+    with open(os.path.join(wal.directory, DEAD_LETTER)) as f:
+        dead = [json.loads(line) for line in f]
+    assert [d["params"] for d in dead] == [[3], [6]]
+    assert dead[0]["error"] == "constraint violated"
+    assert q.counters["dead_lettered"] == 2
+
+
+def test_poison_row_in_the_log_does_not_block_replay(tmp_path):
+    db = FakeDB()
+    q, wal = queue(tmp_path, db)
+    wal.append([["sensor_logs", [i]] for i in range(6)])
+    db.bad = {2}
+    assert asyncio.run(q._replay_wal())
+    assert sorted(db.rows) == [0, 1, 3, 4, 5] and not wal.has_backlog
+
+
+def test_rollover_uses_the_prepared_spare(tmp_path):
+    wal = SegmentWAL(str(tmp_path), segment_bytes=256)
+    wal.open()
+    record = ["sensor_logs", ["x" * 40]]
+    wal.append([record] * 5)            # Three per segment: the spare from open(), then one inline
+    assert wal.counters["inline_rollovers"] == 1 and wal.needs_maintenance
+    wal.maintain()                      # What the flusher runs via asyncio.to_thread
+    assert not wal.needs_maintenance
+    assert len(wal.sealed()) == 1 and os.path.exists(wal.sealed()[0])
+    wal.append([record] * 4)
+    assert wal.counters["inline_rollovers"] == 1
+    assert wal.stats()["sealed_segments"] == 1 and wal.needs_maintenance   # Rolled onto the spare
+
+
+def test_empty_spare_is_discarded_on_restart(tmp_path):
+    wal = SegmentWAL(str(tmp_path))
+    wal.open()
+    restarted = SegmentWAL(str(tmp_path))
+    restarted.open()
+    assert restarted.sealed() == [] and not restarted.has_backlog
@@ -0,0 +1,41 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+import backend
+from state_store import MemoryStore
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(backend, "machines_cache", {**backend.machines_cache, "rows": None, "expires": 0})
+    monkeypatch.setattr(backend, "state", MemoryStore())
+    return TestClient(backend.create_app())
+
+
+def test_one_response_for_the_whole_ward(client, monkeypatch):
+    calls = []
+
+    async def query_history(sql, params):
+        calls.append(sql)
+        return ["machine_id", "location", "is_active"], [("W1", "Bed 1", 1), ("W2", "Bed 2", 0)]
+    monkeypatch.setattr(backend, "query_history", query_history)
+    backend.state.set_status("W1", {"ph": 7.2})
+    backend.state.set_motor("W1", 30)
+
+    ward = client.get("/machines/status").json()
+    assert [m["machine_id"] for m in ward] == ["W1", "W2"]
+    assert ward[0] == {"machine_id": "W1", "location": "Bed 1", "is_active": True,
+                       "status": {"ph": 7.2}, "motor_speed": 30, "alarms": []}
+    assert [m["machine_id"] for m in client.get("/machines/status", params={"ids": "W2"}).json()] == ["W2"]
+    assert len(calls) == 1      # Catalog cached between the two requests
+
+
+def test_db_down_falls_back_to_live_machines(client, monkeypatch):
+    async def query_history(sql, params):
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    monkeypatch.setattr(backend, "query_history", query_history)
+    backend.state.set_status("L1", {"ph": 7.0})
+
+    ward = client.get("/machines/status").json()
+    assert [(m["machine_id"], m["location"], m["status"]) for m in ward] == [("L1", None, {"ph": 7.0})]
+    assert client.get("/machines").status_code == 503
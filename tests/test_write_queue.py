@@ -0,0 +1,71 @@
+import asyncio
+import pytest
+from write_queue import IngestIds, WriteBehindQueue
+
+
+class FakeDB:
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+
+    async def write(self, items):
+        if self.fail:
+            raise ConnectionError("db down")
+        self.batches.append(list(items))
+
+
+def test_flush_writes_in_batches():
+    db = FakeDB()
+    q = WriteBehindQueue(db.write, batch_size=3)
+    for i in range(7):
+        q.enqueue("sensor_logs", (i,))
+    assert asyncio.run(q.flush())
+    assert [len(b) for b in db.batches] == [3, 3, 1]
+    assert [p for b in db.batches for _, p in b] == [(i,) for i in range(7)]
+    assert q.counters["written"] == 7 and q.depth == 0
+
+
+def test_drop_oldest_keeps_newest_rows():
+    q = WriteBehindQueue(FakeDB().write, max_size=3)
+    for i in range(5):
+        q.enqueue("sensor_logs", (i,))
+    assert [p for _, p, _ in q._queue] == [(2,), (3,), (4,)]
+    assert q.counters["dropped"] == 2
+
+
+def test_drop_newest_refuses_rows():
+    q = WriteBehindQueue(FakeDB().write, max_size=2, overflow="drop_newest")
+    assert q.enqueue("sensor_logs", (0,)) and q.enqueue("sensor_logs", (1,))
+    assert not q.enqueue("sensor_logs", (2,))
+    assert [p for _, p, _ in q._queue] == [(0,), (1,)]
+
+
+def test_failed_batch_goes_back_in_front():
+    db = FakeDB()
+    q = WriteBehindQueue(db.write, batch_size=2)
+    for i in range(3):
+        q.enqueue("sensor_logs", (i,))
+    db.fail = True
+    assert not asyncio.run(q.flush())
+    assert [p for _, p, _ in q._queue] == [(0,), (1,), (2,)]
+    db.fail = False
+    assert asyncio.run(q.flush())
+    assert [p for b in db.batches for _, p in b] == [(0,), (1,), (2,)]
+
+
+def test_unknown_policy_and_spill_without_wal_rejected():
+    with pytest.raises(ValueError):
+        WriteBehindQueue(FakeDB().write, overflow="block")
+    with pytest.raises(ValueError):
+        WriteBehindQueue(FakeDB().write, overflow="spill")
+
+
+def test_ingest_ids_take_leased_worker_unless_fixed(monkeypatch):
+    monkeypatch.delenv("WORKER_ID", raising=False)
+    ids = IngestIds()
+    ids.assign(1025)
+    assert ids.worker == 1 and (ids.next() >> 12) & 0x3FF == 1
+    monkeypatch.setenv("WORKER_ID", "7")
+    fixed = IngestIds()
+    fixed.assign(3)
+    assert fixed.worker == 7
@@ -0,0 +1,253 @@
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+# --- WRITE-AHEAD LOG (mmap segments) ---
+# Where rows go when the DB is slow or down. Appends are a memcpy into a
+# preallocated, memory-mapped segment file (no syscall per row), so ingest
+# latency doesn't move during a DB incident. Records:
+#
+#   <u32 length><u32 crc32><json [kind, params]>
+#
+# A zero length ends a segment; a bad CRC (torn write after power loss) ends
+# it too. The segment being written is NNNNNNNNNNNN.open; full or handed to
+# the replayer it becomes .seg. Replay progress sits in a .pos sidecar so a
+# restart mid-replay resumes instead of starting the segment over.
+# Rows the DB rejected for their content go to dead_letter.jsonl next to the
+# segments (one JSON object per row with the error), never replayed.
+# Nothing touches the disk until open() (called at startup, not import).
+#
+# The event loop never does file I/O here: it appends into the mapped
+# segment and, when one is full, swaps in a spare segment that maintain()
+# (a worker thread) created ahead of time. maintain() also msyncs, trims and
+# renames the segments the loop let go of. The sealed-segment index lives in
+# memory, so has_backlog / sealed() / stats() don't list the directory.
+
+_RECORD = struct.Struct("<II")
+DEAD_LETTER = "dead_letter.jsonl"
+
+
+class _Segment:
+    __slots__ = ("path", "file", "map", "pos")
+
+    def __init__(self, path, size):
+        self.path = path
+        self.file = open(path, "w+b")
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.pos = 0
+
+
+class SegmentWAL:
+    def __init__(self, directory="wal", segment_bytes=16 << 20):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self._lock = threading.RLock()      # Segment files: held by worker threads only
+        self._index_lock = threading.Lock() # _sealed: never held across I/O
+        self._current = None                # _Segment being appended to
+        self._spare = None                  # Next _Segment, created by maintain()
+        self._released = []                 # Full / handed-off segments still to seal
+        self._sealed = {}                   # .seg path -> bytes
+        self._seq = 0
+        self._dirty = False
+        self.counters = {"appended": 0, "segments": 0, "corrupt_tails": 0, "dead_lettered": 0,
+                         "inline_rollovers": 0}
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for path in glob.glob(os.path.join(self.directory, "*.open")):
+            with open(path, "rb") as f:
+                empty = f.read(4) in (b"", b"\0\0\0\0")
+            if empty:
+                os.remove(path)     # A spare that never got a record
+            else:
+                # Whatever was open when the last process died is complete up to its zero tail
+                os.replace(path, path[:-5] + ".seg")
+        paths = glob.glob(os.path.join(self.directory, "*.seg"))
+        with self._index_lock:
+            self._sealed = {p: os.path.getsize(p) for p in paths}
+        self._seq = max((int(os.path.basename(p).split(".")[0]) for p in paths), default=0)
+        self._spare = self._new_segment()
+
+    # --- WRITER (event loop, no I/O) ---
+    def append(self, records):
+        for record in records:
+            data = json.dumps(record, default=str).encode()
+            size = _RECORD.size + len(data)
+            if size + _RECORD.size > self.segment_bytes:
+                raise ValueError(f"WAL record of {size} bytes exceeds the segment size")
+            segment = self._current
+            if segment is None or segment.pos + size + _RECORD.size > self.segment_bytes:
+                segment = self._roll()
+            pos = segment.pos
+            segment.map[pos + _RECORD.size:pos + size] = data
+            segment.map[pos:pos + _RECORD.size] = _RECORD.pack(len(data), zlib.crc32(data))
+            segment.pos = pos + size
+            self._dirty = True
+            self.counters["appended"] += 1
+
+    def _roll(self):
+        self.release()
+        segment, self._spare = self._spare, None
+        if segment is None:
+            # maintain() hasn't caught up (burst right after a rollover): open inline
+            self.counters["inline_rollovers"] += 1
+            segment = self._new_segment()
+        self._current = segment
+        self.counters["segments"] += 1
+        return segment
+
+    def release(self):
+        """Hands the open segment (if it holds anything) over to be sealed by maintain()."""
+        segment = self._current
+        if segment is None or not segment.pos:
+            return
+        self._current = None
+        self._released.append(segment)
+
+    def _new_segment(self):
+        with self._index_lock:      # Inline rollover (loop) vs maintain() (thread)
+            self._seq += 1
+            seq = self._seq
+        return _Segment(os.path.join(self.directory, f"{seq:012d}.open"), self.segment_bytes)
+
+    # --- MAINTENANCE (worker thread: asyncio.to_thread) ---
+    @property
+    def needs_maintenance(self):
+        return self._spare is None or bool(self._released)
+
+    def maintain(self):
+        """Seals released segments, prepares a spare, msyncs the open segment."""
+        with self._lock:
+            while self._released:
+                self._seal(self._released[0])
+                self._released.pop(0)
+            if self._spare is None:
+                self._spare = self._new_segment()
+            self.sync()
+
+    def _seal(self, segment):
+        with self._lock:
+            segment.map.flush()
+            segment.map.close()
+            segment.file.truncate(segment.pos)  # Drop the unused preallocated tail
+            segment.file.close()
+        path = segment.path[:-5] + ".seg"
+        os.replace(segment.path, path)
+        with self._index_lock:
+            self._sealed[path] = segment.pos
+
+    def seal(self):
+        """release() and seal right away; blocking (startup, shutdown)."""
+        self.release()
+        with self._lock:
+            while self._released:
+                self._seal(self._released[0])
+                self._released.pop(0)
+
+    def sync(self):
+        """msync the open segment; blocking, so call it via asyncio.to_thread."""
+        with self._lock:
+            segment = self._current
+            if segment is not None and self._dirty:
+                self._dirty = False
+                segment.map.flush()
+
+    def close(self):
+        self.seal()
+        for segment in (self._current, self._spare):
+            if segment is not None:     # Opened but empty
+                segment.map.close()
+                segment.file.close()
+                os.remove(segment.path)
+        self._current = self._spare = None
+
+    # --- READER (replayer, worker thread) ---
+    def sealed(self):
+        with self._index_lock:
+            return sorted(self._sealed)
+
+    def read(self, path, max_records):
+        """Up to max_records after the saved replay position: [(end_offset, [kind, params])]."""
+        offset = self._load_progress(path)
+        records = []
+        with open(path, "rb") as f:
+            f.seek(offset)
+            while len(records) < max_records:
+                header = f.read(_RECORD.size)
+                if len(header) < _RECORD.size:
+                    break
+                length, crc = _RECORD.unpack(header)
+                if not length:
+                    break
+                data = f.read(length)
+                if len(data) < length or zlib.crc32(data) != crc:
+                    self.counters["corrupt_tails"] += 1
+                    break
+                offset += _RECORD.size + length
+                records.append((offset, json.loads(data)))
+        return records
+
+    def save_progress(self, path, offset):
+        tmp = path + ".pos.tmp"
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+        os.replace(tmp, path + ".pos")
+
+    def _load_progress(self, path):
+        try:
+            with open(path + ".pos") as f:
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def remove(self, path):
+        os.remove(path)
+        if os.path.exists(path + ".pos"):
+            os.remove(path + ".pos")
+        with self._index_lock:
+            self._sealed.pop(path, None)
+
+    # --- DEAD LETTERS ---
+    def dead_letter(self, records, error):
+        """Appends [kind, params] rows the DB will never take; blocking (asyncio.to_thread)."""
+        os.makedirs(self.directory, exist_ok=True)
+        at = time.time()
+        with open(os.path.join(self.directory, DEAD_LETTER), "a") as f:
+            for kind, params in records:
+                f.write(json.dumps({"kind": kind, "params": params, "error": error, "at": at},
+                                   default=str) + "\n")
+        self.counters["dead_lettered"] += len(records)
+
+    def import_jsonl(self, path, upgrade=None):
+        """Moves a legacy sensor_spill.jsonl into the log; upgrade(record) adapts old rows."""
+        if not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        if upgrade:
+            records = [upgrade(r) for r in records]
+        self.append(records)
+        self.seal()
+        os.remove(path)
+        return len(records)
+
+    # --- STATS ---
+    @property
+    def has_backlog(self):
+        return bool(self._current and self._current.pos) or bool(self._released) or bool(self._sealed)
+
+    def stats(self):
+        with self._index_lock:
+            sealed = list(self._sealed.values())
+        return {
+            **self.counters,
+            "sealed_segments": len(sealed),
+            "backlog_bytes": sum(sealed) + sum(s.pos for s in self._released) +
+                             (self._current.pos if self._current else 0),
+        }
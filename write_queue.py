@@ -0,0 +1,316 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from logs import get_logger
+
+log = get_logger("write_queue")
+
+# --- WRITE-BEHIND QUEUE ---
+# WebSocket handlers call enqueue() (never awaits the DB). A single flusher
+# task drains the queue in batches and hands each batch to an async writer
+# that does one executemany + commit per statement kind.
+#
+# With overflow="spill" and a write-ahead log, a failed write sends the batch
+# to the log and flips the queue into "DB down" mode: every flush goes
+# straight to the log until the replayer (exponential backoff) gets a batch
+# committed again. Rows carry ingest_ids, so a replayed row that had in fact
+# been committed is ignored by the DB.
+#
+# Only transient failures (connection lost, pool timeout) mean "DB down". A
+# batch rejected for its content (one of the `permanent` exception types,
+# e.g. a constraint or data error) is bisected down to the offending rows;
+# the rest is written and those rows go to the dead-letter log instead of
+# being retried forever.
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "spill")
+
+
+class IngestIds:
+    """Snowflake-style 63-bit ids: 41 bits ms | 10 bits worker | 12 bits sequence.
+
+    Unique across workers and restarts without coordination as long as no two
+    live workers share the worker bits: WORKER_ID if set, else a worker id
+    leased from the shared state store at startup (assign()), else the pid
+    (a single process, or workers on one host).
+    """
+
+    def __init__(self, worker=None):
+        if worker is None:
+            worker = os.getenv("WORKER_ID")
+        self.fixed = worker is not None
+        self.worker = (int(worker) if self.fixed else os.getpid()) & 0x3FF
+        self._last_ms = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def assign(self, worker):
+        """Worker bits from a lease; an explicit WORKER_ID / worker= wins."""
+        if not self.fixed:
+            self.worker = worker & 0x3FF
+
+    def next(self):
+        with self._lock:
+            ms = max(int(time.time() * 1000), self._last_ms)
+            if ms == self._last_ms:
+                self._seq = (self._seq + 1) & 0xFFF
+                if not self._seq:
+                    ms += 1     # 4096 ids in one ms: borrow the next one
+            else:
+                self._seq = 0
+            self._last_ms = ms
+            return (ms << 22) | (self.worker << 12) | self._seq
+
+
+class WriteBehindQueue:
+    def __init__(self, write_batch, max_size=10000, batch_size=500,
+                 flush_interval=1.0, overflow="drop_oldest", wal=None,
+                 retry_delay=2.0, max_retry_delay=60.0, wal_sync_interval=1.0, permanent=()):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        if overflow == "spill" and wal is None:
+            raise ValueError("overflow='spill' needs a write-ahead log")
+        self.write_batch = write_batch      # async fn(list of (kind, params))
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.wal = wal                      # SegmentWAL or None
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.wal_sync_interval = wal_sync_interval
+        self.permanent = tuple(permanent)   # Exception types retrying won't fix
+
+        self._queue = deque()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._replay_task = None
+        self._closing = False
+        self.db_ok = True
+        self.counters = {
+            "enqueued": 0,
+            "written": 0,
+            "dropped": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "batches": 0,
+            "write_errors": 0,
+            "dead_lettered": 0,
+            "max_depth": 0,
+        }
+        self.last_flush_ms = 0.0
+        self.lags_ms = deque(maxlen=2048)   # enqueue -> commit, recent rows
+
+    # --- PRODUCER SIDE (called from the event loop, never blocks) ---
+    def enqueue(self, kind, params):
+        """Queues one row. Returns False if the row did not make it into memory."""
+        if len(self._queue) >= self.max_size:
+            if self.overflow == "drop_newest":
+                self.counters["dropped"] += 1
+                return False
+            if self.overflow == "spill":
+                self._spill([(kind, params, None)])
+                return False
+            self._queue.popleft()
+            self.counters["dropped"] += 1
+
+        self._queue.append((kind, params, time.monotonic()))
+        self.counters["enqueued"] += 1
+        depth = len(self._queue)
+        if depth > self.counters["max_depth"]:
+            self.counters["max_depth"] = depth
+        if depth >= self.batch_size:
+            self._wakeup.set()  # Size trigger
+        return True
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    @property
+    def saturated(self):
+        """Backpressure signal: queue is at least 80% full."""
+        return len(self._queue) >= self.max_size * 0.8
+
+    def stats(self):
+        lags = sorted(self.lags_ms)
+        return {
+            **self.counters,
+            "depth": len(self._queue),
+            "max_size": self.max_size,
+            "fill_ratio": round(len(self._queue) / self.max_size, 3),
+            "saturated": self.saturated,
+            "overflow_policy": self.overflow,
+            "db_ok": self.db_ok,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "persist_lag_ms_p50": round(lags[len(lags) // 2], 1) if lags else None,
+            "persist_lag_ms_p99": round(lags[int(len(lags) * 0.99)], 1) if lags else None,
+            "wal": self.wal.stats() if self.wal else None,
+        }
+
+    # --- CONSUMER SIDE ---
+    def start(self):
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+        if self.wal:
+            self._replay_task = asyncio.create_task(self._replay_loop())
+
+    async def stop(self):
+        """Stops the flusher and writes whatever is left."""
+        self._closing = True
+        self._wakeup.set()
+        if self._replay_task:
+            self._replay_task.cancel()
+            self._replay_task = None
+        if self._task:
+            await self._task
+            self._task = None
+        if self.db_ok:
+            await self.flush()
+        if self._queue:
+            if self.wal:
+                # DB still unreachable at shutdown: keep the rows on disk
+                self._spill(list(self._queue))
+            else:
+                self.counters["dropped"] += len(self._queue)
+                log.error("⚠️ Rows dropped at shutdown (no write-ahead log)",
+                          extra={"rows": len(self._queue)})
+            self._queue.clear()
+        if self.wal:
+            await asyncio.to_thread(self.wal.close)
+
+    async def _run(self):
+        last_sync = time.monotonic()
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass  # Time trigger
+            self._wakeup.clear()
+
+            if self.db_ok or self.overflow != "spill":
+                ok = await self.flush()
+                if not ok and self.overflow != "spill" and not self._closing:
+                    await asyncio.sleep(self.retry_delay)
+            else:
+                # DB down: straight to the log, the replayer brings it back
+                self._spill(list(self._queue))
+                self._queue.clear()
+
+            # Segment files are only ever touched off the loop (seal, spare, msync)
+            if self.wal and (self.wal.needs_maintenance
+                             or time.monotonic() - last_sync >= self.wal_sync_interval):
+                await asyncio.to_thread(self.wal.maintain)
+                last_sync = time.monotonic()
+
+    async def flush(self):
+        """Drains the queue in batches. Returns False if a write failed."""
+        while self._queue:
+            batch = [self._queue.popleft()
+                     for _ in range(min(self.batch_size, len(self._queue)))]
+            if not await self._write(batch):
+                if self.overflow == "spill":
+                    self._spill(batch)
+                    self.db_ok = False
+                    return False
+                # Put the batch back in front, oldest rows lose if we overflow
+                room = self.max_size - len(self._queue)
+                if room < len(batch):
+                    lost = batch[:len(batch) - room]
+                    batch = batch[len(batch) - room:]
+                    self.counters["dropped"] += len(lost)
+                self._queue.extendleft(reversed(batch))
+                return False
+        return True
+
+    async def _write(self, batch):
+        """False only on a transient failure (the batch should be retried)."""
+        start = time.perf_counter()
+        try:
+            await self.write_batch([(kind, params) for kind, params, _ in batch])
+        except self.permanent as e:
+            self.counters["write_errors"] += 1
+            log.error("❌ Batch rejected by the DB, isolating bad rows",
+                      extra={"rows": len(batch), "error": str(e)})
+            return await self._isolate(batch, e)
+        except Exception as e:
+            self.counters["write_errors"] += 1
+            log.warning("⚠️ Batch write error", extra={"rows": len(batch), "error": str(e)})
+            return False
+        self._written(batch, start)
+        return True
+
+    async def _isolate(self, batch, error):
+        """Bisects a rejected batch: good halves are written, single bad rows dead-lettered."""
+        if len(batch) == 1:
+            await self._dead_letter(batch, error)
+            return True
+        mid = len(batch) // 2
+        for half in (batch[:mid], batch[mid:]):
+            start = time.perf_counter()
+            try:
+                await self.write_batch([(kind, params) for kind, params, _ in half])
+            except self.permanent as e:
+                if not await self._isolate(half, e):
+                    return False
+            except Exception:
+                # DB went away half-way: the caller retries the whole batch,
+                # ingest_id / write_id keys absorb what did commit
+                return False
+            else:
+                self._written(half, start)
+        return True
+
+    async def _dead_letter(self, items, error):
+        self.counters["dead_lettered"] += len(items)
+        records = [(kind, params) for kind, params, _ in items]
+        if self.wal is None:
+            log.error("❌ Row dropped: rejected by the DB (no write-ahead log for dead letters)",
+                      extra={"kind": records[0][0], "error": str(error)})
+            return
+        await asyncio.to_thread(self.wal.dead_letter, records, str(error))
+        log.error("❌ Row moved to the dead-letter log",
+                  extra={"kind": records[0][0], "error": str(error)})
+
+    def _written(self, batch, start):
+        self.last_flush_ms = (time.perf_counter() - start) * 1000
+        now = time.monotonic()
+        self.lags_ms.extend((now - t) * 1000 for _, _, t in batch if t is not None)
+        self.counters["written"] += len(batch)
+        self.counters["batches"] += 1
+
+    # --- WRITE-AHEAD LOG ---
+    def _spill(self, items):
+        self.wal.append([(kind, params) for kind, params, _ in items])
+        self.counters["spilled"] += len(items)
+
+    async def _replay_loop(self):
+        delay = self.retry_delay
+        while True:
+            if not self.wal.has_backlog:
+                await asyncio.sleep(self.flush_interval)
+                continue
+            if await self._replay_wal():
+                self.db_ok = True
+                delay = self.retry_delay
+            else:
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, self.max_retry_delay)
+
+    async def _replay_wal(self):
+        """Bulk-loads sealed segments, oldest first. Returns False if the DB refused."""
+        self.wal.release()  # The open segment too, sealed off the loop below
+        await asyncio.to_thread(self.wal.maintain)
+        for path in self.wal.sealed():
+            while True:
+                chunk = await asyncio.to_thread(self.wal.read, path, self.batch_size * 4)
+                if not chunk:
+                    break
+                if not await self._write([(kind, params, None) for _, (kind, params) in chunk]):
+                    return False
+                self.counters["replayed"] += len(chunk)
+                await asyncio.to_thread(self.wal.save_progress, path, chunk[-1][0])
+            await asyncio.to_thread(self.wal.remove, path)
+        return True